@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
+
+import tracing
+from geneset import format_genes
+
+# Configuration through environment variables:
+#   GENEAGENT_TOOL_CACHE          path of the SQLite file, or "off" to disable the cache
+#   GENEAGENT_TOOL_CACHE_TTL      seconds before an entry expires (default 30 days, 0 = never)
+#   GENEAGENT_TOOL_CACHE_MAX_MB   size bound of the cached values, least recently used entries are evicted first
+#   GENEAGENT_TOOL_CACHE_MEMORY   number of recently used entries also kept in memory (default 4096)
+DEFAULT_PATH = "Outputs/cache/tools.sqlite"
+DEFAULT_TTL = 30 * 24 * 3600
+DEFAULT_MAX_MB = 512
+DEFAULT_MEMORY_ENTRIES = 4096
+# Access times of memory hits are written to SQLite in batches of this size, and before every eviction.
+TOUCH_BATCH = 256
+
+# Tool responses starting with one of these prefixes are failures and never cached.
+ERROR_PREFIXES = ("Error",)
+
+
+class NotCached(str):
+    """A tool response that is returned to the caller but not cached, e.g. one with a lookup that found nothing."""
+
+
+def cacheable(value) -> bool:
+    """Failures and empty results are not cached, so that a transient miss is retried on the next call."""
+    if value is None or isinstance(value, NotCached) or (isinstance(value, (str, list, dict)) and not value):
+        return False
+    return not (isinstance(value, str) and value.startswith(ERROR_PREFIXES))
+
+
+def normalize_argument(name, value):
+    if not isinstance(value, str):
+        return value
+    value = value.strip()
+    if name == "gene_set":
+        return format_genes(value, sort=True)
+    return value
+
+
+def make_key(tool: str, kwargs: dict) -> str:
+    normalized = {name: normalize_argument(name, value) for name, value in kwargs.items()}
+    return json.dumps([tool, normalized], sort_keys=True)
+
+
+class ToolCache:
+    """
+    Persistent cache of tool responses keyed on the tool name and its normalized arguments.
+    Entries expire after `ttl` seconds and the least recently used entries are evicted
+    once the cached values exceed `max_bytes`. The `memory_entries` most recently used
+    entries are also kept in memory in front of the SQLite file.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024,
+                 memory_entries: int = DEFAULT_MEMORY_ENTRIES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()
+        # key -> time of the memory hits not yet written to the accessed column
+        self.touched = {}
+        self.hits = {}
+        self.misses = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, tool TEXT, value TEXT, size INTEGER, created REAL, accessed REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv("GENEAGENT_TOOL_CACHE", DEFAULT_PATH)
+        if path.lower() in ("", "0", "off", "none"):
+            return None
+        ttl = float(os.getenv("GENEAGENT_TOOL_CACHE_TTL", DEFAULT_TTL))
+        max_mb = float(os.getenv("GENEAGENT_TOOL_CACHE_MAX_MB", DEFAULT_MAX_MB))
+        memory_entries = int(os.getenv("GENEAGENT_TOOL_CACHE_MEMORY", DEFAULT_MEMORY_ENTRIES))
+        return cls(path, ttl=ttl, max_bytes=int(max_mb * 1024 * 1024), memory_entries=memory_entries)
+
+    def _remember(self, key, created, value):
+        self.memory[key] = (created, value)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, tool: str, kwargs: dict):
+        """Return (found, value) for a tool call."""
+        key = make_key(tool, kwargs)
+        now = time.time()
+        with self.lock:
+            if key in self.memory:
+                created, value = self.memory[key]
+                if not self.ttl or now - created <= self.ttl:
+                    self.memory.move_to_end(key)
+                    self.hits[tool] = self.hits.get(tool, 0) + 1
+                    self.touched[key] = now
+                    if len(self.touched) >= TOUCH_BATCH:
+                        with self.conn:
+                            self._write_touched()
+                    return True, json.loads(value)
+                del self.memory[key]
+        with self.lock, self.conn:
+            row = self.conn.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses[tool] = self.misses.get(tool, 0) + 1
+                return False, None
+            self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self.hits[tool] = self.hits.get(tool, 0) + 1
+            self._remember(key, row[1], row[0])
+        return True, json.loads(row[0])
+
+    def set(self, tool: str, kwargs: dict, value):
+        key = make_key(tool, kwargs)
+        data = json.dumps(value)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO cache (key, tool, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tool, data, len(data), now, now),
+            )
+            self._remember(key, now, data)
+            self._evict()
+
+    def _write_touched(self):
+        """Write the access times of the memory hits, so that eviction sees them as recently used."""
+        if self.touched:
+            self.conn.executemany("UPDATE cache SET accessed = ? WHERE key = ?", [(now, key) for key, now in self.touched.items()])
+            self.touched.clear()
+
+    def _evict(self):
+        self._write_touched()
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        while total > self.max_bytes:
+            rows = self.conn.execute("SELECT key, size FROM cache ORDER BY accessed LIMIT 100").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.memory.pop(key, None)
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+    def stats(self) -> dict:
+        tools = sorted(set(self.hits) | set(self.misses))
+        return {tool: {"hits": self.hits.get(tool, 0), "misses": self.misses.get(tool, 0)} for tool in tools}
+
+
+_tool_cache = None
+_tool_cache_lock = threading.Lock()
+
+
+def get_tool_cache():
+    """Shared ToolCache configured from the environment, or None when caching is disabled."""
+    global _tool_cache
+    with _tool_cache_lock:
+        if _tool_cache is None:
+            _tool_cache = ToolCache.from_env() or False
+    return _tool_cache or None
+
+
+# Calls currently running, so that a second identical call (e.g. a prefetch and the
+# agent asking for the same data) waits for the first one instead of repeating it.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def cached_tool(tool: str, function):
+    """Wrap a tool function so that its responses are served from and stored in the shared cache."""
+
+    @functools.wraps(function)
+    def wrapper(**kwargs):
+        cache = get_tool_cache()
+        if cache is None:
+            return function(**kwargs)
+        key = make_key(tool, kwargs)
+        while True:
+            found, value = cache.get(tool, kwargs)
+            if found:
+                tracing.annotate(cache_hit=True)
+                return value
+            with _inflight_lock:
+                event = _inflight.get(key)
+                if event is None:
+                    event = _inflight[key] = threading.Event()
+                    break
+            # another thread is running this call; look again once it has finished
+            event.wait()
+        tracing.annotate(cache_hit=False)
+        try:
+            value = function(**kwargs)
+            if cacheable(value):
+                cache.set(tool, kwargs, value)
+            return value
+        finally:
+            with _inflight_lock:
+                del _inflight[key]
+            event.set()
+
+    return wrapper
@@ -1,16 +1,17 @@
-import requests
+from apis import http_client
 import json
+from geneset import format_genes
 
 def get_complex_for_gene_set(gene_set):
-    gene_set = gene_set.replace(" ","")
+    gene_set = format_genes(gene_set)
     
-    url = "https://www.ncbi.nlm.nih.gov/research/pubtator3-api/agentapi/complex/?"
+    url = f"{http_client.PUBTATOR_URL}/pubtator3-api/agentapi/complex/?"
     params = {
         "name": gene_set,
         "retmode": "json",
         "limit": 10
         }
-    response = requests.get(url, params=params)
+    response = http_client.get(url, params=params)
 
     if response.status_code == 200:
         return json.dumps(response.json().get("results",{}))
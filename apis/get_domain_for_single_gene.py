@@ -1,14 +1,14 @@
-import requests
+from apis import http_client
 import json
 
 def get_domain_for_single_gene(gene_name):
-    url = "https://www.ncbi.nlm.nih.gov/research/pubtator-api/agentapi/cdd/?"
+    url = f"{http_client.PUBTATOR_URL}/pubtator-api/agentapi/cdd/?"
     params = {
         "name": gene_name,
         "retmode": "json",
         "limit": 10
         }
-    response = requests.get(url, params=params)
+    response = http_client.get(url, params=params)
 
     if response.status_code == 200:
         return json.dumps(response.json().get("results",{}))
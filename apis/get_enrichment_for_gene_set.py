@@ -1,12 +1,12 @@
 import json
-import requests
+from apis import http_client
+from geneset import parse_genes
 
 def get_enrichment_for_gene_set(gene_set):
     
-    gene_set = gene_set.replace(" ","")
-    gene_list = gene_set.split(",")  
+    gene_list = parse_genes(gene_set)
       
-    url = "https://biit.cs.ut.ee/gprofiler/api/gost/profile/"
+    url = f"{http_client.GPROFILER_URL}/api/gost/profile/"
     headers = {'Content-Type': 'application/json'}
     payload = {
         "organism": "hsapiens",
@@ -16,7 +16,7 @@ def get_enrichment_for_gene_set(gene_set):
         "user_threshold": 0.05
     }
 
-    response = requests.post(url, headers=headers, data=json.dumps(payload))
+    response = http_client.post(url, headers=headers, data=json.dumps(payload))
     if response.status_code == 200:
         return json.dumps(response.json()["result"][:5])
     else:
@@ -0,0 +1,93 @@
+import json
+from apis import http_client
+from apis.cache import NotCached
+from apis.get_gene_summary_for_single_gene import get_gene_summary_for_single_gene
+from geneset import parse_genes
+
+# Number of gene symbols resolved per esearch request.
+BATCH_SIZE = 200
+
+def get_gene_summaries(gene_list, specie):
+	"""
+	Resolve many gene symbols and fetch their summaries with one esearch and one esummary
+	request per batch, using the Entrez history server. Returns {gene: summary or None}.
+	Symbols that are not matched by their official symbol fall back to the single gene search.
+	"""
+	base_url_search = f"{http_client.EUTILS_URL}/esearch.fcgi"
+	base_url_summary = f"{http_client.EUTILS_URL}/esummary.fcgi"
+	summaries = {}
+	for start in range(0, len(gene_list), BATCH_SIZE):
+		batch = gene_list[start:start + BATCH_SIZE]
+		term = "(" + " OR ".join(f"{gene}[sym]" for gene in batch) + f") AND {specie}[orgn]"
+		search_params = {
+			"db": "gene",
+			"term": term,
+			"retmode": "json",
+			"retmax": len(batch) * 5,
+			"usehistory": "y",
+			"sort": "relevance"
+		}
+		search_result = http_client.post(base_url_search, data=search_params).json().get('esearchresult', {})
+		if not search_result.get('idlist'):
+			continue
+
+		summary_params = {
+			"db": "gene",
+			"query_key": search_result["querykey"],
+			"WebEnv": search_result["webenv"],
+			"retmode": "json",
+			"retmax": len(search_result['idlist'])
+		}
+		result = http_client.get(base_url_summary, params=summary_params).json().get('result', {})
+		# split the records back per gene, preferring live records over discontinued ones
+		wanted = {gene.upper(): gene for gene in batch}
+		for uid in result.get('uids', []):
+			record = result[uid]
+			gene = wanted.get(str(record.get('name', '')).upper())
+			if gene is None:
+				continue
+			current = summaries.get(gene)
+			if current is not None and (_is_live(current) or not _is_live(record)):
+				continue
+			record.pop('locationhist', None)
+			summaries[gene] = record
+
+	for gene in gene_list:
+		if gene not in summaries:
+			try:
+				summaries[gene] = get_gene_summary_for_single_gene(gene, specie)
+			except Exception:
+				summaries[gene] = None
+	return summaries
+
+def _is_live(record):
+	return str(record.get('status', '0')) == '0'
+
+def get_gene_summary_for_gene_set(gene_set, specie):
+	gene_list = parse_genes(gene_set)
+	summaries = get_gene_summaries(gene_list, specie)
+	# a gene without summary may be a transient miss of the fallback search, so such responses are not cached
+	if None in summaries.values():
+		return NotCached(json.dumps(summaries))
+	return json.dumps(summaries)
+
+
+get_gene_summary_for_gene_set_doc = {
+	"name": "get_gene_summary_for_gene_set",
+	"description": "Given a gene set, return summary information on function and so on for every gene of the set in one call.",
+	"parameters": {
+		"type": "object",
+		"properties": {
+			"gene_set": {
+				"type": "string",
+				"description": "A gene set only delimitted with \",\" to search, for example, \"x,y,z\".",
+			},
+   			"specie": {
+				"type": "string",
+				"description": "A specie name to search. Only have the human specie (Homo) and mouse specie (Mus) now.",
+				"enum": ["Homo","Mus"]
+			},
+		},
+		"required": ["gene_set","specie"],
+	},
+}
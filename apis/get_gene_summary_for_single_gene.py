@@ -1,10 +1,10 @@
 import json
-import requests
+from apis import http_client
 import time
 
 def get_gene_summary_for_single_gene(gene_name, specie):
-	base_url_search = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-	base_url_summary = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+	base_url_search = f"{http_client.EUTILS_URL}/esearch.fcgi"
+	base_url_summary = f"{http_client.EUTILS_URL}/esummary.fcgi"
 	term = gene_name + " AND " + specie
 	search_params = {
 		"db": "gene",
@@ -12,7 +12,7 @@ def get_gene_summary_for_single_gene(gene_name, specie):
 		"retmode": "json",
 		"sort": "relevance"
 	}
-	search_response = requests.get(base_url_search, params=search_params)
+	search_response = http_client.get(base_url_search, params=search_params)
 	gene_id = search_response.json().get('esearchresult', {}).get('idlist', [])
 
 	if gene_id:
@@ -23,7 +23,7 @@ def get_gene_summary_for_single_gene(gene_name, specie):
 			"retmode": "json",
    			"sort": "relevance"
 		}
-		summary_response = requests.get(base_url_summary, params=summary_params)
+		summary_response = http_client.get(base_url_summary, params=summary_params)
 		gene_summaries = summary_response.json().get('result', {})[gene_id[0]]
 		gene_summaries.pop('locationhist')
 		return gene_summaries
@@ -1,14 +1,14 @@
-import requests
+from apis import http_client
 import json
 
 def get_interactions_for_gene_set(gene_set):
-    url = "https://www.ncbi.nlm.nih.gov/research/pubtator-api/agentapi/ppi/?"
+    url = f"{http_client.PUBTATOR_URL}/pubtator-api/agentapi/ppi/?"
     params = {
         "name": gene_set,
         "retmode": "json",
         "limit": 50
         }
-    response = requests.get(url, params=params)
+    response = http_client.get(url, params=params)
 
     if response.status_code == 200:
         return json.dumps(response.json().get("results",{}))
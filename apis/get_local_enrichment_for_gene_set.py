@@ -0,0 +1,25 @@
+import json
+from enrichment import get_enrichment_engine
+from geneset import parse_genes
+
+def get_local_enrichment_for_gene_set(gene_set):
+    
+    gene_list = parse_genes(gene_set)
+
+    results = get_enrichment_engine().enrich(gene_list, threshold=0.05)
+    return json.dumps(results[:5])
+
+get_local_enrichment_for_gene_set_doc = {
+    "name": "get_local_enrichment_for_gene_set",
+    "description": "Given a gene set only separated by \",\", return its top-5 enrichment function names from the locally stored gene set libraries, tested with a hypergeometric test and FDR correction.",
+        "parameters": {
+        "type": "object",
+        "properties": {
+            "gene_set": {
+                "type": "string",
+                "description": "A gene set separated by only \",\" (must no whitespace) to search. For example: \"x,y,z\".",
+            },
+        },
+        "required": ["gene_set"],
+    },
+}
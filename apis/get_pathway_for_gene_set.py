@@ -1,46 +1,106 @@
+import os
+import math
 import json
-import requests
+import asyncio
+import threading
+from apis import http_client
+from enrichment import TermLibrary
+from geneset import parse_genes
+
+# Configuration through environment variables:
+#   GENEAGENT_PATHWAY_MODE      "online" (default) queries Enrichr, "offline" scores local GMT files
+#   GENEAGENT_ENRICHR_GMT_DIR   directory with the Enrichr library files, e.g. KEGG_2021_Human.gmt
+PATHWAY_MODE = os.getenv("GENEAGENT_PATHWAY_MODE", "online").lower()
+GMT_DIR = os.getenv("GENEAGENT_ENRICHR_GMT_DIR", "Datasets/Enrichr")
+
+ENRICHR_URL = http_client.ENRICHR_URL
+LIBRARIES = ["KEGG_2021_Human", "Reactome_2022", "BioPlanet_2019", "MSigDB_Hallmark_2020"]
 
 def get_pathway_for_gene_set(gene_set):
     """
     The returned values are Rank, Term name, P-value, Odds ratio, Combined score, Overlapping genes, Adjusted p-value, Old p-value, Old adjusted p-value
     """
-    gene_set = gene_set.replace(" ","")
-    gene_list = gene_set.split(",")
+    gene_list = parse_genes(gene_set)
 
-    ENRICHR_URL_ADD = 'http://maayanlab.cloud/Enrichr/addList'
-    payload = {
-        'list': (None, '\n'.join(gene_list)),
-        'description': (None, 'My gene set')
-    }
-    response_add = requests.post(ENRICHR_URL_ADD, files=payload)
+    if PATHWAY_MODE == "offline":
+        missing = [backgroundType for backgroundType in LIBRARIES if _local_library(backgroundType) is None]
+        if missing:
+            return f"Error: Enrichr library files missing in {GMT_DIR}: {', '.join(missing)}"
+        library_results = _score_local_libraries(gene_list)
+    else:
+        payload = {
+            'list': (None, '\n'.join(gene_list)),
+            'description': (None, 'My gene set')
+        }
+        response_add = http_client.post(f'{ENRICHR_URL}/addList', files=payload)
+        if response_add.status_code != 200:
+            return f"Error: Unable to add gene list to Enrichr (Status Code: {response_add.status_code})"
 
-    if not response_add.ok:
-        raise Exception('Error adding list to Enrichr:', response_add.text)
+        list_id = json.loads(response_add.text)['userListId']
+        library_results, failed = http_client.run(_fetch_libraries(list_id))
+        if failed:
+            # partial results would be cached like complete ones, so any failed library fails the call
+            return f"Error: Unable to fetch pathway results from Enrichr for {', '.join(failed)}"
 
-    data = json.loads(response_add.text)
-    list_id = data['userListId']
     dic = {}
-    for backgroundType in ["KEGG_2021_Human", "Reactome_2022", "BioPlanet_2019", "MSigDB_Hallmark_2020"]:
-        try:
-            ENRICHR_URL_RESULTS = f'http://maayanlab.cloud/Enrichr/enrich?userListId={list_id}&backgroundType={backgroundType}'
-            response_results = requests.get(ENRICHR_URL_RESULTS)
-            
-            if not response_results.ok:
-                raise Exception('Error fetching pathway results:', response_results.text)
-            
-            pathway_data = response_results.json()[backgroundType]
-            for value in pathway_data[:3]:
-                dic[value[1]] = [value[2],",".join(value[5]), backgroundType]
-        except TypeError:
-            continue
-    pathway_analysis = []    
+    for backgroundType, pathway_data in library_results:
+        for value in pathway_data[:3]:
+            dic[value[1]] = [value[2],",".join(value[5]), backgroundType]
+    pathway_analysis = []
     dic_sorted = dict(sorted(dic.items(), key=lambda item: item[1][0]))
     for key, value in dic_sorted.items():
         pathway_analysis.append({"term": key, "overlapping genes": value[1], "database": value[2]})
         # print(pathway_analysis)
     return json.dumps(pathway_analysis[:5])
 
+async def _fetch_library(list_id, backgroundType):
+    response_results = await http_client.aget(f'{ENRICHR_URL}/enrich', params={"userListId": list_id, "backgroundType": backgroundType})
+    if response_results.status_code != 200:
+        raise Exception('Error fetching pathway results:', response_results.text)
+    return response_results.json()[backgroundType]
+
+async def _fetch_libraries(list_id):
+    """Query all libraries concurrently; returns the results of the libraries that answered and the names of those that failed."""
+    results = await asyncio.gather(*(_fetch_library(list_id, backgroundType) for backgroundType in LIBRARIES), return_exceptions=True)
+    library_results = [(backgroundType, result) for backgroundType, result in zip(LIBRARIES, results) if isinstance(result, list)]
+    failed = [backgroundType for backgroundType, result in zip(LIBRARIES, results) if not isinstance(result, list)]
+    return library_results, failed
+
+_local_libraries = {}
+_local_libraries_lock = threading.Lock()
+
+def _local_library(backgroundType):
+    path = os.path.join(GMT_DIR, backgroundType + ".gmt")
+    with _local_libraries_lock:
+        if backgroundType not in _local_libraries:
+            _local_libraries[backgroundType] = TermLibrary.from_file(path) if os.path.exists(path) else None
+    return _local_libraries[backgroundType]
+
+def _score_local_libraries(gene_list):
+    """
+    Score the local GMT copies of the Enrichr libraries with the Fisher exact test and
+    return Enrichr-style rows: Rank, Term name, P-value, Odds ratio, Combined score, Overlapping genes, Adjusted p-value.
+    """
+    library_results = []
+    for backgroundType in LIBRARIES:
+        library = _local_library(backgroundType)
+        if library is None:
+            continue
+        rows = []
+        results = sorted(library.enrich(gene_list), key=lambda result: result["raw_p_value"])
+        for rank, result in enumerate(results, start=1):
+            overlap = result["intersection_size"]
+            # 2x2 table with a 0.5 correction to keep the odds ratio finite
+            a = overlap + 0.5
+            b = result["query_size"] - overlap + 0.5
+            c = result["term_size"] - overlap + 0.5
+            d = result["effective_domain_size"] - result["query_size"] - result["term_size"] + overlap + 0.5
+            odds_ratio = (a * d) / (b * c)
+            combined_score = -odds_ratio * math.log(max(result["raw_p_value"], 1e-300))
+            rows.append([rank, result["name"], result["raw_p_value"], odds_ratio, combined_score, result["intersections"], result["p_value"]])
+        library_results.append((backgroundType, rows))
+    return library_results
+
 get_pathway_for_gene_set_doc = {
     "name": "get_pathway_for_gene_set",
     "description": "Given a gene set, return its top-5 biological pathway names.",
@@ -55,5 +115,3 @@ get_pathway_for_gene_set_doc = {
         "required": ["gene_set"],
     },
 }
-
-
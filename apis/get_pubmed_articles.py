@@ -1,9 +1,9 @@
 import json
-import requests
+from apis import http_client
 from xml.etree import ElementTree
 
 def get_pubmed_articles(term):
-    base_url_pubmed = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils"
+    base_url_pubmed = http_client.EUTILS_URL
     search_url = f"{base_url_pubmed}/esearch.fcgi"
     fetch_url = f"{base_url_pubmed}/efetch.fcgi"
     search_params = {
@@ -13,7 +13,7 @@ def get_pubmed_articles(term):
         "retmax": "5",
         "sort": "relevance"
     }
-    search_response = requests.get(search_url, params=search_params)
+    search_response = http_client.get(search_url, params=search_params)
     try:
         search_results = ElementTree.fromstring(search_response.content)
         id_list = [id_tag.text for id_tag in search_results.findall('.//Id')]
@@ -28,7 +28,7 @@ def get_pubmed_articles(term):
         "id": ",".join(id_list),
         "retmode": "xml"
     }
-    fetch_response = requests.get(fetch_url, params=fetch_params)
+    fetch_response = http_client.get(fetch_url, params=fetch_params)
     
     try:
         articles = ElementTree.fromstring(fetch_response.content)
@@ -0,0 +1,143 @@
+import os
+import asyncio
+import threading
+
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import tracing
+
+# Configuration through environment variables:
+#   GENEAGENT_HTTP_POOL_HOSTS   number of per-host connection pools kept alive (default 10)
+#   GENEAGENT_HTTP_POOL_SIZE    keep-alive connections per host (default 16)
+#   GENEAGENT_HTTP_TIMEOUT      seconds before a request times out (default 60)
+#   GENEAGENT_HTTP_RETRIES      retries on connection errors and 429/5xx responses (default 2)
+# Base URLs of the domain databases, overridable for mirrors and the offline benchmark (bench/):
+#   GENEAGENT_PUBTATOR_URL, GENEAGENT_EUTILS_URL, GENEAGENT_GPROFILER_URL, GENEAGENT_ENRICHR_URL
+PUBTATOR_URL = os.getenv("GENEAGENT_PUBTATOR_URL", "https://www.ncbi.nlm.nih.gov/research").rstrip("/")
+EUTILS_URL = os.getenv("GENEAGENT_EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils").rstrip("/")
+GPROFILER_URL = os.getenv("GENEAGENT_GPROFILER_URL", "https://biit.cs.ut.ee/gprofiler").rstrip("/")
+ENRICHR_URL = os.getenv("GENEAGENT_ENRICHR_URL", "http://maayanlab.cloud/Enrichr").rstrip("/")
+
+POOL_HOSTS = int(os.getenv("GENEAGENT_HTTP_POOL_HOSTS", "10"))
+POOL_SIZE = int(os.getenv("GENEAGENT_HTTP_POOL_SIZE", "16"))
+TIMEOUT = float(os.getenv("GENEAGENT_HTTP_TIMEOUT", "60"))
+RETRIES = int(os.getenv("GENEAGENT_HTTP_RETRIES", "2"))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide requests session with per-host keep-alive connection pools."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(total=RETRIES, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+            adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+    return _session
+
+
+def _request(method, url, **kwargs):
+    kwargs.setdefault("timeout", TIMEOUT)
+    with tracing.span(f"{method} {urlsplit(url).netloc}", "http", url=url) as current:
+        response = get_session().request(method, url, **kwargs)
+        current.set(status=response.status_code)
+        return response
+
+
+def get(url, **kwargs):
+    return _request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return _request("POST", url, **kwargs)
+
+
+# httpx clients are bound to the event loop they were created on, so the async client
+# lives on one background loop and callers on any other loop await its futures.
+_async_loop = None
+_async_client = None
+_async_lock = threading.Lock()
+# httpx (the "async" extra) is imported on the first async request, so importing the tools stays light;
+# False until then, None when it is not installed.
+_httpx = False
+
+
+def _import_httpx():
+    global _httpx
+    if _httpx is False:
+        try:
+            import httpx
+        except ImportError:
+            httpx = None
+        _httpx = httpx
+    return _httpx
+
+
+def _get_async_loop():
+    global _async_loop, _async_client
+    with _async_lock:
+        if _async_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="http-client-loop", daemon=True).start()
+            httpx = _import_httpx()
+            if httpx is not None:
+                limits = httpx.Limits(max_connections=POOL_HOSTS * POOL_SIZE, max_keepalive_connections=POOL_SIZE)
+                # httpx ignores the client's limits when a transport is given, so the pool limits go on the transport.
+                transport = httpx.AsyncHTTPTransport(limits=limits, retries=RETRIES)
+
+                async def create_client():
+                    return httpx.AsyncClient(timeout=TIMEOUT, transport=transport, follow_redirects=True)
+
+                _async_client = asyncio.run_coroutine_threadsafe(create_client(), loop).result()
+            _async_loop = loop
+    return _async_loop
+
+
+def run(coroutine):
+    """
+    Run a coroutine of async requests to completion from synchronous code, e.g. a tool function.
+    It runs on the background loop, so this also works from a thread whose own event loop is running,
+    where asyncio.run() would raise.
+    """
+    loop = _get_async_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coroutine.close()
+        raise RuntimeError("http_client.run() blocks and cannot be called on the HTTP client loop itself")
+    return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+
+async def _arequest(method, url, **kwargs):
+    kwargs.pop("timeout", None)
+    loop = _get_async_loop()
+    with tracing.span(f"{method} {urlsplit(url).netloc}", "http", url=url) as current:
+        response = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(_async_client.request(method, url, **kwargs), loop))
+        current.set(status=response.status_code)
+        return response
+
+
+async def aget(url, **kwargs):
+    """
+    Async GET. Uses one pooled httpx client when httpx is installed, otherwise runs the
+    pooled requests session in a worker thread. Both responses expose status_code, text and json().
+    """
+    if _import_httpx() is None:
+        return await asyncio.to_thread(get, url, **kwargs)
+    return await _arequest("GET", url, **kwargs)
+
+
+async def apost(url, **kwargs):
+    if _import_httpx() is None:
+        return await asyncio.to_thread(post, url, **kwargs)
+    return await _arequest("POST", url, **kwargs)
@@ -0,0 +1,123 @@
+import os
+import json
+import threading
+
+# GENEAGENT_PROJECTIONS=0 passes the raw tool responses to the LLM.
+PROJECTIONS_ENABLED = os.getenv("GENEAGENT_PROJECTIONS", "1").lower() not in ("0", "off", "false")
+
+# Fields of a gene summary record that matter for verification.
+SUMMARY_FIELDS = ["name", "description", "otheraliases", "maplocation", "summary"]
+
+
+def _cell(value) -> str:
+    if isinstance(value, (list, tuple)):
+        return ",".join(_cell(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, separators=(",", ":"))
+    if isinstance(value, float):
+        return f"{value:.3g}"
+    return " ".join(str(value).split())
+
+
+def render_rows(header: list, rows: list) -> str:
+    """Tab separated table with one header line, without repeated rows."""
+    lines = ["\t".join(header)]
+    for row in rows:
+        line = "\t".join(_cell(value) for value in row)
+        if line not in lines:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def project_records(records) -> str:
+    """Generic projection of a list of flat records, e.g. the PubTator results."""
+    if isinstance(records, dict):
+        records = [records]
+    header = []
+    for record in records:
+        for key, value in record.items():
+            if key not in header and value not in (None, "", [], {}):
+                header.append(key)
+    return render_rows(header, [[record.get(key, "") for key in header] for record in records])
+
+
+def project_gprofiler(results, params) -> str:
+    rows = []
+    for result in results:
+        # g:Profiler lists evidence codes per mapped Ensembl gene, not per query symbol; the mapping
+        # is in the response metadata the tool does not return, so only the overlap size is kept
+        intersections = result.get("intersections", [])
+        genes = [] if intersections and isinstance(intersections[0], list) else intersections
+        rows.append([result.get("source"), result.get("native"), result.get("name"), result.get("p_value"),
+                     f"{result.get('intersection_size')}/{result.get('term_size')}", genes])
+    return render_rows(["source", "id", "name", "p_value", "overlap/term_size", "genes"], rows)
+
+
+def project_summary(record) -> str:
+    if not record:
+        return "No gene summary found."
+    return render_rows(SUMMARY_FIELDS, [[record.get(field, "") for field in SUMMARY_FIELDS]])
+
+
+def project_summaries(records, params) -> str:
+    rows = []
+    for gene, record in records.items():
+        record = record or {}
+        rows.append([gene] + [record.get(field, "") for field in SUMMARY_FIELDS[1:]])
+    return render_rows(["gene"] + SUMMARY_FIELDS[1:], rows)
+
+
+def project_pathways(results, params) -> str:
+    return render_rows(["database", "term", "genes"], [[r.get("database"), r.get("term"), r.get("overlapping genes")] for r in results])
+
+
+PROJECTIONS = {
+    "get_enrichment_for_gene_set": project_gprofiler,
+    "get_local_enrichment_for_gene_set": project_gprofiler,
+    "get_gene_summary_for_single_gene": lambda record, params: project_summary(record),
+    "get_gene_summary_for_gene_set": project_summaries,
+    "get_pathway_for_gene_set": project_pathways,
+    "get_complex_for_gene_set": lambda records, params: project_records(records),
+    "get_disease_for_single_gene": lambda records, params: project_records(records),
+    "get_domain_for_single_gene": lambda records, params: project_records(records),
+    "get_interactions_for_gene_set": lambda records, params: project_records(records),
+}
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def project(function_name: str, params: dict, response):
+    """
+    Compact rendering of a tool response with only the fields needed for verification.
+    Responses that are not structured (errors, PubMed text) are returned unchanged.
+    """
+    projection = PROJECTIONS.get(function_name)
+    if not PROJECTIONS_ENABLED or projection is None:
+        return response
+    data = response
+    if isinstance(response, str):
+        try:
+            data = json.loads(response)
+        except ValueError:
+            return response
+    if not data:
+        return response
+    try:
+        return projection(data, params)
+    except Exception:
+        return response
+
+
+def record_saving(function_name: str, raw_tokens: int, projected_tokens: int):
+    with _stats_lock:
+        stats = _stats.setdefault(function_name, {"calls": 0, "raw_tokens": 0, "projected_tokens": 0})
+        stats["calls"] += 1
+        stats["raw_tokens"] += raw_tokens
+        stats["projected_tokens"] += projected_tokens
+
+
+def projection_stats() -> dict:
+    """Calls, raw and projected tokens per tool; the difference is what the projections saved."""
+    with _stats_lock:
+        return {name: dict(stats, saved_tokens=stats["raw_tokens"] - stats["projected_tokens"]) for name, stats in _stats.items()}
@@ -0,0 +1,312 @@
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# One local server standing in for the OpenAI chat completions endpoint and the domain databases:
+#   /v1/chat/completions                       OpenAI compatible, scripted GeneAgent conversation
+#   /pubtator3-api/agentapi/complex/           PubTator complexes
+#   /pubtator-api/agentapi/{disease,cdd,ppi}/  PubTator diseases, domains and interactions
+#   /entrez/eutils/{esearch,esummary,efetch}.fcgi   NCBI E-utilities for genes and PubMed
+#   /gprofiler/api/gost/profile/               g:Profiler enrichment
+#   /Enrichr/addList, /Enrichr/enrich          Enrichr pathways
+
+GENE = re.compile(r"\b[A-Z][A-Z0-9-]{1,9}\b")
+GENE_LIST = re.compile(r"[A-Z0-9][A-Za-z0-9.-]*(?:\s*,\s*[A-Z0-9][A-Za-z0-9.-]*)+")
+SYMBOL_TERM = re.compile(r"([A-Za-z0-9.-]+)\[sym\]")
+STOP_WORDS = {"AND", "OR", "DNA", "RNA", "ATP", "GTP", "JSON"}
+
+
+class Script:
+    """Latency and usage settings of the fake servers."""
+
+    def __init__(self, llm_latency=0.5, api_latency=0.1, jitter=0.2, tool_rounds=2, tools_per_round=2, seed=0):
+        self.llm_latency = llm_latency
+        self.api_latency = api_latency
+        self.jitter = jitter
+        self.tool_rounds = tool_rounds
+        self.tools_per_round = tools_per_round
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counter = 0
+        self.webenvs = {}
+        self.genes = {}
+
+    def sleep(self, seconds):
+        with self.lock:
+            factor = 1 + self.jitter * (2 * self.random.random() - 1)
+        time.sleep(max(0.0, seconds * factor))
+
+    def next_id(self) -> int:
+        with self.lock:
+            self.counter += 1
+            return self.counter
+
+
+def gene_id(gene: str) -> str:
+    return str(zlib.crc32(gene.upper().encode("utf-8")) % 10_000_000)
+
+
+def genes_in(text: str) -> list:
+    return list(dict.fromkeys(gene for gene in GENE.findall(text) if gene not in STOP_WORDS))
+
+
+# ---- OpenAI ----
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _completion(request: dict, message: dict, finish_reason: str, script: Script) -> dict:
+    prompt = json.dumps(request.get("messages", [])) + json.dumps(request.get("tools", []))
+    completion = (message.get("content") or "") + json.dumps(message.get("tool_calls", []))
+    usage = {"prompt_tokens": _tokens(prompt), "completion_tokens": _tokens(completion)}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+    return {
+        "id": f"chatcmpl-bench-{script.next_id()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "gpt-4o"),
+        "choices": [{"index": 0, "message": {"role": "assistant", **message}, "finish_reason": finish_reason}],
+        "usage": usage,
+    }
+
+
+def _verification_turn(request: dict, script: Script) -> dict:
+    messages = request["messages"]
+    claim = next((m["content"] for m in messages if m.get("role") == "user"), "")
+    rounds = sum(1 for m in messages if m.get("role") == "assistant" and m.get("tool_calls"))
+    forced = request.get("tool_choice") == "none"
+    if rounds >= script.tool_rounds or forced:
+        return _completion(request, {"content": f"Report: Supported. The tools confirm the claim after {rounds} rounds of evidence."}, "stop", script)
+
+    match = GENE_LIST.search(claim)
+    gene_set = match.group() if match else ",".join(genes_in(claim)[:5]) or "TP53"
+    first_gene = gene_set.split(",")[0].strip()
+    candidates = [
+        ("get_gene_summary_for_gene_set", {"gene_set": gene_set, "specie": "Homo"}),
+        ("get_enrichment_for_gene_set", {"gene_set": gene_set}),
+        ("get_pathway_for_gene_set", {"gene_set": gene_set}),
+        ("get_disease_for_single_gene", {"gene_name": first_gene}),
+        ("get_pubmed_articles", {"term": first_gene}),
+    ]
+    available = {tool["function"]["name"] for tool in request.get("tools", [])}
+    candidates = [(name, args) for name, args in candidates if name in available] or candidates[:1]
+    start = rounds * script.tools_per_round
+    calls = [candidates[(start + i) % len(candidates)] for i in range(script.tools_per_round)]
+    tool_calls = [
+        {"id": f"call_{script.next_id()}", "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+        for name, args in calls
+    ]
+    return _completion(request, {"content": None, "tool_calls": tool_calls}, "tool_calls", script)
+
+
+def _pipeline_turn(request: dict, script: Script) -> dict:
+    """Answers of the generation steps of main_cascade, recognized by their prompts."""
+    text = request["messages"][-1].get("content") or ""
+    everything = " ".join(str(m.get("content") or "") for m in request["messages"])
+    genes = genes_in(everything)[:8] or ["TP53", "MDM2"]
+    gene_set = ",".join(genes)
+    if "claims with affirmative sentence for the entire gene set" in text:
+        content = json.dumps([f"{gene_set} are involved in the bench process.", f"{gene_set} regulate the bench pathway."])
+    elif "Generate claims for genes and their biological functions" in text:
+        content = json.dumps([f"{gene} is involved in the bench process." for gene in genes[:3]])
+    else:
+        content = "Process: Bench process\n" + " ".join(f"{gene} takes part in the bench process." for gene in genes)
+    return _completion(request, {"content": content}, "stop", script)
+
+
+def chat_completion(request: dict, script: Script) -> dict:
+    script.sleep(script.llm_latency)
+    if request.get("tools"):
+        return _verification_turn(request, script)
+    return _pipeline_turn(request, script)
+
+
+# ---- domain databases ----
+
+def pubtator(kind: str, query: dict) -> dict:
+    names = (query.get("name") or [""])[0]
+    genes = [gene for gene in re.split(r"[,\s]+", names) if gene]
+    if kind == "complex":
+        results = [{"_id": f"complex_{i}", "name": f"Bench complex {i}", "genes": genes[:3]} for i in range(3)]
+    elif kind == "disease":
+        results = [{"_id": f"MESH:D00{i}", "name": f"Bench disease {i}", "gene": names} for i in range(5)]
+    elif kind == "cdd":
+        results = [{"_id": f"cd0{i}", "name": f"Bench domain {i}", "gene": names} for i in range(3)]
+    else:
+        results = [{"gene_a": gene, "gene_b": other, "score": 0.9} for gene in genes[:3] for other in genes[:3] if gene != other]
+    return {"results": results}
+
+
+def esearch(query: dict, script: Script):
+    db = query.get("db", ["gene"])[0]
+    term = query.get("term", [""])[0]
+    if db == "pubmed":
+        ids = "".join(f"<Id>{40000000 + i}</Id>" for i in range(5))
+        return "text/xml", f"<eSearchResult><Count>5</Count><IdList>{ids}</IdList></eSearchResult>"
+    genes = SYMBOL_TERM.findall(term) or [term.split(" AND ")[0].strip()]
+    ids = [gene_id(gene) for gene in genes]
+    webenv = f"BENCH_{script.next_id()}"
+    with script.lock:
+        script.webenvs[webenv] = dict(zip(ids, genes))
+        script.genes.update(zip(ids, genes))
+    return "application/json", json.dumps({"esearchresult": {"count": str(len(ids)), "idlist": ids, "querykey": "1", "webenv": webenv}})
+
+
+def esummary(query: dict, script: Script):
+    if "WebEnv" in query:
+        with script.lock:
+            id2gene = dict(script.webenvs.get(query["WebEnv"][0], {}))
+    else:
+        with script.lock:
+            id2gene = {ID: script.genes.get(ID, f"GENE{ID}") for ID in query.get("id", [""])[0].split(",") if ID}
+    result = {"uids": list(id2gene)}
+    for ID, gene in id2gene.items():
+        result[ID] = {
+            "uid": ID, "name": gene, "status": "0", "description": f"{gene} bench protein",
+            "otheraliases": f"{gene}A, {gene}B", "chromosome": "1", "maplocation": "1p36",
+            "summary": f"{gene} takes part in the bench process. " * 20,
+            "locationhist": [{"chraccver": "NC_000001.11", "chrstart": 1000, "chrstop": 2000}],
+        }
+    return "application/json", json.dumps({"result": result})
+
+
+def efetch(query: dict):
+    articles = "".join(
+        f"<PubmedArticle><MedlineCitation><PMID>{ID}</PMID><Article><ArticleTitle>Bench article {ID}</ArticleTitle>"
+        f"<Abstract><AbstractText>{'The bench genes take part in the bench process. ' * 10}</AbstractText></Abstract>"
+        f"</Article></MedlineCitation></PubmedArticle>"
+        for ID in query.get("id", [""])[0].split(",") if ID
+    )
+    return "text/xml", f"<PubmedArticleSet>{articles}</PubmedArticleSet>"
+
+
+def gprofiler(request: dict) -> dict:
+    # like g:Profiler, the intersections are aligned with the mapped Ensembl genes in meta, which
+    # drop duplicated and unknown query symbols, and not with the query itself
+    query = request.get("query", [])
+    mapping = {gene: [f"ENSG{gene_id(gene):0>11}"] for gene in dict.fromkeys(query) if not gene.startswith("UNKNOWN")}
+    ensgs = [ensg for ensgs in mapping.values() for ensg in ensgs]
+    result = [
+        {
+            "source": "GO:BP", "native": f"GO:000{i}", "name": f"bench process {i}", "p_value": 10 ** -(6 - i),
+            "significant": True, "term_size": 50 + i, "query_size": len(ensgs), "intersection_size": max(1, len(ensgs) - i),
+            "effective_domain_size": 20000, "precision": 0.5, "recall": 0.1, "query": "query_1", "parents": [],
+            "intersections": [["IEA"] if j < len(ensgs) - i else [] for j in range(len(ensgs))],
+            "evidences": [["IEA"] for _ in ensgs],
+        }
+        for i in range(10)
+    ]
+    meta = {"genes_metadata": {"query": {"query_1": {"ensgs": ensgs, "mapping": mapping}}}}
+    return {"result": result, "meta": meta}
+
+
+def enrichr(background: str, genes: list) -> dict:
+    rows = [[rank, f"{background} bench pathway {rank}", 10 ** -(8 - rank), 5.0, 50.0, genes[:3], 10 ** -(7 - rank), 0, 0] for rank in range(1, 6)]
+    return {background: rows}
+
+
+class Handler(BaseHTTPRequestHandler):
+    script = Script()
+    lists = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, content_type: str, body: str, status: int = 200):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _route(self, method: str):
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/")
+        query = parse_qs(url.query)
+        body = self._body() if method == "POST" else b""
+        if path.endswith("/chat/completions"):
+            return self._send("application/json", json.dumps(chat_completion(json.loads(body), self.script)))
+
+        self.script.sleep(self.script.api_latency)
+        if "/agentapi/" in path:
+            return self._send("application/json", json.dumps(pubtator(path.split("/")[-1], query)))
+        if path.endswith("esearch.fcgi"):
+            if method == "POST":
+                query.update(parse_qs(body.decode("utf-8")))
+            return self._send(*esearch(query, self.script))
+        if path.endswith("esummary.fcgi"):
+            return self._send(*esummary(query, self.script))
+        if path.endswith("efetch.fcgi"):
+            return self._send(*efetch(query))
+        if path.endswith("/gost/profile"):
+            return self._send("application/json", json.dumps(gprofiler(json.loads(body))))
+        if path.endswith("/addList"):
+            # the gene list is one multipart field; the genes are its upper case lines
+            genes = [line.strip() for line in body.decode("utf-8", "replace").splitlines() if GENE.fullmatch(line.strip() or "-")]
+            list_id = self.script.next_id()
+            Handler.lists[list_id] = genes
+            return self._send("application/json", json.dumps({"userListId": list_id, "shortId": str(list_id)}))
+        if path.endswith("/enrich"):
+            genes = Handler.lists.get(int(query.get("userListId", ["0"])[0]), ["TP53"])
+            return self._send("application/json", json.dumps(enrichr(query.get("backgroundType", [""])[0], genes)))
+        return self._send("application/json", json.dumps({"error": f"unknown path {url.path}"}), status=404)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+
+def start_server(port: int = 0, script: Script = None) -> ThreadingHTTPServer:
+    """Start the fake servers on a background thread; port 0 picks a free port (see server.server_port)."""
+    if script is not None:
+        Handler.script = script
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="bench-server", daemon=True).start()
+    return server
+
+
+def environment(port: int) -> dict:
+    """Environment variables pointing the OpenAI SDK and the apis/ tools at the fake servers."""
+    base = f"http://127.0.0.1:{port}"
+    return {
+        "OPENAI_BASE_URL": f"{base}/v1",
+        "OPENAI_API_KEY": "bench",
+        "GENEAGENT_PUBTATOR_URL": base,
+        "GENEAGENT_EUTILS_URL": f"{base}/entrez/eutils",
+        "GENEAGENT_GPROFILER_URL": f"{base}/gprofiler",
+        "GENEAGENT_ENRICHR_URL": f"{base}/Enrichr",
+    }
+
+
+if __name__ == "__main__":
+    # python bench/fake_servers.py --port 8765, then export the printed variables
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--api-latency", type=float, default=0.1)
+    parser.add_argument("--tool-rounds", type=int, default=2)
+    parser.add_argument("--tools-per-round", type=int, default=2)
+    args = parser.parse_args()
+    server = start_server(args.port, Script(args.llm_latency, args.api_latency, tool_rounds=args.tool_rounds, tools_per_round=args.tools_per_round))
+    for key, value in environment(server.server_port).items():
+        print(f"export {key}={value}")
+    sys.stdout.flush()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
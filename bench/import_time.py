@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# Import time of the pipeline and tool modules in fresh interpreters, as paid by every
+# short-lived worker process.
+#   python bench/import_time.py                    this checkout
+#   python bench/import_time.py --against HEAD~1   also an earlier revision, side by side
+# Besides the time, it reports which heavy dependencies each import pulled in.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["llm", "worker", "topic", "main_cascade", "main_summary", "main_CoT", "apis.get_gene_summary_for_gene_set", "apis.get_local_enrichment_for_gene_set"]
+HEAVY = ["openai", "tiktoken", "pandas", "httpx"]
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+
+def measure(root: str, module: str, repeats: int) -> dict:
+    """Median import seconds of `module` under `root` over `repeats` fresh interpreters."""
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY") or "bench", PYTHONDONTWRITEBYTECODE="1")
+    times, loaded = [], []
+    for _ in range(repeats):
+        completed = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY)],
+                                   cwd=root, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if completed.returncode != 0:
+            return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "failed"}
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        times.append(result["seconds"])
+        loaded = result["loaded"]
+    return {"seconds": round(statistics.median(times), 3), "loaded": loaded}
+
+
+def export_revision(revision: str) -> str:
+    """Check out `revision` into a temporary directory with git archive."""
+    target = tempfile.mkdtemp(prefix="geneagent-import-")
+    archive = subprocess.run(["git", "archive", revision], cwd=ROOT, stdout=subprocess.PIPE, check=True)
+    subprocess.run(["tar", "-x", "-C", target], input=archive.stdout, check=True)
+    return target
+
+
+def _cell(result: dict) -> str:
+    if "error" in result:
+        return f"error: {result['error'][:60]}"
+    return f"{result['seconds']:.3f}s [{', '.join(result['loaded']) or '-'}]"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--against", default=None, help="git revision to compare with, e.g. HEAD~1")
+    args = parser.parse_args()
+
+    roots = {"current": ROOT}
+    if args.against:
+        roots[args.against] = export_revision(args.against)
+    results = {label: {module: measure(root, module, args.repeats) for module in args.modules} for label, root in roots.items()}
+
+    width = max(len(module) for module in args.modules)
+    print(f"{'module':<{width}}  " + "  ".join(f"{label:<45}" for label in roots))
+    for module in args.modules:
+        print(f"{module:<{width}}  " + "  ".join(f"{_cell(results[label][module]):<45}" for label in roots))
+    print(json.dumps(results))
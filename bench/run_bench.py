@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import tempfile
+import subprocess
+
+import fake_servers
+
+# Offline benchmark of main_cascade.py against the local stand-ins of bench/fake_servers.py.
+#   python bench/run_bench.py                       toy datasets, compared with bench/baseline.json
+#   python bench/run_bench.py --update-baseline     record the current numbers as the baseline
+#   python bench/run_bench.py --full                the full datasets instead of the toy ones
+# Exits with status 1 when a gene set errored, or when a metric regressed by more than --tolerance
+# against the baseline.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(ROOT, "bench", "baseline.json")
+TOY_DATASETS = ["Datasets/Gene ontology/GO_toy.csv", "Datasets/MsigDB/MsigDB_toy.csv", "Datasets/NeST/NeST_toy.tsv"]
+FULL_DATASETS = ["Datasets/Gene ontology/GO_terms.csv", "Datasets/MsigDB/MsigDB.csv", "Datasets/NeST/NeST.tsv"]
+
+# Metrics where a larger value is better; every other metric regresses when it grows.
+HIGHER_IS_BETTER = {"gene_sets_per_minute"}
+
+
+def quantile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_dataset(dataset: str, port: int, workdir: str, workers: int) -> dict:
+    """Run main_cascade.py on one dataset with every cache off and return its results path, trace path and wall time."""
+    stem = os.path.splitext(os.path.basename(dataset))[0]
+    paths = {name: os.path.join(workdir, f"{stem}.{name}") for name in ("results", "progress", "trace", "costs")}
+    env = dict(os.environ)
+    env.update(fake_servers.environment(port))
+    env.update({
+        "AZURE_OPENAI_ENDPOINT": "", "AZURE_API_BASE": "", "AZURE_OPENAI_API_KEY": "",
+        "GENEAGENT_TOOL_CACHE": "off", "GENEAGENT_LLM_CACHE_MODE": "off", "GENEAGENT_CLAIM_MEMO": "off",
+        "GENEAGENT_RPM": "0", "GENEAGENT_TPM": "0", "GENEAGENT_TOKENIZER": "approximate",
+        "GENEAGENT_COST_LOG": paths["costs"], "GENEAGENT_RUN_ID": f"bench-{stem}",
+    })
+    command = [sys.executable, "main_cascade.py", "--dataset", dataset, "--workers", str(workers),
+               "--results", paths["results"], "--progress", paths["progress"], "--trace", paths["trace"]]
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    seconds = time.perf_counter() - start
+    if completed.returncode != 0:
+        sys.exit(f"main_cascade.py failed on {dataset}:\n{completed.stdout[-4000:]}")
+    return {**paths, "seconds": seconds}
+
+
+def errors(runs: list) -> list:
+    """(ID, error) of every gene set whose run did not succeed; their timings would not measure the pipeline."""
+    found = []
+    for run in runs:
+        with open(run["results"], "r") as f:
+            records = [json.loads(line) for line in f]
+        found.extend((record["ID"], record.get("error")) for record in records if record["type"] == "gene_set" and record["status"] != "ok")
+    return found
+
+
+def metrics(runs: list) -> dict:
+    """Throughput, stage latency and agent behaviour over the runs, from their results files and traces."""
+    gene_sets, seconds, stages, rounds, tool_calls = 0, 0.0, {}, {}, {}
+    for run in runs:
+        seconds += run["seconds"]
+        with open(run["results"], "r") as f:
+            gene_sets += sum(1 for line in f if json.loads(line)["type"] == "gene_set")
+        with open(run["trace"], "r") as f:
+            events = json.load(f)["traceEvents"]
+        claims = {event["args"]["span"] for event in events if event["cat"] == "claim"}
+        for event in events:
+            if event["cat"] == "stage":
+                stages.setdefault(event["name"], []).append(event["dur"] / 1e6)
+            elif event["cat"] == "round" and event["args"]["parent"] in claims:
+                key = (run["trace"], event["args"]["parent"])
+                rounds[key] = rounds.get(key, 0) + 1
+                tool_calls[key] = tool_calls.get(key, 0) + event["args"].get("tool_calls", 0)
+    all_stages = [value for values in stages.values() for value in values]
+    report = {
+        "gene_sets": gene_sets,
+        "gene_sets_per_minute": round(60 * gene_sets / seconds, 3) if seconds else 0.0,
+        "stage_p50_s": round(quantile(all_stages, 0.5), 3),
+        "stage_p99_s": round(quantile(all_stages, 0.99), 3),
+        "rounds_per_claim": round(sum(rounds.values()) / len(rounds), 3) if rounds else 0.0,
+        "tool_calls_per_claim": round(sum(tool_calls.values()) / len(tool_calls), 3) if tool_calls else 0.0,
+    }
+    for name, values in sorted(stages.items()):
+        report[f"{name}_p50_s"] = round(quantile(values, 0.5), 3)
+        report[f"{name}_p99_s"] = round(quantile(values, 0.99), 3)
+    return report
+
+
+def regressions(current: dict, baseline: dict, tolerance: float) -> list:
+    """Metrics that moved by more than `tolerance` (a fraction) in the wrong direction."""
+    found = []
+    for name, expected in baseline.items():
+        if name == "gene_sets" or name not in current or not expected:
+            continue
+        change = (current[name] - expected) / expected
+        if name in HIGHER_IS_BETTER:
+            change = -change
+        if change > tolerance:
+            found.append(f"{name}: {current[name]} vs baseline {expected} ({100 * change:+.0f}%)")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--datasets", nargs="*", default=None, help="dataset files relative to the repository (default: the toy datasets)")
+    parser.add_argument("--full", action="store_true", help="run the full datasets instead of the toy ones")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per chat completion")
+    parser.add_argument("--api-latency", type=float, default=0.1, help="seconds per domain database request")
+    parser.add_argument("--tool-rounds", type=int, default=2, help="tool calling rounds before the fake model answers")
+    parser.add_argument("--tools-per-round", type=int, default=2)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression per metric")
+    parser.add_argument("--update-baseline", action="store_true", help="write the measured metrics to the baseline file")
+    parser.add_argument("--keep", default=None, help="keep the results, traces and cost logs in this directory")
+    args = parser.parse_args()
+
+    datasets = args.datasets or (FULL_DATASETS if args.full else TOY_DATASETS)
+    missing = [dataset for dataset in datasets if not glob.glob(os.path.join(ROOT, dataset))]
+    if missing:
+        sys.exit(f"Missing datasets: {missing}")
+
+    script = fake_servers.Script(args.llm_latency, args.api_latency, tool_rounds=args.tool_rounds, tools_per_round=args.tools_per_round)
+    server = fake_servers.start_server(0, script)
+    workdir = args.keep or tempfile.mkdtemp(prefix="geneagent-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        runs = []
+        for dataset in datasets:
+            print(f"===Running {dataset}===")
+            runs.append(run_dataset(dataset, server.server_port, workdir, args.workers))
+    finally:
+        server.shutdown()
+
+    failed = errors(runs)
+    if failed:
+        print(f"===Results and traces in {workdir}===")
+        sys.exit(f"{len(failed)} gene sets errored, the metrics are not comparable; first error of {failed[0][0]}: {failed[0][1]}")
+    report = metrics(runs)
+    config = {"datasets": datasets, "workers": args.workers, "llm_latency": args.llm_latency, "api_latency": args.api_latency,
+              "tool_rounds": args.tool_rounds, "tools_per_round": args.tools_per_round}
+    print(f"===Metrics: {json.dumps(report, indent=1)}===")
+    print(f"===Results and traces in {workdir}===")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"config": config, "metrics": report}, f, indent=2)
+        print(f"===Baseline written to {args.baseline}===")
+        sys.exit(0)
+    if not os.path.exists(args.baseline):
+        print(f"===No baseline at {args.baseline}; record one with --update-baseline===")
+        sys.exit(0)
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    if baseline.get("config") != config:
+        print(f"===Warning: the baseline was recorded with {json.dumps(baseline.get('config'))}===")
+    found = regressions(report, baseline["metrics"], args.tolerance)
+    if found:
+        print("===Regressions against the baseline===")
+        print("\n".join(found))
+        sys.exit(1)
+    print(f"===No regression beyond {100 * args.tolerance:.0f}% against the baseline===")
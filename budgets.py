@@ -0,0 +1,45 @@
+import os
+
+from costs import RUN_ID, current_gene_set, get_cost_ledger
+
+# Configuration through environment variables (0 = no limit):
+#   GENEAGENT_CLAIM_BUDGET_TOKENS / GENEAGENT_CLAIM_BUDGET_USD          spend of the verification of one claim
+#   GENEAGENT_GENE_SET_BUDGET_TOKENS / GENEAGENT_GENE_SET_BUDGET_USD    spend of one gene set
+#   GENEAGENT_RUN_BUDGET_TOKENS / GENEAGENT_RUN_BUDGET_USD              spend of the whole run (this process)
+# Tokens are prompt plus completion tokens; dollars follow costs.estimate_cost. Completions replayed from
+# the completion cache are free and count towards neither (their tokens are not in billed_tokens).
+
+
+class Budget:
+    def __init__(self, tokens: int = 0, usd: float = 0.0):
+        self.tokens = tokens
+        self.usd = usd
+
+    @classmethod
+    def from_env(cls, scope: str):
+        return cls(int(os.getenv(f"GENEAGENT_{scope}_BUDGET_TOKENS", "0")), float(os.getenv(f"GENEAGENT_{scope}_BUDGET_USD", "0")))
+
+    def exhausted(self, usage: dict) -> bool:
+        tokens = usage.get("billed_tokens", 0)
+        return bool((self.tokens and tokens >= self.tokens) or (self.usd and usage.get("total_cost", 0) >= self.usd))
+
+
+CLAIM_BUDGET = Budget.from_env("CLAIM")
+GENE_SET_BUDGET = Budget.from_env("GENE_SET")
+RUN_BUDGET = Budget.from_env("RUN")
+
+
+def exhausted_budget(claim_usage: dict = None, ID=None):
+    """
+    Name of the first exhausted budget, "run", "gene_set" or "claim", or None while there is budget left.
+    The gene set defaults to the one of costs.gene_set_context(); the claim is checked when its usage is given.
+    """
+    ledger = get_cost_ledger()
+    if RUN_BUDGET.exhausted(ledger.total("run", RUN_ID)):
+        return "run"
+    ID = current_gene_set.get() if ID is None else str(ID)
+    if ID is not None and GENE_SET_BUDGET.exhausted(ledger.total("gene_set", ID)):
+        return "gene_set"
+    if claim_usage is not None and CLAIM_BUDGET.exhausted(claim_usage):
+        return "claim"
+    return None
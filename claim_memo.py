@@ -0,0 +1,205 @@
+import os
+import re
+import json
+import time
+import hashlib
+import random
+import sqlite3
+import threading
+
+from geneset import parse_genes
+
+# Configuration through environment variables:
+#   GENEAGENT_CLAIM_MEMO              path of the SQLite file (default off: every claim is verified again),
+#                                     "on" for Outputs/cache/claims.sqlite
+#   GENEAGENT_CLAIM_MEMO_SIMILARITY   estimated Jaccard similarity above which a stored claim about the
+#                                     same genes counts as a near duplicate (default 0 = exact matches only)
+#   GENEAGENT_CLAIM_MEMO_TTL          seconds before a stored report expires (default 30 days, 0 = never)
+DEFAULT_PATH = "Outputs/cache/claims.sqlite"
+DEFAULT_SIMILARITY = 0.0
+DEFAULT_TTL = 30 * 24 * 3600
+
+# MinHash signature of NUM_PERM values split into BANDS bands for the locality sensitive index.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)
+_A = [_rng.randrange(1, _PRIME) for _ in range(NUM_PERM)]
+_B = [_rng.randrange(0, _PRIME) for _ in range(NUM_PERM)]
+
+# Two or more gene symbols separated by commas or slashes, e.g. "PEX1, PEX2,PEX3".
+GENE_LIST = re.compile(r"[A-Za-z0-9][A-Za-z0-9.-]*(?:\s*[,/]\s*[A-Za-z0-9][A-Za-z0-9.-]*)+")
+WORD = re.compile(r"[a-z0-9]+")
+
+# Words that flip or set the direction of a claim. Near duplicates must use the same ones, so that
+# "X activates Y" never reuses the report of "X does not activate Y" or "X inhibits Y".
+NEGATIONS = {"not", "no", "never", "neither", "nor", "without", "cannot", "lack", "lacks", "absence", "absent",
+             "doesn", "don", "didn", "isn", "aren", "wasn", "weren"}
+DIRECTION_STEMS = ("activat", "inhibit", "increas", "decreas", "elevat", "reduc", "promot", "suppress", "repress",
+                   "induc", "enhanc", "impair", "stimulat", "block", "upregulat", "downregulat", "positiv", "negativ",
+                   "gain", "los", "high", "low", "up", "down", "agonist", "antagonist")
+
+# Reports that are not a verification and never stored.
+FAILED_REPORTS = ("Failed.",)
+
+
+def claim_genes(claim: str) -> list:
+    """Sorted gene symbols listed in a claim."""
+    genes = set()
+    for match in GENE_LIST.finditer(claim):
+        genes.update(gene.upper() for gene in parse_genes(match.group()))
+    return sorted(genes)
+
+
+def normalize_claim(claim: str) -> str:
+    """Lower case words of a claim with every gene list sorted; whitespace and punctuation are dropped."""
+    claim = GENE_LIST.sub(lambda match: " ".join(sorted(gene.upper() for gene in parse_genes(match.group()))), claim)
+    return " ".join(WORD.findall(claim.lower()))
+
+
+def polarity(text: str) -> tuple:
+    """Negation words and direction word stems of a normalized claim."""
+    words = text.split()
+    negations = sorted(set(words) & NEGATIONS)
+    directions = sorted({stem for word in words for stem in DIRECTION_STEMS if word.startswith(stem)})
+    return negations, directions
+
+
+def minhash(text: str, genes: list = ()) -> list:
+    """
+    MinHash signature over the word bigrams (and words) of a normalized claim. The gene symbols are
+    left out: candidates already share them, and they would outweigh the words that differ.
+    """
+    excluded = {gene.lower() for gene in genes}
+    words = [word for word in text.split() if word not in excluded]
+    shingles = set(words) | {" ".join(words[i:i + 2]) for i in range(len(words) - 1)}
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little") for shingle in shingles or {""}]
+    return [min((a * value + b) % _PRIME for value in hashes) for a, b in zip(_A, _B)]
+
+
+def similarity(signature: list, other: list) -> float:
+    return sum(x == y for x, y in zip(signature, other)) / NUM_PERM
+
+
+class ClaimMemo:
+    """
+    Persistent claim -> report store shared by runs. Claims are matched on their normalized
+    text. With a `threshold` above 0, a MinHash/LSH index also proposes stored claims about the
+    same genes, which are accepted once their estimated similarity reaches `threshold` and they
+    use the same negation and direction words. Reports are only shared between verifications of
+    the same `scope` (the model and tools that produced them) and expire after `ttl` seconds.
+    """
+
+    def __init__(self, path: str, threshold: float = DEFAULT_SIMILARITY, ttl: float = DEFAULT_TTL):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.threshold = threshold
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = {"exact": 0, "near": 0}
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=60)
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS claims ("
+                "key TEXT PRIMARY KEY, genes TEXT, claim TEXT, report TEXT, signature TEXT, provenance TEXT, created REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS claims_created ON claims (created)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS bands (band TEXT, key TEXT)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS bands_band ON bands (band)")
+
+    @classmethod
+    def from_env(cls):
+        path = os.getenv("GENEAGENT_CLAIM_MEMO", "off")
+        if path.lower() in ("", "0", "off", "none", "false"):
+            return None
+        if path.lower() in ("1", "on", "true"):
+            path = DEFAULT_PATH
+        return cls(path, threshold=float(os.getenv("GENEAGENT_CLAIM_MEMO_SIMILARITY", DEFAULT_SIMILARITY)),
+                   ttl=float(os.getenv("GENEAGENT_CLAIM_MEMO_TTL", DEFAULT_TTL)))
+
+    @staticmethod
+    def _key(scope: str, normalized: str) -> str:
+        return hashlib.sha256(f"{scope}\n{normalized}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _bands(scope: str, genes: str, signature: list) -> list:
+        # bands are scoped to the genes of the claim, so only claims about the same genes are compared
+        return [hashlib.sha1(json.dumps([scope, genes, i, signature[i * ROWS:(i + 1) * ROWS]]).encode("utf-8")).hexdigest()
+                for i in range(BANDS)]
+
+    def _oldest(self) -> float:
+        return time.time() - self.ttl if self.ttl > 0 else 0.0
+
+    def _provenance(self, row, match: str, score: float) -> dict:
+        claim, created, provenance = row
+        return {**json.loads(provenance), "source": "memo", "match": match, "similarity": round(score, 3),
+                "memo_claim": claim, "memo_created": created}
+
+    def get(self, claim: str, scope: str = ""):
+        """Return (report, provenance) of a stored, unexpired equivalent claim of the same scope, or None."""
+        normalized = normalize_claim(claim)
+        key = self._key(scope, normalized)
+        oldest = self._oldest()
+        with self.lock:
+            row = self.conn.execute("SELECT claim, created, provenance, report FROM claims WHERE key = ? AND created >= ?",
+                                    (key, oldest)).fetchone()
+            if row is not None:
+                self.hits["exact"] += 1
+                return row[3], self._provenance(row[:3], "exact", 1.0)
+            if self.threshold > 0:
+                genes = claim_genes(claim)
+                signature = minhash(normalized, genes)
+                bands = self._bands(scope, ",".join(genes), signature)
+                candidates = self.conn.execute(
+                    f"SELECT DISTINCT c.claim, c.created, c.provenance, c.report, c.signature FROM bands b JOIN claims c ON b.key = c.key "
+                    f"WHERE b.band IN ({','.join('?' * len(bands))}) AND c.created >= ?", [*bands, oldest]
+                ).fetchall()
+                sign = polarity(normalized)
+                scored = [(similarity(signature, json.loads(row[4])), row) for row in candidates
+                          if polarity(normalize_claim(row[0])) == sign]
+                scored = [(score, row) for score, row in scored if score >= self.threshold]
+                if scored:
+                    score, row = max(scored, key=lambda item: item[0])
+                    self.hits["near"] += 1
+                    return row[3], self._provenance(row[:3], "near", score)
+            self.misses += 1
+        return None
+
+    def put(self, claim: str, report: str, provenance: dict = None, scope: str = ""):
+        if not report or report in FAILED_REPORTS:
+            return
+        normalized = normalize_claim(claim)
+        key = self._key(scope, normalized)
+        genes = claim_genes(claim)
+        signature = minhash(normalized, genes)
+        genes = ",".join(genes)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO claims (key, genes, claim, report, signature, provenance, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, genes, claim, report, json.dumps(signature), json.dumps(provenance or {}), time.time()),
+            )
+            self.conn.execute("DELETE FROM bands WHERE key = ?", (key,))
+            self.conn.executemany("INSERT INTO bands (band, key) VALUES (?, ?)", [(band, key) for band in self._bands(scope, genes, signature)])
+            if self.ttl > 0:
+                self.conn.execute("DELETE FROM bands WHERE key IN (SELECT key FROM claims WHERE created < ?)", (self._oldest(),))
+                self.conn.execute("DELETE FROM claims WHERE created < ?", (self._oldest(),))
+
+    def stats(self) -> dict:
+        return {"exact_hits": self.hits["exact"], "near_hits": self.hits["near"], "misses": self.misses}
+
+
+_memo = None
+_memo_lock = threading.Lock()
+
+
+def get_claim_memo():
+    """Shared ClaimMemo configured from the environment, or None when it is off."""
+    global _memo
+    with _memo_lock:
+        if _memo is None:
+            _memo = ClaimMemo.from_env() or False
+    return _memo or None
@@ -0,0 +1,166 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+
+# Configuration through environment variables:
+#   GENEAGENT_LLM_CACHE_MODE   off (default), record, replay or readthrough
+#   GENEAGENT_LLM_CACHE        path of the append-only cache file
+# record      always call the API and store every completion
+# replay      only serve stored completions, a miss raises CompletionCacheMiss
+# readthrough serve stored completions and call the API (and store the result) on a miss
+OFF, RECORD, REPLAY, READTHROUGH = "off", "record", "replay", "readthrough"
+MODES = (OFF, RECORD, REPLAY, READTHROUGH)
+DEFAULT_PATH = "Outputs/cache/completions.jsonl"
+
+# Request arguments that do not influence the completion and are left out of the key.
+IGNORED_ARGUMENTS = ("stream", "timeout", "extra_headers", "extra_query", "user")
+
+
+class CompletionCacheMiss(KeyError):
+    pass
+
+
+def _plain(value):
+    """Convert SDK message objects inside the request into plain JSON data."""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(exclude_none=True)
+    if isinstance(value, dict):
+        return {key: _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    return value
+
+
+def make_key(kwargs: dict) -> str:
+    """Content address of a request: model, messages, function/tool schemas and sampling parameters."""
+    request = {key: _plain(value) for key, value in kwargs.items() if key not in IGNORED_ARGUMENTS}
+    data = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """
+    Append-only JSONL file of {"key", "response"} records with an in-memory key -> offset index.
+    Records appended by other processes are picked up on a miss. Superseded records are
+    dropped by compact(), which runs automatically on open once they outnumber the live ones;
+    compaction rewrites the file, so it should not run while another process is writing.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, mode: str = READTHROUGH):
+        if mode not in MODES:
+            raise ValueError(f"Unknown completion cache mode {mode}, expected one of {MODES}")
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._reset_index()
+        with self.lock:
+            self._scan()
+            if self.stale > max(1000, len(self.index)):
+                self._compact()
+
+    @classmethod
+    def from_env(cls):
+        mode = os.getenv("GENEAGENT_LLM_CACHE_MODE", OFF).lower()
+        if mode == OFF:
+            return None
+        return cls(os.getenv("GENEAGENT_LLM_CACHE", DEFAULT_PATH), mode)
+
+    def _reset_index(self):
+        self.index = {}
+        self.scanned = 0
+        self.stale = 0
+
+    def _scan(self):
+        """Index the records appended since the last scan."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.scanned)
+            offset = self.scanned
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # a record still being written by another process
+                    break
+                try:
+                    key = json.loads(line)["key"]
+                except (ValueError, KeyError):
+                    offset += len(line)
+                    continue
+                if key in self.index:
+                    self.stale += 1
+                self.index[key] = offset
+                offset += len(line)
+            self.scanned = offset
+
+    def _read(self, offset: int) -> dict:
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())["response"]
+
+    def get(self, key: str):
+        with self.lock:
+            if key not in self.index:
+                self._scan()
+            offset = self.index.get(key)
+            if offset is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._read(offset)
+
+    def put(self, key: str, response: dict):
+        line = (json.dumps({"key": key, "response": response}) + "\n").encode("utf-8")
+        with self.lock:
+            self._scan()
+            with open(self.path, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(line)
+            if self.scanned == offset:
+                if key in self.index:
+                    self.stale += 1
+                self.index[key] = offset
+                self.scanned = offset + len(line)
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+            for key, offset in self.index.items():
+                src.seek(offset)
+                dst.write(src.readline())
+        os.replace(tmp_path, self.path)
+        self._reset_index()
+        self._scan()
+
+    def compact(self):
+        """Rewrite the file keeping only the latest record of every key."""
+        with self.lock:
+            self._scan()
+            self._compact()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache():
+    """Shared CompletionCache configured from the environment, or None when it is off."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CompletionCache.from_env() or False
+    return _cache or None
+
+
+if __name__ == "__main__":
+    # python completion_cache.py compact [path]
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        sys.exit("usage: python completion_cache.py compact [path]")
+    cache = CompletionCache(sys.argv[2] if len(sys.argv) > 2 else os.getenv("GENEAGENT_LLM_CACHE", DEFAULT_PATH))
+    cache.compact()
+    print(f"===Compacted {cache.path} to {len(cache.index)} completions===")
@@ -0,0 +1,88 @@
+import os
+import json
+
+# Configuration through environment variables:
+#   GENEAGENT_CONTEXT_BUDGET      prompt tokens the verification messages may use per round (default 16000)
+#   GENEAGENT_MAX_TOOL_TOKENS     tokens kept of a single tool response (default 4000)
+#   GENEAGENT_CONDENSED_TOKENS    tokens kept of an older tool response once the budget is exceeded (default 200)
+CONTEXT_BUDGET = int(os.getenv("GENEAGENT_CONTEXT_BUDGET", "16000"))
+MAX_TOOL_TOKENS = int(os.getenv("GENEAGENT_MAX_TOOL_TOKENS", "4000"))
+CONDENSED_TOKENS = int(os.getenv("GENEAGENT_CONDENSED_TOKENS", "200"))
+
+# role, name and separator tokens every message carries in addition to its content
+MESSAGE_OVERHEAD = 4
+TOOL_ROLES = ("tool", "function")
+
+
+class ContextWindow:
+    """
+    Messages of the verification loop with token counts kept per message.
+    New tool responses are truncated to max_tool_tokens. When the total exceeds the budget,
+    fit() condenses the oldest tool responses to their first condensed_tokens tokens and,
+    if that is not enough, replaces them with a short note. The system and user prompts
+    and the tool responses of the latest turn are never touched, and tool messages are
+    kept (only shortened) so that every tool call still has its answer.
+    """
+
+    def __init__(self, messages: list, encoding, budget: int = CONTEXT_BUDGET,
+                 max_tool_tokens: int = MAX_TOOL_TOKENS, condensed_tokens: int = CONDENSED_TOKENS):
+        self.encoding = encoding
+        self.budget = budget
+        self.max_tool_tokens = max_tool_tokens
+        self.condensed_tokens = condensed_tokens
+        self.messages = []
+        self.tokens = []
+        self.condensed = []
+        self.evicted_tokens = 0
+        self.extend(messages)
+
+    @property
+    def total(self) -> int:
+        return sum(self.tokens)
+
+    def _count(self, message: dict) -> int:
+        text = message.get("content") or ""
+        if message.get("tool_calls"):
+            text += json.dumps(message["tool_calls"])
+        return len(self.encoding.encode(text)) + MESSAGE_OVERHEAD
+
+    def _truncate(self, content: str, limit: int) -> str:
+        tokens = self.encoding.encode(content)
+        if len(tokens) <= limit:
+            return content
+        return self.encoding.decode(tokens[:limit]) + f" ... [truncated {len(tokens) - limit} tokens]"
+
+    def append(self, message: dict):
+        if message.get("role") in TOOL_ROLES and message.get("content"):
+            message = {**message, "content": self._truncate(message["content"], self.max_tool_tokens)}
+        self.messages.append(message)
+        self.tokens.append(self._count(message))
+        self.condensed.append(0)
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def _replace_content(self, position: int, content: str):
+        before = self.tokens[position]
+        self.messages[position] = {**self.messages[position], "content": content}
+        self.tokens[position] = self._count(self.messages[position])
+        self.condensed[position] += 1
+        self.evicted_tokens += before - self.tokens[position]
+
+    def fit(self) -> int:
+        """Shrink older tool responses until the messages fit into the budget. Returns the total tokens."""
+        # tool responses after the latest assistant turn are the fresh evidence and stay intact
+        latest = max((i for i, message in enumerate(self.messages) if message.get("role") == "assistant"), default=len(self.messages))
+        candidates = [i for i in range(latest) if self.messages[i].get("role") in TOOL_ROLES]
+        for stage in (1, 2):
+            for position in candidates:
+                if self.total <= self.budget:
+                    return self.total
+                if self.condensed[position] >= stage:
+                    continue
+                if stage == 1:
+                    self._replace_content(position, self._truncate(self.messages[position]["content"], self.condensed_tokens))
+                else:
+                    self._replace_content(position, "[Earlier tool response removed to save context; call the tool again if it is needed.]")
+        return self.total
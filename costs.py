@@ -1,7 +1,16 @@
 import os
 import json
+import atexit
+import threading
+import contextlib
+import contextvars
 from datetime import datetime
 
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
 # Default per-million token prices in USD. Override via env vars if needed.
 # Example env overrides:
 #   OPENAI_PRICE_GPT_4O_INPUT=5.0
@@ -11,6 +20,136 @@ PRICES_PER_MILLION = {
 }
 
 
+# Configuration through environment variables:
+#   GENEAGENT_COST_LOG             JSONL file receiving one entry per completion (default Outputs/costs.log)
+#   GENEAGENT_COST_FLUSH_SECONDS   seconds between background writes of the buffered entries (default 2)
+#   GENEAGENT_RUN_ID               run label stored with every entry (default start time and process ID)
+COST_LOG = os.getenv("GENEAGENT_COST_LOG", "Outputs/costs.log")
+FLUSH_SECONDS = float(os.getenv("GENEAGENT_COST_FLUSH_SECONDS", "2"))
+RUN_ID = os.getenv("GENEAGENT_RUN_ID") or f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{os.getpid()}"
+
+# Gene set the completions of the current thread or task belong to, see gene_set_context().
+current_gene_set = contextvars.ContextVar("current_gene_set", default=None)
+
+# Dimensions the ledger aggregates over.
+DIMENSIONS = ("run", "gene_set", "tag", "model")
+# billed_tokens leaves out the tokens of completions replayed from the completion cache.
+TOTAL_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens", "billed_tokens", "total_cost")
+
+
+@contextlib.contextmanager
+def gene_set_context(ID):
+    """Attribute the completions made inside the block (including threads started with asyncio.to_thread) to a gene set."""
+    token = current_gene_set.set(None if ID is None else str(ID))
+    try:
+        yield
+    finally:
+        current_gene_set.reset(token)
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100.0
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+class CostLedger:
+    """
+    Cost entries of this process with running totals per run, gene set, tag and model.
+    record() only updates the aggregates and buffers the entry; a background thread appends
+    the buffered entries to the log every `flush_seconds` in one locked write, so that
+    threads do not contend on the file and several processes can share it.
+    """
+
+    def __init__(self, path: str = COST_LOG, flush_seconds: float = FLUSH_SECONDS):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.buffer = []
+        self.totals = {dimension: {} for dimension in DIMENSIONS}
+        self.samples = {}
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="cost-ledger", daemon=True)
+        self.thread.start()
+
+    def record(self, entry: dict):
+        with self.lock:
+            self.buffer.append(json.dumps(entry))
+            for dimension in DIMENSIONS:
+                totals = self.totals[dimension].setdefault(entry.get(dimension), {"calls": 0, "cached": 0, **dict.fromkeys(TOTAL_FIELDS, 0)})
+                totals["calls"] += 1
+                totals["cached"] += int(entry.get("cached", False))
+                for field in TOTAL_FIELDS:
+                    totals[field] += entry.get(field, 0)
+            samples = self.samples.setdefault(entry.get("tag"), {"prompt_tokens": [], "completion_tokens": [], "total_tokens": []})
+            for field, values in samples.items():
+                values.append(entry.get(field, 0))
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                lines, self.buffer = self.buffer, []
+            if not lines:
+                return
+            try:
+                if os.path.dirname(self.path):
+                    os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "a") as f:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_EX)
+                    f.write("\n".join(lines) + "\n")
+                    f.flush()
+            except Exception:
+                # Non-fatal if logging fails
+                pass
+
+    def _run(self):
+        while not self.closed.wait(self.flush_seconds):
+            self.flush()
+
+    def close(self):
+        self.closed.set()
+        self.flush()
+
+    def totals_by(self, dimension: str) -> dict:
+        """Calls, cached calls, tokens and cost per run, gene_set, tag or model."""
+        with self.lock:
+            return {key: dict(totals) for key, totals in self.totals[dimension].items()}
+
+    def total(self, dimension: str = "run", key=RUN_ID) -> dict:
+        """Totals of one run, gene set, tag or model; zeros when nothing was recorded for it."""
+        with self.lock:
+            return dict(self.totals[dimension].get(key, {"calls": 0, "cached": 0, **dict.fromkeys(TOTAL_FIELDS, 0)}))
+
+    def percentiles(self, tag: str, field: str = "total_tokens", quantiles=(50, 95)) -> dict:
+        """Percentiles of the tokens per completion of a tag, e.g. {"p50": ..., "p95": ...}."""
+        with self.lock:
+            values = list(self.samples.get(tag, {}).get(field, []))
+        return {f"p{q}": _percentile(values, q) for q in quantiles}
+
+    def summary(self) -> dict:
+        """Totals per tag with the p50/p95 total tokens per completion."""
+        return {tag: {**totals, **self.percentiles(tag)} for tag, totals in self.totals_by("tag").items()}
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_cost_ledger() -> CostLedger:
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = CostLedger()
+            atexit.register(_ledger.close)
+    return _ledger
+
+
 def _env_price_key(model: str, kind: str) -> str:
     # kind: "INPUT" | "OUTPUT"
     return f"OPENAI_PRICE_{model.replace('-', '_').upper()}_{kind.upper()}"
@@ -47,27 +186,40 @@ def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> dic
     }
 
 
-def record_chat_completion_cost(resp, model: str, tag: str = "") -> dict:
+def record_chat_completion_cost(resp, model: str, tag: str = "", ID=None) -> dict:
     """
-    Extract usage from a v1 chat completion response and append to Outputs/costs.log.
+    Extract usage from a v1 chat completion response and record it in the cost ledger,
+    attributed to the gene set ID (by default the one of gene_set_context()).
+    Responses served from the completion cache are logged with zero cost.
     Returns the computed dict with tokens and costs for convenience.
     """
     usage = getattr(resp, "usage", None)
     prompt_tokens = getattr(usage, "prompt_tokens", 0) if usage else 0
     completion_tokens = getattr(usage, "completion_tokens", 0) if usage else 0
     info = estimate_cost(model, prompt_tokens, completion_tokens)
+    # Completions replayed from the completion cache cost nothing
+    cached = bool(getattr(resp, "cached", False))
+    if cached:
+        info.update(prompt_cost=0.0, completion_cost=0.0, total_cost=0.0)
 
-    os.makedirs("Outputs", exist_ok=True)
     entry = {
         "ts": datetime.utcnow().isoformat() + "Z",
+        "run": RUN_ID,
+        "gene_set": str(ID) if ID is not None else current_gene_set.get(),
         "model": model,
         "tag": tag,
+        "cached": cached,
         **info,
+        "billed_tokens": 0 if cached else info["total_tokens"],
     }
-    try:
-        with open("Outputs/costs.log", "a") as f:
-            f.write(json.dumps(entry) + "\n")
-    except Exception:
-        # Non-fatal if logging fails
-        pass
+    get_cost_ledger().record(entry)
     return entry
+
+
+def add_usage(usage: dict, info: dict) -> dict:
+    """Add the tokens and cost of one recorded completion to a running usage dict."""
+    usage["calls"] = usage.get("calls", 0) + 1
+    usage["cached"] = usage.get("cached", 0) + int(info.get("cached", False))
+    for key in ("prompt_tokens", "completion_tokens", "billed_tokens", "total_cost"):
+        usage[key] = usage.get(key, 0) + info.get(key, 0)
+    return usage
@@ -0,0 +1,64 @@
+import os
+import pandas as pd
+
+from geneset import parse_genes, GeneSetMatrix
+
+# Column names used by the bundled datasets for the gene set identifier and its reference name.
+ID_COLUMNS = ["ID", "GO", "NEST ID"]
+NAME_COLUMNS = ["Name", "Term_Description", "name_new"]
+
+
+def read_dataset(path: str) -> pd.DataFrame:
+    sep = "\t" if os.path.splitext(path)[1] == ".tsv" else ","
+    return pd.read_csv(path, sep=sep, header=0, index_col=None)
+
+
+def _find_column(data: pd.DataFrame, candidates: list, path: str) -> str:
+    for column in candidates:
+        if column in data.columns:
+            return column
+    raise ValueError(f"{path} has none of the columns {candidates}")
+
+
+def load_gene_sets(path: str) -> list:
+    """
+    Return the (ID, genes) pairs of a dataset in file order.
+    Works for the csv/tsv layouts under Datasets/.
+    """
+    data = read_dataset(path)
+    id_column = _find_column(data, ID_COLUMNS, path)
+    return [(str(ID), genes) for ID, genes in zip(data[id_column], data["Genes"])]
+
+
+def load_reference_names(path: str) -> list:
+    """Return the (ID, reference name) pairs of a dataset in file order."""
+    data = read_dataset(path)
+    id_column = _find_column(data, ID_COLUMNS, path)
+    name_column = _find_column(data, NAME_COLUMNS, path)
+    return [(str(ID), str(name)) for ID, name in zip(data[id_column], data[name_column])]
+
+
+def load_term_library(path: str) -> list:
+    """
+    Return the (native, name, genes) terms of a dataset file or a GMT file
+    (one term per line: name, description, genes, tab separated). Weighted GMT genes
+    ("GENE,1.0") keep only their symbol.
+    """
+    if os.path.splitext(path)[1] == ".gmt":
+        terms = []
+        with open(path, "r") as f:
+            for line in f:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) > 2:
+                    terms.append((fields[0], fields[0], parse_genes([field.split(",")[0] for field in fields[2:]])))
+        return terms
+    data = read_dataset(path)
+    id_column = _find_column(data, ID_COLUMNS, path)
+    name_column = _find_column(data, NAME_COLUMNS, path)
+    return [(str(ID), name, parse_genes(genes)) for ID, name, genes in zip(data[id_column], data[name_column], data["Genes"])]
+
+
+def load_gene_set_matrix(path: str):
+    """Return the IDs of a dataset and its gene sets as a GeneSetMatrix over the shared gene index."""
+    gene_sets = load_gene_sets(path)
+    return [ID for ID, _ in gene_sets], GeneSetMatrix([parse_genes(genes) for _, genes in gene_sets])
@@ -0,0 +1,149 @@
+import os
+import threading
+
+import numpy as np
+
+from geneset import GeneSet, GeneSetMatrix
+
+# Configuration through environment variables:
+#   GENEAGENT_ENRICHMENT_LIBRARIES   term libraries separated by os.pathsep; dataset csv/tsv files
+#                                    under Datasets/ or GMT files. Each file is tested as its own source.
+# There is no default library: a library that contains the gene sets being evaluated returns
+# their reference names as the top hits, so the libraries must be named explicitly.
+SOURCE_NAMES = {"GO_terms": "GO:BP", "MsigDB": "MSigDB", "NeST": "NeST"}
+
+
+def hypergeom_sf(x, N, K, n):
+    """
+    P(X >= x) for X ~ Hypergeometric(N, K, n), vectorized over the arrays x (overlaps),
+    K (term sizes) and n (query sizes, or one scalar) for one universe size N.
+    This is the one-sided Fisher exact test used by g:Profiler and Enrichr.
+    """
+    x = np.asarray(x, dtype=np.int64)
+    K = np.asarray(K, dtype=np.int64)
+    n = np.broadcast_to(np.asarray(n, dtype=np.int64), x.shape)
+    if x.size == 0:
+        return np.zeros(0)
+    log_factorial = np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, N + 1)))))
+    # bound the memory of the (tests x tail length) work arrays
+    chunk = 20000
+    if x.size > chunk:
+        return np.concatenate([hypergeom_sf(x[i:i + chunk], N, K[i:i + chunk], n[i:i + chunk]) for i in range(0, x.size, chunk)])
+
+    def log_choose(a, b):
+        return log_factorial[a] - log_factorial[b] - log_factorial[a - b]
+
+    k_max = np.minimum(K, n)
+    width = int(max(1, (k_max - x).max() + 1))
+    k = x[:, None] + np.arange(width)[None, :]
+    valid = (k <= k_max[:, None]) & (n[:, None] - k <= N - K[:, None])
+    k = np.where(valid, k, x[:, None])
+    log_p = log_choose(K[:, None], k) + log_choose(N - K[:, None], n[:, None] - k) - log_choose(N, n)[:, None]
+    return np.clip(np.where(valid, np.exp(log_p), 0.0).sum(axis=1), 0.0, 1.0)
+
+
+def benjamini_hochberg(p_values, m):
+    """Adjusted p-values for p_values taken out of m tests (the untested ones have p = 1)."""
+    p_values = np.asarray(p_values, dtype=float)
+    if p_values.size == 0:
+        return p_values
+    order = np.argsort(p_values)
+    ranked = p_values[order] * m / np.arange(1, p_values.size + 1)
+    adjusted = np.minimum.accumulate(ranked[::-1])[::-1]
+    result = np.empty_like(adjusted)
+    result[order] = np.minimum(adjusted, 1.0)
+    return result
+
+
+class TermLibrary:
+    """
+    Terms of one source as a sparse term x gene incidence matrix over the shared gene index.
+    The universe is the union of the genes of all terms in the source.
+    """
+
+    def __init__(self, source: str, terms: list):
+        self.source = source
+        self.natives = [native for native, _, _ in terms]
+        self.names = [name for _, name, _ in terms]
+        self.matrix = GeneSetMatrix([genes for _, _, genes in terms])
+
+    @classmethod
+    def from_file(cls, path: str):
+        # pandas is only needed once a library is loaded, not when the tool module is imported
+        from dataset import load_term_library
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return cls(SOURCE_NAMES.get(stem, stem), load_term_library(path))
+
+    @property
+    def universe_size(self) -> int:
+        return int(self.matrix.universe.size)
+
+    def query(self, gene_list) -> GeneSet:
+        """Query genes restricted to the universe of this source."""
+        query = GeneSet.from_genes(gene_list, add=False)
+        return GeneSet(np.intersect1d(query.ids, self.matrix.universe, assume_unique=True))
+
+    def enrich(self, gene_list) -> list:
+        query = self.query(gene_list)
+        overlaps = self.matrix.overlaps(query)
+        tested = np.flatnonzero(overlaps)
+        p_values = hypergeom_sf(overlaps[tested], self.universe_size, self.matrix.sizes[tested], len(query))
+        adjusted = benjamini_hochberg(p_values, len(self.natives))
+
+        results = []
+        for term, p_value, p_adjusted in zip(tested, p_values, adjusted):
+            members = self.matrix.members(term)
+            results.append({
+                "native": self.natives[term],
+                "name": self.names[term],
+                "source": self.source,
+                "p_value": float(p_adjusted),
+                "raw_p_value": float(p_value),
+                "term_size": int(self.matrix.sizes[term]),
+                "query_size": len(query),
+                "intersection_size": int(overlaps[term]),
+                "effective_domain_size": self.universe_size,
+                "intersections": self.matrix.index.decode(np.intersect1d(members, query.ids, assume_unique=True)),
+            })
+        return results
+
+    def p_value_matrix(self, gene_sets: GeneSetMatrix) -> np.ndarray:
+        """
+        Raw p-values of every gene set (rows) against every term (columns) in one vectorized pass,
+        e.g. to match all 1000 GO gene sets against a library. Pairs without overlap get p = 1.
+        """
+        in_universe = np.isin(gene_sets.indices, self.matrix.universe)
+        query_sizes = np.bincount(np.repeat(np.arange(len(gene_sets)), gene_sets.sizes)[in_universe], minlength=len(gene_sets))
+        overlaps = self.matrix.overlap_matrix(gene_sets)
+        rows, columns = np.nonzero(overlaps)
+        p_values = np.ones(overlaps.shape)
+        p_values[rows, columns] = hypergeom_sf(overlaps[rows, columns], self.universe_size, self.matrix.sizes[columns], query_sizes[rows])
+        return p_values
+
+
+class EnrichmentEngine:
+    """Term libraries loaded once per process and scored locally without network access."""
+
+    def __init__(self, paths: list):
+        self.libraries = [TermLibrary.from_file(path) for path in paths]
+
+    def enrich(self, gene_list: list, threshold: float = 0.05) -> list:
+        results = []
+        for library in self.libraries:
+            results.extend(result for result in library.enrich(gene_list) if result["p_value"] <= threshold)
+        return sorted(results, key=lambda result: (result["p_value"], -result["intersection_size"]))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_enrichment_engine() -> EnrichmentEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            paths = [path for path in os.getenv("GENEAGENT_ENRICHMENT_LIBRARIES", "").split(os.pathsep) if path]
+            if not paths:
+                raise ValueError("No term libraries configured for the offline enrichment; set GENEAGENT_ENRICHMENT_LIBRARIES")
+            _engine = EnrichmentEngine(paths)
+    return _engine
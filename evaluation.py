@@ -0,0 +1,535 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import atexit
+import hashlib
+import argparse
+import threading
+from collections import Counter
+
+import numpy as np
+
+try:
+    from rouge_score import rouge_scorer
+except ImportError:
+    rouge_scorer = None
+
+# Configuration through environment variables:
+#   GENEAGENT_ENCODER            encoder checkpoint, a local directory or a hub name (default ncbi/MedCPT-Query-Encoder)
+#   GENEAGENT_ENCODER_POOLING    "cls" (default, as MedCPT and SapBERT) or "mean"
+#   GENEAGENT_EMBEDDING_CACHE    directory caching the embeddings (default Outputs/cache/embeddings, off disables it)
+#   GENEAGENT_EMBEDDING_BATCH    texts encoded per forward pass (default 64)
+DEFAULT_ENCODER = "ncbi/MedCPT-Query-Encoder"
+DEFAULT_CACHE = "Outputs/cache/embeddings"
+MAX_LENGTH = 64
+ROUGE_METRICS = ["rouge1", "rouge2", "rougeL"]
+# Embeddings buffered before a cache shard is written, and shard count above which the shards are merged.
+SHARD_ROWS = 4096
+MAX_SHARDS = 16
+
+
+def clean_name(name: str) -> str:
+    """Normalize a process name as evaluate.ipynb does: drop parentheses and separators."""
+    name = re.sub(r"\([^)]*\)", "", name)
+    return name.replace("/", " ").replace(",", " ").replace("\"", "").replace("-", " ").strip()
+
+
+def process_name(text: str):
+    """The process name of a response starting with "Process: <name>", or None."""
+    first = (text or "").strip().split("\n")[0]
+    if ": " not in first:
+        return None
+    return clean_name(first.split(": ", 1)[1]) or None
+
+
+def _rouge_tokens(text: str) -> list:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def _f_measure(overlap: int, reference: int, hypothesis: int) -> float:
+    if not overlap:
+        return 0.0
+    precision, recall = overlap / hypothesis, overlap / reference
+    return 2 * precision * recall / (precision + recall)
+
+
+def _lcs(a: list, b: list) -> int:
+    row = [0] * (len(b) + 1)
+    for x in a:
+        previous = 0
+        for j, y in enumerate(b):
+            current = row[j + 1]
+            row[j + 1] = previous + 1 if x == y else max(row[j + 1], row[j])
+            previous = current
+    return row[-1]
+
+
+def _builtin_rouge(reference: str, hypothesis: str) -> dict:
+    """ROUGE-1, ROUGE-2 and ROUGE-L F-measures on rouge_score's tokens, without stemming."""
+    ref, hyp = _rouge_tokens(reference), _rouge_tokens(hypothesis)
+    scores = {}
+    for n, metric in ((1, "rouge1"), (2, "rouge2")):
+        ref_ngrams = Counter(zip(*[ref[i:] for i in range(n)]))
+        hyp_ngrams = Counter(zip(*[hyp[i:] for i in range(n)]))
+        overlap = sum((ref_ngrams & hyp_ngrams).values())
+        scores[metric] = _f_measure(overlap, sum(ref_ngrams.values()), sum(hyp_ngrams.values()))
+    scores["rougeL"] = _f_measure(_lcs(ref, hyp), len(ref), len(hyp))
+    return scores
+
+
+_scorer = rouge_scorer.RougeScorer(ROUGE_METRICS, use_stemmer=True) if rouge_scorer is not None else None
+
+
+def rouge_scores(reference: str, hypothesis: str, builtin: bool = False) -> dict:
+    """
+    ROUGE F-measures as in evaluate.ipynb (rouge_score with stemming). The builtin version does not stem,
+    so its numbers are not comparable to published ones; it is only used when rouge_score is missing and
+    `builtin` allows it.
+    """
+    if _scorer is None:
+        if not builtin:
+            raise ImportError("ROUGE needs rouge_score (pip install rouge-score); pass --builtin-rouge to use the builtin ROUGE without stemming")
+        return _builtin_rouge(reference, hypothesis)
+    return {metric: score.fmeasure for metric, score in _scorer.score(reference, hypothesis).items()}
+
+
+def text_key(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Embeddings on disk, keyed by text hash. New embeddings are buffered and written as one shard,
+    a float32 .npy matrix and the list of its keys, once `shard_rows` are pending and on flush()
+    (at exit at the latest). Shards are opened memory-mapped, so loading the cache only reads the
+    keys, and once there are more than `max_shards` they are merged into one. Shards are never
+    rewritten, so several processes can share the directory; a shard counts once its keys file exists.
+    """
+
+    def __init__(self, directory: str, shard_rows: int = SHARD_ROWS, max_shards: int = MAX_SHARDS):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.shard_rows = shard_rows
+        self.max_shards = max_shards
+        self.lock = threading.Lock()
+        self.index = {}
+        self.shards = set()
+        self.pending = []
+        self.refresh()
+        if len(self.shards) > self.max_shards:
+            self.compact()
+        atexit.register(self.flush)
+
+    def refresh(self):
+        """Open the shards written since the last refresh, e.g. by another process."""
+        with self.lock:
+            for keys_path in sorted(glob.glob(os.path.join(self.directory, "*.keys.json"))):
+                shard = keys_path[:-len(".keys.json")]
+                if shard in self.shards:
+                    continue
+                try:
+                    with open(keys_path, "r") as f:
+                        keys = json.load(f)
+                    matrix = np.load(shard + ".npy", mmap_mode="r")
+                except (OSError, ValueError):
+                    # merged into a larger shard by another process meanwhile
+                    continue
+                for row, key in enumerate(keys):
+                    self.index[key] = (matrix, row)
+                self.shards.add(shard)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get_many(self, keys) -> dict:
+        with self.lock:
+            found = {key: self.index[key] for key in keys if key in self.index}
+        return {key: np.asarray(matrix[row]) for key, (matrix, row) in found.items()}
+
+    def put_many(self, keys: list, vectors: np.ndarray):
+        if not keys:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self.lock:
+            for row, key in enumerate(keys):
+                self.index[key] = (vectors, row)
+            self.pending.append((keys, vectors))
+            if sum(len(keys) for keys, _ in self.pending) < self.shard_rows:
+                return
+        self.flush()
+
+    def _write_shard(self, keys: list, vectors: np.ndarray):
+        """Write one shard and point the index at its memory-mapped rows; call with the lock held."""
+        shard = os.path.join(self.directory, f"{time.time_ns()}-{os.getpid()}-{threading.get_ident()}")
+        np.save(shard + ".npy", vectors)
+        tmp_path = shard + ".keys.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(keys, f)
+        os.replace(tmp_path, shard + ".keys.json")
+        matrix = np.load(shard + ".npy", mmap_mode="r")
+        for row, key in enumerate(keys):
+            self.index[key] = (matrix, row)
+        self.shards.add(shard)
+
+    def flush(self):
+        """Write the buffered embeddings as one shard, and merge the shards once there are too many."""
+        with self.lock:
+            if self.pending:
+                keys = [key for keys, _ in self.pending for key in keys]
+                self._write_shard(keys, np.concatenate([vectors for _, vectors in self.pending]))
+                self.pending = []
+        if len(self.shards) > self.max_shards:
+            self.compact()
+
+    def compact(self):
+        """Merge every shard this process has opened into one and delete the old shard files."""
+        with self.lock:
+            old = set(self.shards)
+            pending = {key for keys, _ in self.pending for key in keys}
+            keys = [key for key in self.index if key not in pending]
+            if len(old) < 2 or not keys:
+                return
+            self._write_shard(keys, np.stack([self.index[key][0][self.index[key][1]] for key in keys]))
+            for shard in old:
+                # the keys file goes first, so that no process opens a shard whose matrix is gone;
+                # processes that have it memory-mapped keep reading it until they close it
+                for path in (shard + ".keys.json", shard + ".npy"):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            self.shards -= old
+
+
+class Encoder:
+    """
+    Hugging Face encoder run on CPU, loaded on first use. Texts are sorted by length before
+    batching so that padding stays small, and the embeddings are returned L2-normalized,
+    so cosine similarities are plain dot products.
+    """
+
+    def __init__(self, checkpoint: str = DEFAULT_ENCODER, pooling: str = "cls", batch_size: int = 64, max_length: int = MAX_LENGTH):
+        self.checkpoint = checkpoint
+        self.pooling = pooling
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.lock = threading.Lock()
+        self.model = None
+        self.tokenizer = None
+
+    @property
+    def name(self) -> str:
+        """Identifies the checkpoint and settings in the cache directory."""
+        source = os.path.abspath(self.checkpoint) if os.path.isdir(self.checkpoint) else self.checkpoint
+        digest = hashlib.blake2b(source.encode("utf-8"), digest_size=4).hexdigest()
+        return f"{os.path.basename(self.checkpoint.rstrip('/'))}-{self.pooling}-{self.max_length}-{digest}"
+
+    def _load(self):
+        with self.lock:
+            if self.model is None:
+                try:
+                    from transformers import AutoTokenizer, AutoModel
+                except ImportError:
+                    raise ImportError("The embedding evaluation needs torch and transformers: pip install torch transformers")
+                self.tokenizer = AutoTokenizer.from_pretrained(self.checkpoint)
+                self.model = AutoModel.from_pretrained(self.checkpoint).to("cpu").eval()
+
+    def encode(self, texts: list) -> np.ndarray:
+        import torch
+        self._load()
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = None
+        with torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                encoded = self.tokenizer([texts[i] for i in batch], truncation=True, padding=True,
+                                         return_tensors="pt", max_length=self.max_length)
+                hidden = self.model(**encoded).last_hidden_state
+                if self.pooling == "mean":
+                    mask = encoded["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+                    pooled = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1)
+                else:
+                    pooled = hidden[:, 0, :]
+                pooled = torch.nn.functional.normalize(pooled, p=2, dim=1).numpy().astype(np.float32)
+                if embeddings is None:
+                    embeddings = np.empty((len(texts), pooled.shape[1]), dtype=np.float32)
+                embeddings[batch] = pooled
+        return embeddings if embeddings is not None else np.empty((0, 0), dtype=np.float32)
+
+
+class Embedder:
+    """Embeds every unique text once, through the cache; `encoder` is anything with name and encode(texts)."""
+
+    def __init__(self, encoder, cache: EmbeddingCache = None):
+        self.encoder = encoder
+        self.cache = cache
+        self.encoded = 0
+
+    def embed(self, texts: list) -> np.ndarray:
+        unique = list(dict.fromkeys(texts))
+        keys = [text_key(text) for text in unique]
+        found = self.cache.get_many(keys) if self.cache is not None else {}
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        if missing:
+            vectors = self.encoder.encode([unique[i] for i in missing])
+            self.encoded += len(missing)
+            for i, vector in zip(missing, vectors):
+                found[keys[i]] = vector
+            if self.cache is not None:
+                self.cache.put_many([keys[i] for i in missing], vectors)
+        if not unique:
+            return np.empty((0, 0), dtype=np.float32)
+        matrix = np.stack([found[key] for key in keys]).astype(np.float32, copy=False)
+        rows = {text: i for i, text in enumerate(unique)}
+        return matrix[[rows[text] for text in texts]]
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> Embedder:
+    """Shared Embedder configured from the environment."""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            encoder = Encoder(os.getenv("GENEAGENT_ENCODER", DEFAULT_ENCODER),
+                              pooling=os.getenv("GENEAGENT_ENCODER_POOLING", "cls"),
+                              batch_size=int(os.getenv("GENEAGENT_EMBEDDING_BATCH", "64")))
+            directory = os.getenv("GENEAGENT_EMBEDDING_CACHE", DEFAULT_CACHE)
+            cache = None if directory.lower() in ("", "0", "off", "none") else EmbeddingCache(os.path.join(directory, encoder.name))
+            _embedder = Embedder(encoder, cache)
+        return _embedder
+
+
+def similarity_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Cosine similarity of every row of a with every row of b, for normalized embeddings."""
+    return a @ b.T
+
+
+def score_systems(references: list, systems: dict, embedder: Embedder = None) -> dict:
+    """
+    Score the process names of several systems against the reference names, all aligned by gene set.
+    Every distinct string is embedded once. Per system, "similarity" is the cosine similarity to
+    the own reference and "relative" the fraction of the distinct references that are less similar
+    to the name than its own (the relative similarity of evaluate.ipynb). Missing names score NaN.
+    """
+    embedder = embedder or get_embedder()
+    reference_names = list(dict.fromkeys(references))
+    names = [name for hypotheses in systems.values() for name in hypotheses if name]
+    texts = list(dict.fromkeys(reference_names + names))
+    embeddings = embedder.embed(texts)
+    rows = {text: i for i, text in enumerate(texts)}
+    reference_matrix = embeddings[[rows[name] for name in reference_names]]
+    reference_columns = np.array([reference_names.index(name) for name in references]) if references else np.empty(0, dtype=int)
+
+    scores = {}
+    for system, hypotheses in systems.items():
+        present = np.array([bool(name) for name in hypotheses], dtype=bool)
+        similarity = np.full(len(hypotheses), np.nan, dtype=np.float32)
+        relative = np.full(len(hypotheses), np.nan, dtype=np.float32)
+        if present.any():
+            hypothesis_matrix = embeddings[[rows[name] for name in hypotheses if name]]
+            matrix = similarity_matrix(hypothesis_matrix, reference_matrix)
+            own = matrix[np.arange(len(matrix)), reference_columns[present]]
+            similarity[present] = own
+            relative[present] = (matrix < own[:, None]).sum(1) / max(1, len(reference_names) - 1)
+        scores[system] = {"similarity": similarity, "relative": relative}
+    return scores
+
+
+def summarize(scores: dict) -> dict:
+    return {
+        system: {metric: {"mean": round(float(np.nanmean(values)), 4) if np.isfinite(values).any() else None,
+                          "missing": int(np.isnan(values).sum())}
+                 for metric, values in metrics.items()}
+        for system, metrics in scores.items()
+    }
+
+
+class StreamingEvaluator:
+    """
+    Scores the gene sets of a results file while the pipeline is still writing it.
+    Each poll() indexes only the records appended since the last one (through ReportStore),
+    scores the process names of the newly finished gene sets against their reference names
+    and updates the running means. Scores are appended to `<results>.scores.jsonl` and read
+    back on restart, so a gene set is scored once per attempt; a later attempt replaces it.
+    `builtin_rouge` allows the builtin ROUGE when rouge_score is not installed.
+    """
+
+    def __init__(self, dataset: str, results_path: str, stages=("baseline", "final"), embedder: Embedder = None,
+                 scores_path: str = None, pipeline: str = "cascade", builtin_rouge: bool = False):
+        from dataset import load_reference_names
+        self.references = {ID: clean_name(name) for ID, name in load_reference_names(dataset)}
+        self.results_path = results_path
+        self.pipeline = pipeline
+        self.stages = list(stages)
+        self.embedder = embedder
+        self.builtin_rouge = builtin_rouge
+        self.scores_path = scores_path or results_path + ".scores.jsonl"
+        self.store = None
+        self.scores = {}
+        # (stage, metric) -> [sum, count] over the latest score of every gene set
+        self.totals = {}
+        if os.path.exists(self.scores_path):
+            from results import read_results
+            for record in read_results(self.scores_path):
+                self._add(record)
+
+    def _add(self, record: dict):
+        for sign, current in ((-1, self.scores.get(record["ID"])), (1, record)):
+            if current is None:
+                continue
+            for stage, metrics in current["stages"].items():
+                for metric, value in metrics.items():
+                    if isinstance(value, (int, float)) and value == value:
+                        total = self.totals.setdefault((stage, metric), [0.0, 0])
+                        total[0] += sign * value
+                        total[1] += sign
+        self.scores[record["ID"]] = record
+
+    def poll(self) -> list:
+        """Score the gene sets finished since the last poll and return their score records."""
+        from results import ReportStore, get_result_sink
+        if not os.path.exists(self.results_path):
+            return []
+        if self.store is None:
+            self.store = ReportStore(self.results_path, self.pipeline)
+        else:
+            self.store.refresh()
+        finished = [(ID, offsets[-1]) for ID, offsets in list(self.store.gene_sets.items())
+                    if self.scores.get(ID, {}).get("offset") != offsets[-1]]
+        if not finished:
+            return []
+
+        records = []
+        for ID, offset in finished:
+            stage_records = self.store.records(ID)
+            texts = {record["stage"]: record["text"] for record in stage_records if record["type"] == "stage" and "text" in record}
+            reference = self.references.get(ID)
+            stages = {}
+            for stage in self.stages:
+                name = process_name(texts.get(stage))
+                stages[stage] = {"name": name, **(rouge_scores(reference, name, self.builtin_rouge) if name and reference else {})}
+            records.append({"ID": ID, "offset": offset, "status": stage_records[-1]["status"], "reference": reference,
+                            "rouge": "rouge_score" if _scorer is not None else "builtin", "stages": stages})
+
+        if self.embedder is not None:
+            pairs = [(record["reference"], metrics) for record in records if record["reference"]
+                     for metrics in record["stages"].values() if metrics["name"]]
+            if pairs:
+                references = self.embedder.embed([reference for reference, _ in pairs])
+                names = self.embedder.embed([metrics["name"] for _, metrics in pairs])
+                for (_, metrics), value in zip(pairs, np.einsum("ij,ij->i", references, names)):
+                    metrics["similarity"] = float(value)
+
+        for record in records:
+            self._add(record)
+        sink = get_result_sink(self.scores_path)
+        sink.write_many(records)
+        sink.flush()
+        return records
+
+    def aggregates(self) -> dict:
+        """Running means per stage and metric over the scored gene sets."""
+        report = {"gene_sets": len(self.scores), "of": len(self.references),
+                  "failed": sum(1 for record in self.scores.values() if record["status"] != "ok")}
+        for (stage, metric), (total, count) in sorted(self.totals.items()):
+            report.setdefault(stage, {})[metric] = round(total / count, 4) if count else None
+        return report
+
+    def follow(self, interval: float = 5.0, until_done: bool = True):
+        """Poll every `interval` seconds and print the running means whenever new gene sets were scored."""
+        while True:
+            new = self.poll()
+            if new:
+                print(f"===Scored {len(new)} new gene sets: {json.dumps(self.aggregates())}===", flush=True)
+            if until_done and self.references and all(ID in self.scores for ID in self.references):
+                return self.aggregates()
+            time.sleep(interval)
+
+
+def read_result_names(path: str, stage: str, pipeline: str = "cascade") -> dict:
+    """{gene set ID: process name} of one stage ("final" or "baseline") of a results file, from the latest attempt of each gene set."""
+    from results import ReportStore
+    store = ReportStore(path, pipeline)
+    names = {}
+    for ID in store.ids():
+        texts = [record["text"] for record in store.records(ID) if record["type"] == "stage" and record["stage"] == stage]
+        names[ID] = process_name(texts[0]) if texts else None
+    return names
+
+
+def read_legacy_names(path: str) -> list:
+    """Process names of a legacy response file (responses separated by "//"), in dataset order."""
+    with open(path, "r") as f:
+        segments = [segment.strip() for segment in f.read().split("//")]
+    return [process_name(segment) for segment in segments if segment]
+
+
+if __name__ == "__main__":
+    # python evaluation.py --dataset Datasets/MsigDB/MsigDB.csv --results Outputs/GeneAgent/Cascade/MsigDB.results.jsonl
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default="Datasets/MsigDB/MsigDB.csv")
+    parser.add_argument("--results", default=None, help="results file of main_cascade.py; scores the baseline and final names")
+    parser.add_argument("--stages", nargs="*", default=["baseline", "final"])
+    parser.add_argument("--legacy", nargs="*", default=[], metavar="NAME=PATH",
+                        help="legacy response files in dataset order, e.g. GPT-4=Outputs/GPT-4/MsigDB_Response_GPT4.txt")
+    parser.add_argument("--output", default=None, help="TSV file receiving the per gene set scores")
+    parser.add_argument("--follow", action="store_true",
+                        help="score the results file while the pipeline writes it, with ROUGE and embedding similarity and running means")
+    parser.add_argument("--interval", type=float, default=5.0, help="seconds between polls of the results file with --follow")
+    parser.add_argument("--no-embeddings", action="store_true", help="with --follow, only compute ROUGE")
+    parser.add_argument("--builtin-rouge", action="store_true",
+                        help="with --follow, use the builtin ROUGE without stemming when rouge_score is not installed; not comparable to published scores")
+    args = parser.parse_args()
+
+    if args.follow:
+        if not args.results:
+            sys.exit("--follow needs --results")
+        if rouge_scorer is None:
+            if not args.builtin_rouge:
+                sys.exit("rouge_score is not installed: pip install rouge-score, or pass --builtin-rouge to use the builtin ROUGE")
+            print("===Warning: rouge_score is not installed, using the builtin ROUGE without stemming; "
+                  "its scores are not comparable to published ones===")
+        evaluator = StreamingEvaluator(args.dataset, args.results, args.stages, None if args.no_embeddings else get_embedder(),
+                                       builtin_rouge=args.builtin_rouge)
+        try:
+            print(f"===Final scores: {json.dumps(evaluator.follow(args.interval), indent=1)}===")
+        except KeyboardInterrupt:
+            print(f"===Scores so far: {json.dumps(evaluator.aggregates(), indent=1)}===")
+        sys.exit(0)
+
+    from dataset import load_reference_names
+    gene_sets = load_reference_names(args.dataset)
+    IDs = [ID for ID, _ in gene_sets]
+    references = [clean_name(name) for _, name in gene_sets]
+    systems = {}
+    if args.results:
+        for stage in args.stages:
+            names = read_result_names(args.results, stage)
+            systems[stage] = [names.get(ID) for ID in IDs]
+    for spec in args.legacy:
+        name, path = spec.split("=", 1)
+        names = read_legacy_names(path)
+        systems[name] = (names + [None] * len(IDs))[:len(IDs)]
+    if not systems:
+        sys.exit("Nothing to score: pass --results and/or --legacy")
+
+    start = time.perf_counter()
+    embedder = get_embedder()
+    scores = score_systems(references, systems, embedder)
+    print(f"===Scored {len(IDs)} gene sets x {len(systems)} systems in {time.perf_counter() - start:.1f}s, "
+          f"{embedder.encoded} texts encoded, {len(embedder.cache) if embedder.cache is not None else 0} cached===")
+    print(json.dumps(summarize(scores), indent=1))
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write("\t".join(["ID", "reference"] + [f"{system}_{column}" for system in systems for column in ("name", "similarity", "relative")]) + "\n")
+            for i, (ID, reference) in enumerate(zip(IDs, references)):
+                cells = [ID, reference]
+                for system, names in systems.items():
+                    cells += [names[i] or "", f"{scores[system]['similarity'][i]:.4f}", f"{scores[system]['relative'][i]:.4f}"]
+                f.write("\t".join(cells) + "\n")
@@ -0,0 +1,181 @@
+import re
+import threading
+
+import numpy as np
+
+GENE_DELIMITERS = re.compile(r"[,/\s]+")
+
+
+def parse_genes(genes) -> list:
+    """Split a gene set string delimited by commas, slashes or whitespace, keeping order and dropping duplicates."""
+    if isinstance(genes, str):
+        genes = GENE_DELIMITERS.split(genes)
+    return list(dict.fromkeys(gene.strip() for gene in genes if gene and gene.strip()))
+
+
+def format_genes(genes, sort: bool = False) -> str:
+    """Gene set as the comma separated string expected by the prompts and tools, e.g. "a,b,c"."""
+    genes = parse_genes(genes)
+    return ",".join(sorted(genes) if sort else genes)
+
+
+class GeneIndex:
+    """Interns gene symbols to consecutive integer IDs."""
+
+    def __init__(self, symbols=()):
+        self.ids = {}
+        self.symbols = []
+        self.lock = threading.Lock()
+        for symbol in symbols:
+            self.intern(symbol)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def intern(self, symbol: str) -> int:
+        ID = self.ids.get(symbol)
+        if ID is None:
+            with self.lock:
+                ID = self.ids.get(symbol)
+                if ID is None:
+                    ID = len(self.symbols)
+                    self.symbols.append(symbol)
+                    self.ids[symbol] = ID
+        return ID
+
+    def encode(self, genes, add: bool = True) -> np.ndarray:
+        """Sorted unique IDs of the genes. Unknown genes are interned, or skipped when add is False."""
+        genes = parse_genes(genes)
+        if add:
+            ids = [self.intern(gene) for gene in genes]
+        else:
+            ids = [self.ids[gene] for gene in genes if gene in self.ids]
+        return np.unique(np.asarray(ids, dtype=np.int32))
+
+    def decode(self, ids) -> list:
+        return [self.symbols[ID] for ID in ids]
+
+
+# Process-wide index shared by the loaders, the enrichment libraries and the caches.
+GENE_INDEX = GeneIndex()
+
+
+class GeneSet:
+    """Immutable gene set stored as a sorted array of interned gene IDs."""
+
+    __slots__ = ("ids", "index")
+
+    def __init__(self, ids: np.ndarray, index: GeneIndex = GENE_INDEX):
+        self.ids = ids
+        self.index = index
+
+    @classmethod
+    def from_genes(cls, genes, index: GeneIndex = GENE_INDEX, add: bool = True):
+        return cls(index.encode(genes, add=add), index)
+
+    def __len__(self) -> int:
+        return int(self.ids.size)
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    def __contains__(self, gene) -> bool:
+        ID = self.index.ids.get(gene)
+        if ID is None:
+            return False
+        position = np.searchsorted(self.ids, ID)
+        return position < self.ids.size and self.ids[position] == ID
+
+    @property
+    def symbols(self) -> list:
+        return self.index.decode(self.ids)
+
+    def key(self) -> str:
+        """Order-insensitive string key, e.g. for caches."""
+        return ",".join(sorted(self.symbols))
+
+    def intersection(self, other: "GeneSet") -> "GeneSet":
+        return GeneSet(np.intersect1d(self.ids, other.ids, assume_unique=True), self.index)
+
+    def overlap(self, other: "GeneSet") -> int:
+        return int(np.intersect1d(self.ids, other.ids, assume_unique=True).size)
+
+    def jaccard(self, other: "GeneSet") -> float:
+        overlap = self.overlap(other)
+        union = len(self) + len(other) - overlap
+        return overlap / union if union else 0.0
+
+    def containment(self, other: "GeneSet") -> float:
+        """Fraction of this set contained in other."""
+        return self.overlap(other) / len(self) if len(self) else 0.0
+
+    def bitset(self, size: int = None) -> np.ndarray:
+        """Packed bitset over the gene IDs of the index (one bit per gene)."""
+        bits = np.zeros(size or len(self.index), dtype=bool)
+        bits[self.ids] = True
+        return np.packbits(bits)
+
+
+def bitset_overlap(a: np.ndarray, b: np.ndarray) -> int:
+    """Number of common genes of two packed bitsets of the same size."""
+    return int(np.unpackbits(np.bitwise_and(a, b)).sum())
+
+
+class GeneSetMatrix:
+    """
+    Collection of gene sets as a sparse set x gene incidence matrix over an index,
+    in CSR (set -> genes) and CSC (gene -> sets) layouts. Overlaps of a query with
+    every set, or of two collections with each other, are computed without Python loops over sets.
+    """
+
+    def __init__(self, gene_sets: list, index: GeneIndex = GENE_INDEX):
+        self.index = index
+        encoded = [index.encode(genes) for genes in gene_sets]
+        self.sizes = np.asarray([ids.size for ids in encoded], dtype=np.int64)
+        self.indptr = np.concatenate(([0], np.cumsum(self.sizes))).astype(np.int64)
+        self.indices = np.concatenate(encoded).astype(np.int64) if encoded else np.zeros(0, dtype=np.int64)
+        rows = np.repeat(np.arange(len(encoded), dtype=np.int64), self.sizes)
+        self.n_genes = len(index)
+        order = np.argsort(self.indices, kind="stable")
+        self.gene_indptr = np.concatenate(([0], np.cumsum(np.bincount(self.indices, minlength=self.n_genes)))).astype(np.int64)
+        self.gene_sets = rows[order]
+        self.universe = np.unique(self.indices)
+
+    def __len__(self) -> int:
+        return int(self.sizes.size)
+
+    def members(self, row: int) -> np.ndarray:
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
+
+    def _postings(self, ids: np.ndarray):
+        """Set rows containing each gene of ids, and the position in ids they belong to."""
+        ids = ids[ids < self.n_genes]
+        starts, ends = self.gene_indptr[ids], self.gene_indptr[ids + 1]
+        counts = ends - starts
+        positions = np.repeat(np.arange(ids.size), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return self.gene_sets[np.repeat(starts, counts) + offsets], positions
+
+    def overlaps(self, query: GeneSet) -> np.ndarray:
+        """Number of query genes in every set."""
+        rows, _ = self._postings(query.ids.astype(np.int64))
+        return np.bincount(rows, minlength=len(self))
+
+    def overlap_matrix(self, other: "GeneSetMatrix") -> np.ndarray:
+        """Dense len(other) x len(self) matrix of overlap sizes."""
+        query_rows = np.repeat(np.arange(len(other), dtype=np.int64), other.sizes)
+        rows, positions = self._postings(other.indices)
+        valid = other.indices < self.n_genes
+        query_rows = query_rows[valid][positions]
+        return np.bincount(query_rows * len(self) + rows, minlength=len(other) * len(self)).reshape(len(other), len(self))
+
+    def jaccard_matrix(self, other: "GeneSetMatrix") -> np.ndarray:
+        overlap = self.overlap_matrix(other)
+        union = other.sizes[:, None] + self.sizes[None, :] - overlap
+        return np.divide(overlap, union, out=np.zeros(overlap.shape), where=union > 0)
+
+    def containment_matrix(self, other: "GeneSetMatrix") -> np.ndarray:
+        """Fraction of every set of other contained in every set of self."""
+        overlap = self.overlap_matrix(other)
+        sizes = other.sizes[:, None].astype(float)
+        return np.divide(overlap, sizes, out=np.zeros(overlap.shape), where=sizes > 0)
@@ -0,0 +1,386 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import argparse
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuration through environment variables:
+#   GENEAGENT_JOBS               SQLite file of the job queue (default Outputs/jobs/jobs.sqlite); put it on a
+#                                filesystem shared by every host that runs workers
+#   GENEAGENT_JOB_LEASE          seconds a worker holds a job before another worker may take it over (default 900);
+#                                running jobs renew their lease every third of it
+#   GENEAGENT_JOB_ATTEMPTS       attempts per job before it is marked failed (default 3)
+#   GENEAGENT_JOBS_JOURNAL       SQLite journal mode (default DELETE, which works over NFS; WAL is faster on one host)
+DEFAULT_PATH = "Outputs/jobs/jobs.sqlite"
+DEFAULT_LEASE = 900
+DEFAULT_ATTEMPTS = 3
+
+# Pipeline variants a job can run, with the pipeline name of their records, the directory of their merged
+# results and their legacy response file ({stem} is the dataset file name; the cascade uses export_legacy).
+VARIANTS = {
+    "cascade": {"pipeline": "cascade", "directory": "Outputs/GeneAgent/Cascade", "legacy": None},
+    "cot": {"pipeline": "cot", "directory": "Outputs/Chain-of-Thought", "legacy": "Outputs/Chain-of-Thought/{stem}_Response_CoT.txt"},
+    "summary": {"pipeline": "summary", "directory": "Outputs/EnrichedTermTest",
+                "legacy": "Outputs/EnrichedTermTest/gpt.geneagent.{lower}.summary.result.verification.txt"},
+}
+
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+
+class Job:
+    __slots__ = ("dataset", "ID", "variant", "position", "genes", "attempts", "owner")
+
+    def __init__(self, dataset, ID, variant, position, genes, attempts, owner):
+        self.dataset = dataset
+        self.ID = ID
+        self.variant = variant
+        self.position = position
+        self.genes = genes
+        self.attempts = attempts
+        self.owner = owner
+
+    @property
+    def key(self) -> tuple:
+        return (self.dataset, self.ID, self.variant)
+
+
+class JobQueue:
+    """
+    One job per (dataset, gene set ID, variant) in a SQLite file. Workers lease the next job in
+    dataset order inside an immediate transaction, so two workers never hold the same job; a lease
+    that runs out (a crashed or stalled worker) makes the job available again. Completion is
+    accepted only from the current holder of the lease. A summary job is only leased once the
+    cascade job of its gene set is done and merged into the cascade results the summary reads.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = DEFAULT_LEASE, max_attempts: int = DEFAULT_ATTEMPTS, journal: str = "DELETE"):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=60, isolation_level=None)
+        with self.lock:
+            self.conn.execute(f"PRAGMA journal_mode={journal}")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "dataset TEXT, ID TEXT, variant TEXT, position INTEGER, genes TEXT, status TEXT, attempts INTEGER, "
+                "owner TEXT, lease_expires REAL, results TEXT, error TEXT, updated REAL, merged INTEGER DEFAULT 0, "
+                "PRIMARY KEY (dataset, ID, variant))"
+            )
+            # queues created before the merged column was added
+            if "merged" not in [column[1] for column in self.conn.execute("PRAGMA table_info(jobs)")]:
+                self.conn.execute("ALTER TABLE jobs ADD COLUMN merged INTEGER DEFAULT 0")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS jobs_next ON jobs (status, variant, dataset, position)")
+
+    @classmethod
+    def from_env(cls, path: str = None):
+        return cls(path or os.getenv("GENEAGENT_JOBS", DEFAULT_PATH),
+                   lease_seconds=float(os.getenv("GENEAGENT_JOB_LEASE", DEFAULT_LEASE)),
+                   max_attempts=int(os.getenv("GENEAGENT_JOB_ATTEMPTS", DEFAULT_ATTEMPTS)),
+                   journal=os.getenv("GENEAGENT_JOBS_JOURNAL", "DELETE"))
+
+    def _transaction(self, statements):
+        """Run statements(conn) inside one immediate transaction and return its result."""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = statements(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, dataset: str, variants) -> int:
+        """Add a job per gene set of the dataset and variant; existing jobs are kept. Returns the number added."""
+        from dataset import load_gene_sets
+        gene_sets = load_gene_sets(dataset)
+        now = time.time()
+        rows = [(dataset, ID, variant, position, genes, PENDING, 0, now)
+                for variant in variants for position, (ID, genes) in enumerate(gene_sets)]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (dataset, ID, variant, position, genes, status, attempts, updated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            return conn.total_changes - before
+        return self._transaction(insert)
+
+    def lease(self, owner: str, variants=None):
+        """
+        Take the next pending or expired job of the variants, in dataset order, or return None.
+        Summary jobs wait until the cascade job of their gene set is merged, so that they do not spend
+        their attempts on a missing cascade results file; gene sets without a cascade job are not held back.
+        """
+        variants = list(variants or VARIANTS)
+        marks = ",".join("?" * len(variants))
+
+        def take(conn):
+            now = time.time()
+            # expired leases that used up their attempts are given up
+            conn.execute(
+                f"UPDATE jobs SET status = ?, error = 'lease expired', updated = ? "
+                f"WHERE status = ? AND lease_expires < ? AND attempts >= ? AND variant IN ({marks})",
+                (FAILED, now, LEASED, now, self.max_attempts, *variants)
+            )
+            row = conn.execute(
+                f"SELECT dataset, ID, variant, position, genes, attempts FROM jobs "
+                f"WHERE (status = ? OR (status = ? AND lease_expires < ?)) AND variant IN ({marks}) "
+                f"AND (variant != 'summary' OR NOT EXISTS ("
+                f"SELECT 1 FROM jobs AS dependency WHERE dependency.dataset = jobs.dataset AND dependency.ID = jobs.ID "
+                f"AND dependency.variant = 'cascade' AND NOT (dependency.status = ? AND dependency.merged))) "
+                f"ORDER BY variant = 'summary', dataset, position LIMIT 1",
+                (PENDING, LEASED, now, *variants, DONE)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, attempts = attempts + 1, lease_expires = ?, updated = ? "
+                "WHERE dataset = ? AND ID = ? AND variant = ?",
+                (LEASED, owner, now + self.lease_seconds, now, *row[:3])
+            )
+            return Job(*row[:5], row[5] + 1, owner)
+        return self._transaction(take)
+
+    def _update_held(self, job: Job, assignments: str, values: tuple) -> bool:
+        def update(conn):
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, updated = ? WHERE dataset = ? AND ID = ? AND variant = ? "
+                f"AND status = ? AND owner = ? AND attempts = ?",
+                (*values, time.time(), *job.key, LEASED, job.owner, job.attempts)
+            )
+            return cursor.rowcount == 1
+        return self._transaction(update)
+
+    def renew(self, job: Job) -> bool:
+        """Extend the lease of a running job; False when the lease was lost to another worker."""
+        return self._update_held(job, "lease_expires = ?", (time.time() + self.lease_seconds,))
+
+    def complete(self, job: Job, results: str) -> bool:
+        """Mark a job done, recording the results file holding its records; it is merged again by the next merge."""
+        return self._update_held(job, "status = ?, results = ?, error = NULL, merged = 0", (DONE, results))
+
+    def fail(self, job: Job, error: str) -> bool:
+        """Release a failed job for another attempt, or mark it failed once its attempts are used up."""
+        status = FAILED if job.attempts >= self.max_attempts else PENDING
+        return self._update_held(job, "status = ?, error = ?", (status, error))
+
+    def retry_failed(self, dataset: str = None) -> int:
+        """Give the failed jobs a new set of attempts."""
+        def reset(conn):
+            query = "UPDATE jobs SET status = ?, attempts = 0, updated = ? WHERE status = ?"
+            params = [PENDING, time.time(), FAILED]
+            if dataset:
+                query += " AND dataset = ?"
+                params.append(dataset)
+            return conn.execute(query, params).rowcount
+        return self._transaction(reset)
+
+    def mark_merged(self, dataset: str, variant: str, IDs: list):
+        """Record the jobs whose records are in the merged results file of their dataset and variant."""
+        def mark(conn):
+            conn.executemany("UPDATE jobs SET merged = 1 WHERE dataset = ? AND ID = ? AND variant = ? AND status = ?",
+                             [(dataset, ID, variant, DONE) for ID in IDs])
+        self._transaction(mark)
+
+    def counts(self) -> dict:
+        """{dataset: {variant: {status: jobs}}}"""
+        with self.lock:
+            rows = self.conn.execute("SELECT dataset, variant, status, COUNT(*) FROM jobs GROUP BY dataset, variant, status").fetchall()
+        report = {}
+        for dataset, variant, status, count in rows:
+            report.setdefault(dataset, {}).setdefault(variant, {})[status] = count
+        return report
+
+    def jobs(self, dataset: str, variant: str) -> list:
+        """(ID, status, results file, error) of the jobs of a dataset and variant in dataset order."""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT ID, status, results, error FROM jobs WHERE dataset = ? AND variant = ? ORDER BY position", (dataset, variant)
+            ).fetchall()
+
+
+def _stem(dataset: str) -> str:
+    return os.path.splitext(os.path.basename(dataset))[0]
+
+
+def merged_path(dataset: str, variant: str) -> str:
+    """Merged results file of a dataset and variant; for the cascade it is the file main_summary.py reads by default."""
+    return os.path.join(VARIANTS[variant]["directory"], _stem(dataset) + ".results.jsonl")
+
+
+def load_pipeline(variant: str, dataset: str, sink):
+    """pipeline(ID, genes) of a variant writing to `sink`; the modules are imported on first use."""
+    if variant == "cascade":
+        from main_cascade import GeneAgent
+        return functools.partial(GeneAgent, sink=sink)
+    if variant == "cot":
+        from main_CoT import ChainOfThought
+        return functools.partial(ChainOfThought, sink=sink)
+    # the summary reads the verified functions of the merged cascade results of the dataset
+    from main_summary import EnrichedTermSummary
+    from results import ReportStore
+    cascade = merged_path(dataset, "cascade")
+    if not os.path.exists(cascade):
+        raise FileNotFoundError(f"{cascade} does not exist; run and merge the cascade jobs of {dataset} first")
+    return functools.partial(EnrichedTermSummary, store=ReportStore(cascade), sink=sink)
+
+
+class Worker:
+    """
+    Leases jobs until the queue has none left for its variants. Each process writes its records to
+    its own results file per dataset and variant (no two hosts append to the same file), and the
+    job row remembers which file holds them for the merge.
+    """
+
+    def __init__(self, queue: JobQueue, variants=None, output: str = "Outputs/jobs/results", name: str = None):
+        self.queue = queue
+        self.variants = list(variants or VARIANTS)
+        self.output = output
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.lock = threading.Lock()
+        self.pipelines = {}
+
+    def _pipeline(self, variant: str, dataset: str):
+        from results import get_result_sink
+        # a new merge replaces the cascade results read by the summary, so its store is opened again
+        cascade = merged_path(dataset, "cascade")
+        version = os.stat(cascade).st_mtime_ns if variant == "summary" and os.path.exists(cascade) else None
+        with self.lock:
+            key = (variant, dataset, version)
+            if key not in self.pipelines:
+                path = os.path.join(self.output, _stem(dataset), variant, f"{self.name}.results.jsonl")
+                self.pipelines[key] = (load_pipeline(variant, dataset, get_result_sink(path)), os.path.abspath(path))
+            return self.pipelines[key]
+
+    def _keep_leased(self, job: Job, done: threading.Event):
+        while not done.wait(self.queue.lease_seconds / 3):
+            if not self.queue.renew(job):
+                print(f"===Lost the lease of {job.key}; another worker may run it again===")
+                return
+
+    def run_one(self, job: Job) -> bool:
+        from runner import _run_pipeline
+        done = threading.Event()
+        threading.Thread(target=self._keep_leased, args=(job, done), daemon=True).start()
+        try:
+            pipeline, results = self._pipeline(job.variant, job.dataset)
+            ok = _run_pipeline(pipeline, job.ID, job.genes)
+            error = None if ok else "the pipeline reported a failure"
+        except Exception as E:
+            ok, error = False, str(E)
+        finally:
+            done.set()
+        if ok:
+            if not self.queue.complete(job, results):
+                print(f"===Finished {job.key} after losing its lease; the results of the current holder are merged===")
+        else:
+            print(f"====Job {job.key} failed (attempt {job.attempts}): {error}====")
+            self.queue.fail(job, error)
+        return ok
+
+    def run(self, max_jobs: int = None) -> int:
+        """Run jobs until none is left (or `max_jobs`); returns the number of jobs run."""
+        count = 0
+        while max_jobs is None or count < max_jobs:
+            job = self.queue.lease(self.name, self.variants)
+            if job is None:
+                break
+            print(f"===Running {job.variant} {job.ID} of {job.dataset} (attempt {job.attempts})===")
+            self.run_one(job)
+            count += 1
+        return count
+
+
+def merge(queue: JobQueue, dataset: str, variant: str, output: str = None) -> dict:
+    """
+    Assemble the records of the finished jobs of a dataset and variant from the worker files into
+    one results file in dataset order. A gene set that was run more than once contributes its
+    latest attempt from the file of the worker that completed the job.
+    """
+    from results import ReportStore
+    output = output or merged_path(dataset, variant)
+    pipeline = VARIANTS[variant]["pipeline"]
+    stores = {}
+    merged, missing = [], []
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    tmp_path = output + ".tmp"
+    with open(tmp_path, "w") as f:
+        for ID, status, results, error in queue.jobs(dataset, variant):
+            if status != DONE or not results or not os.path.exists(results):
+                missing.append(ID)
+                continue
+            if results not in stores:
+                stores[results] = ReportStore(results, pipeline)
+            store = stores[results]
+            if ID not in store:
+                missing.append(ID)
+                continue
+            for record in store.records(ID):
+                f.write(json.dumps(record, default=str) + "\n")
+            merged.append(ID)
+    os.replace(tmp_path, output)
+    # an index of the replaced file would be stale
+    if os.path.exists(f"{output}.{pipeline}.index"):
+        os.remove(f"{output}.{pipeline}.index")
+    # only the default file is read by the summary jobs
+    if os.path.abspath(output) == os.path.abspath(merged_path(dataset, variant)):
+        queue.mark_merged(dataset, variant, merged)
+    return {"output": output, "merged": len(merged), "missing": missing}
+
+
+if __name__ == "__main__":
+    # python jobs.py enqueue --dataset "Datasets/Gene ontology/GO_terms.csv" --variants cascade cot
+    # python jobs.py work --variants cascade --threads 4        (on every host)
+    # python jobs.py merge --dataset "Datasets/Gene ontology/GO_terms.csv" --variant cascade --export-legacy
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["enqueue", "work", "status", "merge", "retry"])
+    parser.add_argument("--queue", default=None, help=f"job queue file (default GENEAGENT_JOBS or {DEFAULT_PATH})")
+    parser.add_argument("--dataset", default=None)
+    parser.add_argument("--variants", nargs="*", default=None, choices=list(VARIANTS))
+    parser.add_argument("--variant", default="cascade", choices=list(VARIANTS), help="variant merged by the merge command")
+    parser.add_argument("--threads", type=int, default=1, help="jobs run at the same time by this worker process")
+    parser.add_argument("--max-jobs", type=int, default=None, help="stop each worker thread after this many jobs")
+    parser.add_argument("--output", default=None, help="work: directory of the worker results files; merge: merged results file")
+    parser.add_argument("--export-legacy", action="store_true", help="merge: also write the legacy text files")
+    args = parser.parse_args()
+
+    queue = JobQueue.from_env(args.queue)
+    if args.command in ("enqueue", "merge") and not args.dataset:
+        sys.exit(f"{args.command} needs --dataset")
+
+    if args.command == "enqueue":
+        print(f"===Added {queue.enqueue(args.dataset, args.variants or ['cascade'])} jobs===")
+    elif args.command == "retry":
+        print(f"===Reset {queue.retry_failed(args.dataset)} failed jobs===")
+    elif args.command == "work":
+        worker = Worker(queue, args.variants, output=args.output or "Outputs/jobs/results")
+        with ThreadPoolExecutor(max_workers=max(1, args.threads)) as executor:
+            ran = sum(executor.map(lambda _: worker.run(args.max_jobs), range(max(1, args.threads))))
+        from results import close_result_sinks
+        close_result_sinks()
+        print(f"===Worker {worker.name} ran {ran} jobs; no job left for {worker.variants}===")
+    elif args.command == "merge":
+        summary = merge(queue, args.dataset, args.variant, args.output)
+        print(f"===Merged {summary['merged']} gene sets into {summary['output']}, {len(summary['missing'])} missing===")
+        if args.export_legacy:
+            from results import export_legacy, export_responses
+            from dataset import load_gene_sets
+            IDs = [ID for ID, _ in load_gene_sets(args.dataset)]
+            if args.variant == "cascade":
+                print(f"===Exported {json.dumps(export_legacy(summary['output'], IDs))} gene sets to the legacy text files===")
+            else:
+                stem = _stem(args.dataset)
+                target = VARIANTS[args.variant]["legacy"].format(stem=stem, lower=stem.lower())
+                export_responses(summary["output"], VARIANTS[args.variant]["pipeline"], IDs, target)
+                print(f"===Responses written to {target}===")
+    print(json.dumps(queue.counts(), indent=1))
@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import functools
+import threading
+
+import tracing
+from ratelimit import get_rate_limiter
+from completion_cache import get_completion_cache, make_key, CompletionCacheMiss, REPLAY, READTHROUGH
+
+# Completion tokens charged up front when a request does not set max_tokens;
+# the difference to the real usage is reconciled after the response.
+EXPECTED_COMPLETION_TOKENS = int(os.getenv("GENEAGENT_EXPECTED_COMPLETION_TOKENS", "512"))
+
+# The OpenAI SDK and tiktoken are imported on first use, so that importing the pipeline
+# modules or a tool module neither loads the SDK nor the BPE tables.
+_client = None
+_client_lock = threading.Lock()
+
+
+def _create_openai_client():
+    from dotenv import load_dotenv
+    load_dotenv()
+    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or os.getenv("AZURE_API_BASE")
+    azure_api_key = os.getenv("AZURE_OPENAI_API_KEY")
+    azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION") or os.getenv("AZURE_API_VERSION")
+    if azure_endpoint and azure_api_key and azure_api_version:
+        try:
+            from openai import AzureOpenAI
+        except ImportError:
+            AzureOpenAI = None
+        if AzureOpenAI is not None:
+            return AzureOpenAI(
+                azure_endpoint=azure_endpoint,
+                api_key=azure_api_key,
+                api_version=azure_api_version,
+            )
+    from openai import OpenAI
+    return OpenAI()
+
+
+def get_client():
+    """OpenAI (or Azure OpenAI) client shared by every module and thread, so all requests use one connection pool."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = _create_openai_client()
+        return _client
+
+
+# GENEAGENT_TOKENIZER=approximate counts tokens with ApproximateEncoding instead of tiktoken,
+# whose BPE files are downloaded on first use; the offline benchmark (bench/) uses it.
+TOKENIZER = os.getenv("GENEAGENT_TOKENIZER", "tiktoken").lower()
+
+
+class ApproximateEncoding:
+    """
+    Offline stand-in for a tiktoken encoding: words are cut into pieces of up to four characters
+    and every other character is a token of its own, which is close to the BPE counts of English text.
+    encode() returns the pieces instead of token ids; decode() joins them back.
+    """
+
+    name = "approximate"
+    PIECE = re.compile(r"\s*(?:\w{1,4}|[^\w\s])|\s+")
+
+    def encode(self, text: str) -> list:
+        return self.PIECE.findall(text)
+
+    def decode(self, tokens: list) -> str:
+        return "".join(tokens)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model: str = "gpt-4o"):
+    if TOKENIZER == "approximate":
+        return ApproximateEncoding()
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def _message_text(message) -> str:
+    if not isinstance(message, dict):
+        message = message.model_dump(exclude_none=True) if hasattr(message, "model_dump") else {"content": str(message)}
+    text = message.get("content") or ""
+    if not isinstance(text, str):
+        text = json.dumps(text)
+    for key in ("function_call", "tool_calls"):
+        if message.get(key):
+            text += json.dumps(message[key], default=str)
+    return text
+
+
+def estimate_prompt_tokens(model: str, messages: list, functions: list = None) -> int:
+    """Approximate prompt tokens of a chat request, including the function schemas."""
+    encoding = get_encoding(model)
+    # every message carries a few tokens of role and separator overhead
+    tokens = sum(len(encoding.encode(_message_text(message))) + 4 for message in messages)
+    if functions:
+        tokens += len(encoding.encode(json.dumps(functions)))
+    return tokens + 3
+
+
+def chat_completion(client, **kwargs):
+    """
+    Create a chat completion, served from the completion cache when it is enabled.
+    Requests that reach the API go through the shared rate limiter.
+    """
+    with tracing.span("chat_completion", "llm", model=kwargs.get("model")) as current:
+        completion = _cached_completion(client, **kwargs)
+        usage = getattr(completion, "usage", None)
+        current.set(cached=bool(getattr(completion, "cached", False)),
+                    prompt_tokens=getattr(usage, "prompt_tokens", 0), completion_tokens=getattr(usage, "completion_tokens", 0))
+        return completion
+
+
+def _cached_completion(client, **kwargs):
+    cache = get_completion_cache()
+    if cache is None:
+        return _rate_limited_completion(client, **kwargs)
+
+    key = make_key(kwargs)
+    if cache.mode in (REPLAY, READTHROUGH):
+        response = cache.get(key)
+        if response is not None:
+            from openai.types.chat import ChatCompletion
+            # cached completions are marked so that no cost is recorded for them
+            return ChatCompletion.model_validate({**response, "cached": True})
+        if cache.mode == REPLAY:
+            raise CompletionCacheMiss(f"No cached completion for request {key} in replay mode")
+    completion = _rate_limited_completion(client, **kwargs)
+    cache.put(key, completion.model_dump(exclude_unset=True))
+    return completion
+
+
+def _rate_limited_completion(client, **kwargs):
+    """
+    The estimated prompt and completion tokens are charged before the request
+    and reconciled against the usage reported in the response.
+    """
+    limiter = get_rate_limiter()
+    if limiter is None:
+        return client.chat.completions.create(**kwargs)
+
+    model = kwargs.get("model", "gpt-4o")
+    estimated = estimate_prompt_tokens(model, kwargs.get("messages", []), kwargs.get("functions") or kwargs.get("tools"))
+    estimated += kwargs.get("max_tokens") or EXPECTED_COMPLETION_TOKENS
+    with tracing.span("rate_limit", "wait", tokens=estimated):
+        charged = limiter.acquire(estimated)
+    try:
+        completion = client.chat.completions.create(**kwargs)
+    except Exception:
+        limiter.reconcile(charged, 0)
+        raise
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        limiter.reconcile(charged, getattr(usage, "total_tokens", 0) or 0)
+    return completion
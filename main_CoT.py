@@ -1,75 +1,97 @@
 import json
 import time
-import pandas as pd
+import argparse
+import functools
 
-from openai import OpenAI
-try:
-    from openai import AzureOpenAI
-except Exception:
-    AzureOpenAI = None
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from costs import record_chat_completion_cost
-
-def _create_openai_client():
-    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or os.getenv("AZURE_API_BASE")
-    azure_api_key = os.getenv("AZURE_OPENAI_API_KEY")
-    azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION") or os.getenv("AZURE_API_VERSION")
-    if azure_endpoint and azure_api_key and azure_api_version and AzureOpenAI is not None:
-        return AzureOpenAI(
-            azure_endpoint=azure_endpoint,
-            api_key=azure_api_key,
-            api_version=azure_api_version,
-        )
-    return OpenAI()
-
-client = _create_openai_client()
+from costs import record_chat_completion_cost, add_usage
+from llm import chat_completion, get_client
 
 from worker import AgentPhD
 from topic import topic_verification
+from geneset import format_genes
+from dataset import load_gene_sets
+from runner import run_dataset
+from results import get_result_sink, export_responses
 
-if __name__ == "__main__":
-    
-    ## baseline 
-    system = "You are an efficient and insightful assistant to a molecular biologist."
-    task = lambda genes: f"Your task is to propose a biological process term for gene sets. Here is the gene set: {genes}"
-    chain = f"""
-    Let do the task step-by-step:
-    Step1, write a cirtical analysis for gene functions. For each important point, discribe your reasoning and supporting information.
-    Step2, analyze the functional associations among different genes from the critical analysis.
-    Step3, summarize a brief name for the most significant biological process of gene set from the functional associations. 
-    """
-    instruction = """
-    Put the name at the top of analysis as "Process: <name>" and follow the analysis.
-    Be concise, do not use unnecessary words.
-    Be specific, avoid overly general statements such as "the proteins are involved in various cellular processes".
-    Be factual, do not editorialize.
-    """
-    
-    data = pd.read_csv("Datasets/MsigDB/MsigDB.csv", header=0, index_col=None)
-    for genes in data["Genes"]:
-        genes = genes.replace(" ",",")
+## baseline 
+system = "You are an efficient and insightful assistant to a molecular biologist."
+task = lambda genes: f"Your task is to propose a biological process term for gene sets. Here is the gene set: {genes}"
+chain = f"""
+Let do the task step-by-step:
+Step1, write a cirtical analysis for gene functions. For each important point, discribe your reasoning and supporting information.
+Step2, analyze the functional associations among different genes from the critical analysis.
+Step3, summarize a brief name for the most significant biological process of gene set from the functional associations. 
+"""
+instruction = """
+Put the name at the top of analysis as "Process: <name>" and follow the analysis.
+Be concise, do not use unnecessary words.
+Be specific, avoid overly general statements such as "the proteins are involved in various cellular processes".
+Be factual, do not editorialize.
+"""
+
+def ChainOfThought(ID, genes, sink=None):
+    """Name one gene set with the chain-of-thought prompt and write its "cot" records to the results sink."""
+    sink = sink or get_result_sink()
+    started = time.perf_counter()
+    genes = format_genes(genes)
+    records = []
+    usage = {}
+    try:
         ## send genes to GPT-4 and generate the original template of process name and analysis
         prompt_baseline = task(genes) + chain + instruction
         messages = [
             {"role":"system", "content":system},
             {"role":"user", "content":prompt_baseline}
         ]
-        summary = client.chat.completions.create(
-			model="gpt-4o",
-			messages=messages,
-			temperature=0.0,
-		)
-        messages.append(summary.choices[0].message)
+        summary = chat_completion(get_client(),
+            model="gpt-4o",
+            messages=messages,
+            temperature=0.0,
+        )
         cost_info = record_chat_completion_cost(summary, "gpt-4o", tag="cot_summary")
         print(f"$ Cost CoT: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
+        usage = add_usage({}, cost_info)
         summary = summary.choices[0].message.content
-        with open("Outputs/Chain-of-Thought/MsigDB_Response_CoT.txt","a") as f_update:
-            f_update.write(summary+"\n")
-            f_update.write("//\n")
+        records.append({"type": "stage", "pipeline": "cot", "ID": str(ID), "stage": "summary", "text": summary,
+                        "seconds": time.perf_counter() - started, "usage": usage})
         print("=====Summary=====")
         print(summary)
-        
-        
+        status, error = "ok", None
+    except Exception as E:
+        print(f"====There are an error {E} here.====")
+        status, error = "error", str(E)
+
+    records.append({"type": "gene_set", "pipeline": "cot", "ID": str(ID), "genes": genes, "status": status, "error": error,
+                    "seconds": time.perf_counter() - started, "usage": usage})
+    sink.write_many(records)
+    sink.flush()
+    return status == "ok"
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default="Datasets/MsigDB/MsigDB.csv")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("GENEAGENT_WORKERS", "1")))
+    parser.add_argument("--progress", default=None,
+                        help="file recording the finished gene set IDs; defaults to Outputs/Chain-of-Thought/<dataset>.progress")
+    parser.add_argument("--results", default=None,
+                        help="JSONL results file; defaults to Outputs/Chain-of-Thought/<dataset>.results.jsonl")
+    args = parser.parse_args()
+
+    stem = os.path.splitext(os.path.basename(args.dataset))[0]
+    progress = args.progress or os.path.join("Outputs/Chain-of-Thought", stem + ".progress")
+    results = args.results or os.path.join("Outputs/Chain-of-Thought", stem + ".results.jsonl")
+    gene_sets = load_gene_sets(args.dataset)
+    sink = get_result_sink(results)
+    summary = run_dataset(functools.partial(ChainOfThought, sink=sink), gene_sets, progress, workers=args.workers)
+    sink.close()
+    print(f"===Succeeded: {summary['succeeded']}, failed: {len(summary['failed'])}===")
+    # the responses in dataset order, in the "//" separated format read by evaluate.ipynb
+    target = os.path.join("Outputs/Chain-of-Thought", stem + "_Response_CoT.txt")
+    export_responses(results, "cot", [ID for ID, _ in gene_sets], target)
+    print(f"===Responses written to {target}===")
@@ -1,39 +1,28 @@
 import json
 import re
 import time
-from turtle import up
-import pandas as pd
-from tqdm import tqdm
+import argparse
+import functools
 from dotenv import load_dotenv
 import os
-from openai import OpenAI
-try:
-    from openai import AzureOpenAI
-except Exception:
-    AzureOpenAI = None
-from costs import record_chat_completion_cost
+from costs import record_chat_completion_cost, add_usage, get_cost_ledger
+from llm import chat_completion, get_client, get_encoding
 
 load_dotenv()
 
-def _create_openai_client():
-    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or os.getenv("AZURE_API_BASE")
-    azure_api_key = os.getenv("AZURE_OPENAI_API_KEY")
-    azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION") or os.getenv("AZURE_API_VERSION")
-    if azure_endpoint and azure_api_key and azure_api_version and AzureOpenAI is not None:
-        return AzureOpenAI(
-            azure_endpoint=azure_endpoint,
-            api_key=azure_api_key,
-            api_version=azure_api_version,
-        )
-    return OpenAI()
-
-client = _create_openai_client()
-
 from worker import AgentPhD
+from dataset import load_gene_sets
+from geneset import format_genes
+from runner import run_dataset
+from apis.cache import get_tool_cache
+from apis.projections import projection_stats
+from claim_memo import get_claim_memo
+from budgets import exhausted_budget
+import tracing
+from prefetch import prefetch_gene_set, cancel_prefetch
+from results import get_result_sink, export_legacy
 
-import tiktoken
 MAX_TOKENS = 127900
-encoding = tiktoken.encoding_for_model("gpt-4o")
 
 ## baseline 
 system = "You are an efficient and insightful assistant to a molecular biologist."
@@ -118,43 +107,68 @@ reposits = [
     "get_pathway_for_gene_set",
     "get_interactions_for_gene_set",
     "get_gene_summary_for_single_gene",
+    "get_gene_summary_for_gene_set",
     "get_pubmed_articles"
 ]
+# the offline enrichment tool is opt-in and only offered once its term libraries are named explicitly
+if os.getenv("GENEAGENT_ENRICHMENT_LIBRARIES"):
+    reposits.append("get_local_enrichment_for_gene_set")
 
 
 agentphd = AgentPhD(function_names=reposits)
 
-def GeneAgent(ID, genes):    
-    genes = genes.replace("/",",").replace(" ",",")
+def clean_claim(claim, pattern):
+    if not re.match(pattern, claim):
+        claim = re.sub(r'[^a-zA-Z0-9,.;?!*()_-]+$', "_", claim)
+    return claim
+
+class BudgetExhausted(Exception):
+    pass
+
+def stage_record(ID, stage, start, cost_info, **fields):
+    return {"type": "stage", "pipeline": "cascade", "ID": str(ID), "stage": stage, **fields,
+            "seconds": time.perf_counter() - start, "usage": add_usage({}, cost_info)}
+
+def claim_records(ID, stage, claims, results):
+    return [{"type": "claim", "pipeline": "cascade", "ID": str(ID), "stage": stage, "index": index, "claim": claim, **result}
+            for index, (claim, result) in enumerate(zip(claims, results))]
+
+def GeneAgent(ID, genes, sink=None):
+    sink = sink or get_result_sink()
+    started = time.perf_counter()
+    genes = format_genes(genes)
+    # warm the tool cache while the baseline summary is generated
+    prefetched = prefetch_gene_set(genes, reposits)
     
     pattern = re.compile(r'^[a-zA-Z0-9,.;?!*()_-]+$')
+    # records of this gene set are buffered and written together once it has finished
+    records = []
+    budget = None
     ## send genes to GPT-4 and generate the original template of process name and analysis
     try:
-        # Ensure output directories exist
-        os.makedirs("Outputs/GPT-4", exist_ok=True)
-        os.makedirs("Outputs/GeneAgent/Cascade", exist_ok=True)
-        os.makedirs("Outputs/Verification Reports/Cascade", exist_ok=True)
+        if exhausted_budget(ID=ID) == "run":
+            raise BudgetExhausted("run")
         prompt_baseline = baseline(genes)
         first_step = prompt_baseline + system
-        token_baseline = encoding.encode(first_step)
+        token_baseline = get_encoding("gpt-4o").encode(first_step)
         print(f"=====The prompt tokens input to the generation step is {len(token_baseline)}=====\n")
         messages = [
             {"role":"system", "content":system},
             {"role":"user", "content":prompt_baseline}
         ]
-        summary_resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0,
-        )
+        start = time.perf_counter()
+        with tracing.span("baseline", "stage"):
+            summary_resp = chat_completion(get_client(),
+                model="gpt-4o",
+                messages=messages,
+                temperature=0,
+            )
         messages.append(summary_resp.choices[0].message)
         summary = summary_resp.choices[0].message.content
         cost_info = record_chat_completion_cost(summary_resp, "gpt-4o", tag="baseline_summary")
         print(f"$ Cost baseline: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
 
-        with open("Outputs/GPT-4/Baseline_LLM_Responses.txt","a") as f_summary:
-            f_summary.write(summary+"\n")
-            f_summary.write("//\n")
+        records.append(stage_record(ID, "baseline", start, cost_info, text=summary))
         print("=====Summary=====")
         print(summary)
         
@@ -165,31 +179,29 @@ def GeneAgent(ID, genes):
             {"role":"system", "content":system_verify},
             {"role":"user", "content":prompt_topic}
         ]
-        claims_topic_resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=message_topic,
-            temperature=0,
-        )
+        start = time.perf_counter()
+        with tracing.span("topic_claims", "stage"):
+            claims_topic_resp = chat_completion(get_client(),
+                model="gpt-4o",
+                messages=message_topic,
+                temperature=0,
+            )
         cost_info = record_chat_completion_cost(claims_topic_resp, "gpt-4o", tag="claims_topic")
         print(f"$ Cost topic claims: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
         claims_topic = json.loads(claims_topic_resp.choices[0].message.content)
-        with open("Outputs/Verification Reports/Cascade/Claims_and_Verification_Topic.txt","a") as f_claim:
-            f_claim.write(str(claims_topic)+"\n")
-            f_claim.write("&&\n")
+        records.append(stage_record(ID, "topic_claims", start, cost_info, claims=claims_topic))
         print("=====Topic Claim=====")
         print(claims_topic)
         
+        claims_topic = [clean_claim(claim, pattern) for claim in claims_topic]
+        with tracing.span("topic_verification", "stage", claims=len(claims_topic)):
+            results_topic = agentphd.verify_claim_results(claims_topic)
+        records.extend(claim_records(ID, "topic", claims_topic, results_topic))
         verification_topic = ""
-        for claim in claims_topic:
-            if not re.match(pattern, claim):
-                claim = re.sub(r'[^a-zA-Z0-9,.;?!*()_-]+$', "_", claim)
-            claim_result = agentphd.inference(claim)
+        for claim, claim_result in zip(claims_topic, results_topic):
+            claim_result = claim_result["report"]
             verification_topic += f"Original_claim:{claim}"
             verification_topic += f"Verified_claim:{claim_result}"
-            with open("Outputs/Verification Reports/Cascade/Claims_and_Verification_Topic.txt","a") as f_claim:
-                f_claim.write(str(claim)+"\n")
-                f_claim.write(str(claim_result)+"\n")
-                f_claim.write("&&\n")
             print(claim)
             print(claim_result)
             
@@ -197,18 +209,29 @@ def GeneAgent(ID, genes):
         messages.append(
             {"role":"user", "content": modification_prompt}
             )
-        updated_topic_resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0,
-        )
+        start = time.perf_counter()
+        with tracing.span("topic_update", "stage"):
+            updated_topic_resp = chat_completion(get_client(),
+                model="gpt-4o",
+                messages=messages,
+                temperature=0,
+            )
         messages.append(updated_topic_resp.choices[0].message)
         cost_info = record_chat_completion_cost(updated_topic_resp, "gpt-4o", tag="updated_topic")
         print(f"$ Cost updated topic: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
         updated_topic = updated_topic_resp.choices[0].message.content 
+        records.append(stage_record(ID, "topic_update", start, cost_info, text=updated_topic))
         print("=====Updated Topic=====")
         print(updated_topic)
         
+        budget = exhausted_budget(ID=ID)
+        if budget:
+            # degrade to the summary revised after the topic verification and skip the analysis stage
+            print(f"====The {budget} budget is exhausted, skipping the analysis stage====")
+            records.append({"type": "stage", "pipeline": "cascade", "ID": str(ID), "stage": "final", "text": updated_topic,
+                            "seconds": 0.0, "usage": {}, "budget": budget})
+            raise BudgetExhausted(budget)
+
         if not re.match(pattern, str(updated_topic)):
             updated_topic = re.sub(r'[^a-zA-Z0-9-_]+', "_", str(updated_topic))
         # send genes and updated summary to GPT-4 for analysis verification.
@@ -218,31 +241,29 @@ def GeneAgent(ID, genes):
             {"role":"system", "content":system_verify},
             {"role":"user", "content":prompt_analysis}
         ]
-        claims_analysis_resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=analysis_message,
-            temperature=0,
-        )
+        start = time.perf_counter()
+        with tracing.span("analysis_claims", "stage"):
+            claims_analysis_resp = chat_completion(get_client(),
+                model="gpt-4o",
+                messages=analysis_message,
+                temperature=0,
+            )
         cost_info = record_chat_completion_cost(claims_analysis_resp, "gpt-4o", tag="claims_analysis")
         print(f"$ Cost analysis claims: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
         claims_analysis = json.loads(claims_analysis_resp.choices[0].message.content)
-        with open("Outputs/Verification Reports/Cascade/Claims_and_Verification_Analytic_Narratives.txt","a") as f_claim:
-            f_claim.write(str(claims_analysis)+"\n")
-            f_claim.write("&&\n")
+        records.append(stage_record(ID, "analysis_claims", start, cost_info, claims=claims_analysis))
         print("=====Analysis Claim=====")
         print(claims_analysis)
         
+        claims_analysis = [clean_claim(str(claim), pattern) for claim in claims_analysis]
+        with tracing.span("analysis_verification", "stage", claims=len(claims_analysis)):
+            results_analysis = agentphd.verify_claim_results(claims_analysis)
+        records.extend(claim_records(ID, "analysis", claims_analysis, results_analysis))
         verification_analysis = ""
-        for claim in claims_analysis:
-            if not re.match(pattern, claim):
-                claim = re.sub(r'[^a-zA-Z0-9,.;?!*()_-]+$', "_", claim)
-            claim_result = agentphd.inference(str(claim))
+        for claim, claim_result in zip(claims_analysis, results_analysis):
+            claim_result = claim_result["report"]
             verification_analysis += f"Original_claim:{claim}"
             verification_analysis += f"Verified_claim:{claim_result}"
-            with open("Outputs/Verification Reports/Cascade/Claims_and_Verification_Analytic_Narratives.txt","a") as f_claim:
-                f_claim.write(str(claim)+"\n")
-                f_claim.write(str(claim_result)+"\n")
-                f_claim.write("&&\n")
             print(claim)
             print(claim_result)
             
@@ -251,38 +272,91 @@ def GeneAgent(ID, genes):
         messages.append(
             {"role":"assistant", "content":summarization_prompt }
         )
-        updated_resp = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            temperature=0,
-        )
+        start = time.perf_counter()
+        with tracing.span("final", "stage"):
+            updated_resp = chat_completion(get_client(),
+                model="gpt-4o",
+                messages=messages,
+                temperature=0,
+            )
         cost_info = record_chat_completion_cost(updated_resp, "gpt-4o", tag="final_update")
         print(f"$ Cost final update: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
         update = updated_resp.choices[0].message.content
 
-        with open("Outputs/GeneAgent/Cascade/Final_Response_GeneAgent.txt","a") as f_final:
-            f_final.write(update+"\n")
-            f_final.write("//\n")
+        records.append(stage_record(ID, "final", start, cost_info, text=update))
         print("====Final Update====")
         print(update)
                 
-        with open("Outputs/Verification Reports/Cascade/Claims_and_Verification_for_MsigDB.txt","a") as f_claim:
-            f_claim.write("////\n")
+        status, error = "ok", None
+
+    except BudgetExhausted as E:
+        budget = str(E)
+        status, error = "budget", f"the {budget} budget is exhausted"
 
     except Exception as E:
-        with open("Outputs/GeneAgent/Cascade/Error_Report.txt","a") as f_final:
-            f_final.write(ID + "\t")
-            f_final.write(f"====There are an error {E} here.====\n")
-            f_final.write("//\n")
-                
         print(f"====There are an error {E} here.====")       
+        status, error = "error", str(E)
+
+    # queries the agent no longer needs are not sent
+    cancel_prefetch(prefetched)
+    # the gene set record names the budget that skipped a stage, or else the first one that cut a claim short
+    budget = budget or next((record["budget"] for record in records if record.get("budget")), None)
+    # a gene set cut short by a budget is not marked done, so the next run (or a retry of its job) runs it again
+    if status == "ok" and budget:
+        status, error = "budget", f"the {budget} budget cut claims short"
+    usage = {}
+    for record in records:
+        for key, value in record["usage"].items():
+            usage[key] = usage.get(key, 0) + value
+    records.append({"type": "gene_set", "pipeline": "cascade", "ID": str(ID), "genes": genes, "status": status, "error": error,
+                    "budget": budget, "seconds": time.perf_counter() - started, "usage": usage})
+    sink.write_many(records)
+    # the records are on disk before the runner marks the gene set as done
+    sink.flush()
+    return status == "ok"
 
             
 if __name__ == "__main__":
 
-    data = pd.read_csv("Datasets/AlzKB/gene_sets.csv", header=0, index_col=None)
-    for ID, genes in zip(data["ID"], data["Genes"]):
-        GeneAgent(ID, genes)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default="Datasets/AlzKB/gene_sets.csv")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("GENEAGENT_WORKERS", "1")),
+                        help="number of gene sets processed at the same time")
+    parser.add_argument("--progress", default=None,
+                        help="file recording the finished gene set IDs; defaults to Outputs/GeneAgent/Cascade/<dataset>.progress")
+    parser.add_argument("--results", default=None,
+                        help="JSONL file receiving the stage and claim records; defaults to Outputs/GeneAgent/Cascade/<dataset>.results.jsonl")
+    parser.add_argument("--export-legacy", action="store_true",
+                        help="also rewrite the legacy delimited text files under Outputs/ from the results file")
+    parser.add_argument("--trace", default=os.getenv("GENEAGENT_TRACE"),
+                        help="write a Chrome trace of the gene set, stage, claim, round, tool and HTTP spans to this file")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
+
+    stem = os.path.splitext(os.path.basename(args.dataset))[0]
+    progress = args.progress or os.path.join("Outputs/GeneAgent/Cascade", stem + ".progress")
+    results = args.results or os.path.join("Outputs/GeneAgent/Cascade", stem + ".results.jsonl")
+    sink = get_result_sink(results)
+    gene_sets = load_gene_sets(args.dataset)
+    summary = run_dataset(functools.partial(GeneAgent, sink=sink), gene_sets, progress, workers=args.workers)
+    sink.close()
+    print(f"===Succeeded: {summary['succeeded']}, failed: {len(summary['failed'])}===")
+    if args.export_legacy:
+        print(f"===Exported {json.dumps(export_legacy(results, [ID for ID, _ in gene_sets]))} gene sets to the legacy text files===")
+    tool_cache = get_tool_cache()
+    if tool_cache is not None:
+        print(f"===Tool cache hits/misses: {json.dumps(tool_cache.stats())}===")
+    print(f"===Tokens saved by the tool projections: {json.dumps(projection_stats())}===")
+    claim_memo = get_claim_memo()
+    if claim_memo is not None:
+        print(f"===Claim memo: {json.dumps(claim_memo.stats())}===")
+    ledger = get_cost_ledger()
+    print(f"===Cost of this run: {json.dumps(ledger.total())}===")
+    print(f"===Cost per stage: {json.dumps(ledger.summary())}===")
+    if tracing.enabled():
+        print(f"===Slowest stages and tools: {json.dumps(tracing.summary(), indent=1)}===")
+        print(f"===Trace written to {tracing.export_chrome_trace()}===")
         
     print("===Finished!===")
     
@@ -1,34 +1,19 @@
 import json
 import time
-import pandas as pd
+import argparse
 from datetime import datetime
 
-from openai import OpenAI
-try:
-    from openai import AzureOpenAI
-except Exception:
-    AzureOpenAI = None
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from costs import record_chat_completion_cost
-
-def _create_openai_client():
-    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or os.getenv("AZURE_API_BASE")
-    azure_api_key = os.getenv("AZURE_OPENAI_API_KEY")
-    azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION") or os.getenv("AZURE_API_VERSION")
-    if azure_endpoint and azure_api_key and azure_api_version and AzureOpenAI is not None:
-        return AzureOpenAI(
-            azure_endpoint=azure_endpoint,
-            api_key=azure_api_key,
-            api_version=azure_api_version,
-        )
-    return OpenAI()
-
-client = _create_openai_client()
+from costs import record_chat_completion_cost, add_usage
+from llm import chat_completion, get_client
 
 from worker import AgentPhD
+from geneset import format_genes
+from dataset import load_gene_sets
+from results import ReportStore, get_result_sink, export_responses
 
 ## baseline 
 system = "You are an efficient and insightful assistant to a molecular biologist."
@@ -100,42 +85,98 @@ def extract_synopsis(text: str) -> list:
     return functions
 
 
-if __name__ == "__main__":
-    
-    data = pd.read_csv("Datasets/MsigDB/MsigDB.csv", header=0, index_col=None)
-    genes = list(data["Genes"])
-    print(len(genes))
-    
-    des = ""
-    with open ("Outputs/Verification Reports/Cascade/Claims_and_Verification_for_MsigDB.txt", "r") as gptfile:
-        for line in gptfile.readlines():
-            des += line
-    functions = extract_functions(des)
-    print(len(functions))
-    
-    assert len(genes) == len(functions)
-        
-    for gene, function in zip(genes, functions):
-        gene = gene.replace(" ",",")
+def iter_verified_functions(gene_sets, results_path, legacy_path):
+    """
+    Yield (ID, genes, verified functions) of every gene set. Reports are looked up per gene set
+    in the results file of main_cascade; without one, the legacy claims file is parsed instead.
+    """
+    if os.path.exists(results_path):
+        store = ReportStore(results_path)
+        for ID, genes in gene_sets:
+            if ID not in store or store.status(ID) != "ok":
+                print(f"=====No verified functions for gene set {ID}, skipping=====")
+                continue
+            yield ID, genes, store.verified_functions(ID)
+        return
+    with open(legacy_path, "r") as gptfile:
+        functions = extract_functions(gptfile.read())
+    assert len(gene_sets) == len(functions)
+    for (ID, genes), function in zip(gene_sets, functions):
+        yield ID, genes, function
+
+
+def EnrichedTermSummary(ID, genes, functions=None, store=None, sink=None):
+    """
+    Run the enriched term test of one gene set over its verified functions and write its "summary"
+    records to the results sink. Without `functions`, they are looked up in `store`, the ReportStore
+    of the cascade results; a gene set without a successful cascade run fails.
+    """
+    sink = sink or get_result_sink()
+    started = time.perf_counter()
+    records = []
+    usage = {}
+    try:
+        if functions is None:
+            if store is None or ID not in store or store.status(ID) != "ok":
+                raise KeyError(f"no verified functions for gene set {ID}")
+            functions = store.verified_functions(ID)
+        gene = format_genes(genes)
 
         ## send genes to GPT-4 and generate the original template of process name and analysis
-        prompt = base(gene, function) + instruction
+        prompt = base(gene, functions) + instruction
         messages = [
             {"role":"system", "content":system},
             {"role":"user", "content":prompt}
         ]
-        summary = client.chat.completions.create(
-			model="gpt-4o",
-			messages=messages,
-			temperature=0,
-		)
+        summary = chat_completion(get_client(),
+            model="gpt-4o",
+            messages=messages,
+            temperature=0,
+        )
 
         cost_info = record_chat_completion_cost(summary, "gpt-4o", tag="multi_summary")
         print(f"$ Cost summary: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
+        usage = add_usage({}, cost_info)
         summary = summary.choices[0].message.content
-        with open("Outputs/EnrichedTermTest/gpt.geneagent.msigdb.summary.result.verification.txt","a") as f_summary:
-            f_summary.write(summary+"\n")
-            f_summary.write("//\n")
+        records.append({"type": "stage", "pipeline": "summary", "ID": str(ID), "stage": "summary", "text": summary,
+                        "seconds": time.perf_counter() - started, "usage": usage})
         print("=====Summary=====")
         print(summary)
-        
+        status, error = "ok", None
+    except Exception as E:
+        print(f"====There are an error {E} here.====")
+        status, error = "error", str(E)
+
+    records.append({"type": "gene_set", "pipeline": "summary", "ID": str(ID), "genes": genes, "status": status, "error": error,
+                    "seconds": time.perf_counter() - started, "usage": usage})
+    sink.write_many(records)
+    sink.flush()
+    return status == "ok"
+
+
+if __name__ == "__main__":
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dataset", default="Datasets/MsigDB/MsigDB.csv")
+    parser.add_argument("--results", default=None,
+                        help="results file of main_cascade; defaults to Outputs/GeneAgent/Cascade/<dataset>.results.jsonl")
+    parser.add_argument("--legacy", default="Outputs/Verification Reports/Cascade/Claims_and_Verification_for_MsigDB.txt",
+                        help="legacy claims file read when the results file does not exist")
+    parser.add_argument("--summaries", default=None,
+                        help="JSONL file receiving the summaries; defaults to Outputs/EnrichedTermTest/<dataset>.results.jsonl")
+    args = parser.parse_args()
+
+    gene_sets = load_gene_sets(args.dataset)
+    print(len(gene_sets))
+    stem = os.path.splitext(os.path.basename(args.dataset))[0]
+    results = args.results or os.path.join("Outputs/GeneAgent/Cascade", stem + ".results.jsonl")
+    summaries = args.summaries or os.path.join("Outputs/EnrichedTermTest", stem + ".results.jsonl")
+    sink = get_result_sink(summaries)
+
+    for ID, gene, function in iter_verified_functions(gene_sets, results, args.legacy):
+        EnrichedTermSummary(ID, gene, functions=function, sink=sink)
+    sink.close()
+    # the summaries in dataset order, in the "//" separated format of the legacy output
+    target = os.path.join("Outputs/EnrichedTermTest", f"gpt.geneagent.{stem.lower()}.summary.result.verification.txt")
+    export_responses(summaries, "summary", [ID for ID, _ in gene_sets], target)
+    print(f"===Summaries written to {target}===")
@@ -0,0 +1,104 @@
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from geneset import parse_genes
+from apis.cache import get_tool_cache
+from apis.get_gene_summary_for_gene_set import get_gene_summaries
+from worker import func2info
+
+# Configuration through environment variables:
+#   GENEAGENT_PREFETCH            "1" enables the prefetch (default off; it needs the tool cache)
+#   GENEAGENT_PREFETCH_WORKERS    concurrent prefetch requests (default 4)
+#   GENEAGENT_PREFETCH_QUEUE      prefetch requests queued or running at once over all gene sets (default 16);
+#                                 further ones are dropped, so the prefetch never piles up against the API rate limits
+#   GENEAGENT_PREFETCH_MAX_GENES  gene sets larger than this only get the gene set level tools prefetched (default 30)
+PREFETCH = os.getenv("GENEAGENT_PREFETCH", "0").lower() in ("1", "on", "true")
+PREFETCH_WORKERS = int(os.getenv("GENEAGENT_PREFETCH_WORKERS", "4"))
+PREFETCH_QUEUE = int(os.getenv("GENEAGENT_PREFETCH_QUEUE", "16"))
+PREFETCH_MAX_GENES = int(os.getenv("GENEAGENT_PREFETCH_MAX_GENES", "30"))
+
+GENE_SET_TOOLS = [
+    "get_enrichment_for_gene_set",
+    "get_local_enrichment_for_gene_set",
+    "get_pathway_for_gene_set",
+    "get_interactions_for_gene_set",
+    "get_complex_for_gene_set",
+]
+SINGLE_GENE_TOOLS = [
+    "get_disease_for_single_gene",
+    "get_domain_for_single_gene",
+]
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(PREFETCH_QUEUE)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+    return _executor
+
+
+def _run(function_name, kwargs):
+    try:
+        func2info[function_name][0](**kwargs)
+    except Exception as E:
+        print(f"====Prefetch of {function_name} failed with {E}====")
+
+
+def _prefetch_summaries(genes, function_names, specie="Homo"):
+    """Fetch all summaries with the batched request and store them under both summary tools."""
+    cache = get_tool_cache()
+    try:
+        summaries = get_gene_summaries(genes, specie)
+    except Exception as E:
+        print(f"====Prefetch of gene summaries failed with {E}====")
+        return
+    if "get_gene_summary_for_gene_set" in function_names and None not in summaries.values():
+        cache.set("get_gene_summary_for_gene_set", {"gene_set": ",".join(genes), "specie": specie}, json.dumps(summaries))
+    for gene, summary in summaries.items():
+        if summary is not None:
+            cache.set("get_gene_summary_for_single_gene", {"gene_name": gene, "specie": specie}, summary)
+
+
+def _submit(futures, function, *args):
+    """Queue a prefetch request when a slot is free; speculative requests are dropped otherwise."""
+    if not _slots.acquire(blocking=False):
+        return
+    future = _get_executor().submit(function, *args)
+    future.add_done_callback(lambda _: _slots.release())
+    futures.append(future)
+
+
+def prefetch_gene_set(genes, function_names) -> list:
+    """
+    Fire the tool queries the verification agent is likely to make for this gene set in the
+    background, so that they are already in the tool cache when the agent asks for them.
+    Returns the futures; pass them to cancel_prefetch() once the gene set has finished.
+    """
+    if not PREFETCH or get_tool_cache() is None:
+        return []
+    genes = parse_genes(genes)
+    gene_set = ",".join(genes)
+    futures = []
+    for name in GENE_SET_TOOLS:
+        if name in function_names:
+            _submit(futures, _run, name, {"gene_set": gene_set})
+    if len(genes) <= PREFETCH_MAX_GENES:
+        if "get_gene_summary_for_single_gene" in function_names or "get_gene_summary_for_gene_set" in function_names:
+            _submit(futures, _prefetch_summaries, genes, function_names)
+        for gene in genes:
+            for name in SINGLE_GENE_TOOLS:
+                if name in function_names:
+                    _submit(futures, _run, name, {"gene_name": gene})
+    return futures
+
+
+def cancel_prefetch(futures) -> int:
+    """Cancel the prefetch requests of a finished gene set that have not started; returns how many."""
+    return sum(future.cancel() for future in futures)
@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import threading
+
+try:
+    import fcntl
+except Exception:
+    fcntl = None
+
+# Configuration through environment variables:
+#   GENEAGENT_RPM                 requests per minute allowed for chat completions (default 500, 0 = unlimited)
+#   GENEAGENT_TPM                 tokens per minute allowed for chat completions (default 300000, 0 = unlimited)
+#   GENEAGENT_RATE_LIMIT_FILE     optional state file shared by all processes on this host
+DEFAULT_RPM = 500
+DEFAULT_TPM = 300000
+
+
+class RateLimiter:
+    """
+    Token buckets for requests per minute and tokens per minute.
+    acquire() blocks until one request and the estimated tokens fit into both buckets;
+    reconcile() corrects the token bucket once the real usage is known. Buckets may run
+    into debt after reconciliation, which delays the following requests.
+    With a state_path the buckets live in a locked file so that several processes share them.
+    """
+
+    def __init__(self, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM, state_path: str = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.state_path = state_path if fcntl is not None else None
+        self.lock = threading.Lock()
+        now = time.monotonic() if self.state_path is None else time.time()
+        self.state = {"requests": [rpm, now], "tokens": [tpm, now]}
+        if self.state_path and os.path.dirname(self.state_path):
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        rpm = float(os.getenv("GENEAGENT_RPM", DEFAULT_RPM))
+        tpm = float(os.getenv("GENEAGENT_TPM", DEFAULT_TPM))
+        if rpm <= 0 and tpm <= 0:
+            return None
+        return cls(rpm, tpm, os.getenv("GENEAGENT_RATE_LIMIT_FILE") or None)
+
+    def _refill(self, state, now):
+        for name, capacity in (("requests", self.rpm), ("tokens", self.tpm)):
+            level, updated = state[name]
+            if capacity > 0:
+                level = min(capacity, level + (now - updated) * capacity / 60.0)
+            state[name] = [level, now]
+
+    def _update(self, function):
+        """Run function(state, now) on the current bucket state and store the result."""
+        with self.lock:
+            if self.state_path is None:
+                now = time.monotonic()
+                self._refill(self.state, now)
+                return function(self.state, now)
+            with open(self.state_path, "a+") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0)
+                    data = f.read()
+                    state = json.loads(data) if data else self.state
+                    now = time.time()
+                    self._refill(state, now)
+                    result = function(state, now)
+                    f.seek(0)
+                    f.truncate()
+                    f.write(json.dumps(state))
+                    f.flush()
+                    return result
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _wait_time(self, state, tokens):
+        wait = 0.0
+        for name, capacity, amount in (("requests", self.rpm, 1), ("tokens", self.tpm, tokens)):
+            if capacity <= 0:
+                continue
+            # a single request larger than the bucket only has to wait for a full bucket
+            needed = min(amount, capacity)
+            level = state[name][0]
+            if level < needed:
+                wait = max(wait, (needed - level) * 60.0 / capacity)
+        return wait
+
+    def acquire(self, tokens: int) -> int:
+        """Block until the request fits into the limits and charge it. Returns the charged tokens."""
+
+        def take(state, now):
+            wait = self._wait_time(state, tokens)
+            if wait <= 0:
+                if self.rpm > 0:
+                    state["requests"][0] -= 1
+                if self.tpm > 0:
+                    state["tokens"][0] -= tokens
+            return wait
+
+        while True:
+            wait = self._update(take)
+            if wait <= 0:
+                return tokens
+            # at least a millisecond, so that a shortfall left by rounding does not spin
+            time.sleep(min(max(wait, 0.001), 5.0))
+
+    def reconcile(self, charged: int, actual: int):
+        """Return over-charged tokens to the bucket, or charge the missing ones."""
+
+        def adjust(state, now):
+            if self.tpm > 0:
+                state["tokens"][0] = min(self.tpm, state["tokens"][0] + charged - actual)
+
+        self._update(adjust)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Process-wide RateLimiter configured from the environment, or None when unlimited."""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter.from_env() or False
+    return _limiter or None
@@ -0,0 +1,326 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import argparse
+import threading
+
+# Configuration through environment variables:
+#   GENEAGENT_RESULTS   results file used when no path is given (default Outputs/GeneAgent/Cascade/results.jsonl)
+DEFAULT_PATH = "Outputs/GeneAgent/Cascade/results.jsonl"
+
+# Record types, one JSON object per line:
+#   {"type": "stage", "pipeline", "ID", "stage", "text" or "claims", "seconds", "usage"}
+#   {"type": "claim", "pipeline", "ID", "stage", "index", "claim", "report", "provenance", "seconds", "usage", "budget"}
+#   {"type": "gene_set", "pipeline", "ID", "genes", "status", "error", "budget", "seconds", "usage"}
+# The pipelines are "cascade", "synchronous" (topic.py), "cot" (main_CoT.py) and "summary" (main_summary.py);
+# the last two write a single "summary" stage record per gene set.
+# "budget" names the budget ("claim", "gene_set" or "run") that cut a claim or gene set short, or is null.
+# "status" is "ok", "error", or "budget" for a gene set cut short by a budget, which is run again by the next run.
+# The records of one gene set are written together and end with its gene_set record.
+
+
+class ResultSink:
+    """
+    Append-only JSONL results file written by a single background thread.
+    write() and write_many() only serialize the records and queue them, so they can be called
+    from any thread or event loop; the writer drains the queue in batches and flushes once per batch.
+    The records passed to one write_many() call are written contiguously.
+    """
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.queue = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="result-sink", daemon=True)
+        self.thread.start()
+
+    def write(self, record: dict):
+        self.write_many([record])
+
+    def write_many(self, records):
+        if self.closed:
+            raise ValueError(f"Result sink {self.path} is closed")
+        self.queue.put(("lines", [json.dumps(record, default=str) for record in records]))
+
+    def flush(self):
+        """Block until every record queued so far is written to the file."""
+        done = threading.Event()
+        self.queue.put(("flush", done))
+        done.wait()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        done = threading.Event()
+        self.queue.put(("close", done))
+        done.wait()
+
+    def _run(self):
+        with open(self.path, "a") as f:
+            while True:
+                batch = [self.queue.get()]
+                while True:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                lines = [line for kind, item in batch if kind == "lines" for line in item]
+                if lines:
+                    f.write("\n".join(lines) + "\n")
+                f.flush()
+                for kind, item in batch:
+                    if kind != "lines":
+                        item.set()
+                if any(kind == "close" for kind, _ in batch):
+                    return
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_result_sink(path: str = None) -> ResultSink:
+    """Shared ResultSink of a results file, so that every file has exactly one writer per process."""
+    path = os.path.abspath(path or os.getenv("GENEAGENT_RESULTS", DEFAULT_PATH))
+    with _sinks_lock:
+        if path not in _sinks or _sinks[path].closed:
+            _sinks[path] = ResultSink(path)
+        return _sinks[path]
+
+
+@atexit.register
+def close_result_sinks():
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+    for sink in sinks:
+        sink.close()
+
+
+def read_results(path: str):
+    """Yield the records of a results file, skipping a partially written last line."""
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def group_gene_sets(records):
+    """Yield (gene_set record, other records of that gene set) in the order the gene sets finished."""
+    pending = {}
+    for record in records:
+        key = (record.get("pipeline"), record["ID"])
+        if record["type"] == "gene_set":
+            yield record, pending.pop(key, [])
+        else:
+            pending.setdefault(key, []).append(record)
+
+
+class ReportStore:
+    """
+    Random access to the records of a results file through a gene set ID -> line offsets index.
+    The index is kept next to the results file (`<path>.<pipeline>.index`) and extended incrementally
+    with the records appended since it was written, so a 1000-set run is parsed only once.
+    When a gene set was run more than once, its latest attempt is returned.
+    """
+
+    def __init__(self, path: str, pipeline: str = "cascade"):
+        self.path = path
+        self.pipeline = pipeline
+        self.index_path = f"{path}.{pipeline}.index"
+        self.lock = threading.Lock()
+        self.gene_sets = {}
+        self.pending = {}
+        self.scanned = 0
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as f:
+                    saved = json.load(f)
+                # an index longer than the file belongs to a file that was since replaced
+                if saved["scanned"] <= os.path.getsize(path):
+                    self.gene_sets, self.pending, self.scanned = saved["gene_sets"], saved["pending"], saved["scanned"]
+            except (ValueError, KeyError, OSError):
+                pass
+        self.refresh()
+
+    def refresh(self):
+        """Index the records appended since the last scan and save the index."""
+        with self.lock:
+            with open(self.path, "rb") as f:
+                f.seek(self.scanned)
+                offset = self.scanned
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        offset += len(line)
+                        continue
+                    if record.get("pipeline") == self.pipeline:
+                        offsets = self.pending.setdefault(record["ID"], [])
+                        offsets.append(offset)
+                        if record["type"] == "gene_set":
+                            # a later attempt replaces the earlier one and moves to the end
+                            self.gene_sets.pop(record["ID"], None)
+                            self.gene_sets[record["ID"]] = self.pending.pop(record["ID"])
+                    offset += len(line)
+            # files without records of this pipeline get no index file
+            if offset != self.scanned and (self.gene_sets or self.pending):
+                self.scanned = offset
+                tmp_path = self.index_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump({"scanned": offset, "gene_sets": self.gene_sets, "pending": self.pending}, f)
+                os.replace(tmp_path, self.index_path)
+
+    def __contains__(self, ID) -> bool:
+        return str(ID) in self.gene_sets
+
+    def __len__(self) -> int:
+        return len(self.gene_sets)
+
+    def ids(self) -> list:
+        """Gene set IDs in the order their latest attempt finished."""
+        return list(self.gene_sets)
+
+    def records(self, ID) -> list:
+        """Records of the latest attempt of a gene set, ending with its gene_set record."""
+        offsets = self.gene_sets.get(str(ID))
+        if offsets is None:
+            raise KeyError(ID)
+        records = []
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        return records
+
+    def verified_functions(self, ID, stages=("topic", "analysis")) -> list:
+        """Verification reports of a gene set, in stage and claim order."""
+        claims = [record for record in self.records(ID) if record["type"] == "claim" and record["stage"] in stages]
+        claims.sort(key=lambda record: (stages.index(record["stage"]), record["index"]))
+        return [record["report"] for record in claims]
+
+    def status(self, ID) -> str:
+        return self.records(ID)[-1]["status"]
+
+
+# Legacy text files of the cascade pipeline, relative to the output root.
+LEGACY_CASCADE = {
+    "baseline": "GPT-4/Baseline_LLM_Responses.txt",
+    "topic": "Verification Reports/Cascade/Claims_and_Verification_Topic.txt",
+    "analysis": "Verification Reports/Cascade/Claims_and_Verification_Analytic_Narratives.txt",
+    "final": "GeneAgent/Cascade/Final_Response_GeneAgent.txt",
+    "msigdb": "Verification Reports/Cascade/Claims_and_Verification_for_MsigDB.txt",
+    "error": "GeneAgent/Cascade/Error_Report.txt",
+}
+LEGACY_SYNCHRONOUS = "Verification Reports/Synchronous/Claims_and_Verification_for_MsigDB.txt"
+
+
+def _claims_text(records, stage) -> str:
+    """Claims of one stage in the legacy format: the claim list, then every claim and report, each closed by &&."""
+    text = ""
+    for record in records:
+        if record["type"] == "stage" and record["stage"] == stage + "_claims":
+            text += str(record["claims"]) + "\n" + "&&\n"
+        elif record["type"] == "claim" and record["stage"] == stage:
+            text += str(record["claim"]) + "\n" + str(record["report"]) + "\n" + "&&\n"
+    return text
+
+
+def _stage_text(records, stage) -> str:
+    for record in records:
+        if record["type"] == "stage" and record["stage"] == stage:
+            return record["text"]
+    return ""
+
+
+def export_legacy(path: str, IDs: list = None, root: str = "Outputs") -> dict:
+    """
+    Rewrite the legacy delimited text files under `root` from a results file, for the
+    evaluate.ipynb workflow. Only the latest attempt of every gene set is exported, in the order
+    of IDs (the dataset order; by default the order in which the latest attempts finished),
+    since evaluate.ipynb and main_summary read the files by position. The MsigDB claims file
+    holds the topic and analysis claims of every gene set followed by "////", as read by
+    main_summary.extract_functions. Returns the number of gene sets exported per pipeline.
+    """
+    texts = {}
+    counts = {}
+
+    def add(name, text):
+        texts[name] = texts.get(name, "") + text
+
+    # the cot and summary responses are written by export_responses
+    for pipeline in ("cascade", "synchronous"):
+        store = ReportStore(path, pipeline)
+        order = [str(ID) for ID in IDs if str(ID) in store] if IDs is not None else store.ids()
+        if not order:
+            continue
+        counts[pipeline] = len(order)
+        if pipeline == "cascade":
+            # every file is rewritten, so that none keeps the gene sets of an earlier export
+            for name in LEGACY_CASCADE.values():
+                add(name, "")
+        for ID in order:
+            records = store.records(ID)
+            gene_set = records.pop()
+            if pipeline == "synchronous":
+                add(LEGACY_SYNCHRONOUS, "".join(str(r["claim"]) + "\n" + str(r["report"]) + "\n" + "&&\n" for r in records if r["type"] == "claim"))
+                continue
+            finished = gene_set["status"] == "ok" or (gene_set["status"] == "budget" and any(r.get("stage") == "final" for r in records))
+            if not finished:
+                add(LEGACY_CASCADE["error"], str(gene_set["ID"]) + "\t" + f"====There are an error {gene_set.get('error')} here.====\n" + "//\n")
+                continue
+            add(LEGACY_CASCADE["baseline"], _stage_text(records, "baseline") + "\n" + "//\n")
+            add(LEGACY_CASCADE["topic"], _claims_text(records, "topic"))
+            add(LEGACY_CASCADE["analysis"], _claims_text(records, "analysis"))
+            add(LEGACY_CASCADE["final"], _stage_text(records, "final") + "\n" + "//\n")
+            add(LEGACY_CASCADE["msigdb"], _claims_text(records, "topic") + _claims_text(records, "analysis") + "////\n")
+
+    for name, text in texts.items():
+        target = os.path.join(root, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w") as f:
+            f.write(text)
+    return counts
+
+
+def export_responses(path: str, pipeline: str, IDs: list, target: str, stage: str = "summary") -> int:
+    """
+    Write the `stage` text of every gene set of a single-stage pipeline ("cot" or "summary") to `target`
+    in the order of IDs, each followed by "//", as the legacy response files. Returns the number written.
+    """
+    store = ReportStore(path, pipeline) if os.path.exists(path) else None
+    written = 0
+    if os.path.dirname(target):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "w") as f:
+        for ID in IDs:
+            texts = [record["text"] for record in store.records(ID) if record["type"] == "stage" and record["stage"] == stage] if store is not None and ID in store else []
+            # a placeholder keeps the responses aligned with the dataset rows
+            f.write((texts[0] if texts else f"No response for gene set {ID}") + "\n" + "//\n")
+            written += bool(texts)
+    return written
+
+
+if __name__ == "__main__":
+    # python results.py export [results.jsonl] [--dataset dataset.csv] [--root Outputs]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["export"])
+    parser.add_argument("path", nargs="?", default=os.getenv("GENEAGENT_RESULTS", DEFAULT_PATH))
+    parser.add_argument("--dataset", default=None, help="dataset whose order the legacy files follow")
+    parser.add_argument("--root", default="Outputs", help="directory under which the legacy text files are written")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        sys.exit(f"No results file {args.path}")
+    IDs = None
+    if args.dataset:
+        from dataset import load_gene_sets
+        IDs = [ID for ID, _ in load_gene_sets(args.dataset)]
+    print(f"===Exported {json.dumps(export_legacy(args.path, IDs, args.root))} gene sets to the legacy files under {args.root}===")
@@ -0,0 +1,76 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import tracing
+from costs import gene_set_context
+
+
+class ProgressStore:
+    """
+    Durable record of the gene set IDs that finished successfully, one ID per line.
+    Every ID is flushed and fsynced before it counts as done, so a crashed run
+    can be restarted and will skip the finished gene sets.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.done = {line.strip() for line in f if line.strip()}
+        elif os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def __contains__(self, ID) -> bool:
+        return str(ID) in self.done
+
+    def __len__(self) -> int:
+        return len(self.done)
+
+    def mark_done(self, ID):
+        with self.lock:
+            with open(self.path, "a") as f:
+                f.write(f"{ID}\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.done.add(str(ID))
+
+
+def _run_pipeline(pipeline, ID, genes):
+    # completions made while this gene set runs are attributed to it in the cost ledger
+    with gene_set_context(ID), tracing.span(str(ID), "gene_set", ID=str(ID)) as current:
+        ok = pipeline(ID, genes)
+        current.set(ok=ok)
+        return ok
+
+
+def run_dataset(pipeline, gene_sets, progress_path: str, workers: int = 1) -> dict:
+    """
+    Run pipeline(ID, genes) over the gene sets with a pool of `workers` threads.
+    The pipeline returns True on success; only successful IDs are recorded in the
+    progress file, so failed gene sets are retried on the next run.
+    """
+    progress = ProgressStore(progress_path)
+    pending = [(ID, genes) for ID, genes in gene_sets if ID not in progress]
+    print(f"===Skipping {len(gene_sets) - len(pending)} finished gene sets, {len(pending)} to run with {workers} workers===")
+
+    succeeded, failed = 0, []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(_run_pipeline, pipeline, ID, genes): ID for ID, genes in pending}
+        for future in as_completed(futures):
+            ID = futures[future]
+            try:
+                ok = future.result()
+            except Exception as E:
+                print(f"====Gene set {ID} failed with {E}====")
+                ok = False
+            if ok:
+                progress.mark_done(ID)
+                succeeded += 1
+            else:
+                failed.append(ID)
+            print(f"===Progress: {len(progress)}/{len(gene_sets)} gene sets finished===")
+
+    return {"total": len(gene_sets), "succeeded": succeeded, "failed": failed}
@@ -0,0 +1,47 @@
+import types
+
+import costs
+import budgets
+from budgets import Budget, exhausted_budget
+from costs import CostLedger, gene_set_context, record_chat_completion_cost, add_usage
+
+
+def completion(prompt_tokens, completion_tokens, cached=False):
+    usage = types.SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+    return types.SimpleNamespace(usage=usage, cached=cached)
+
+
+def ledger(tmp_path, monkeypatch):
+    ledger = CostLedger(str(tmp_path / "costs.log"), flush_seconds=60)
+    monkeypatch.setattr(costs, "_ledger", ledger)
+    return ledger
+
+
+def test_token_and_dollar_limits():
+    assert not Budget().exhausted({"billed_tokens": 10 ** 9, "total_cost": 10 ** 6})
+    assert Budget(tokens=100).exhausted({"billed_tokens": 100})
+    assert not Budget(tokens=100).exhausted({"billed_tokens": 99, "prompt_tokens": 500})
+    assert Budget(usd=1.0).exhausted({"total_cost": 1.5})
+
+
+def test_gene_set_budget_is_exhausted(tmp_path, monkeypatch):
+    ledger(tmp_path, monkeypatch)
+    monkeypatch.setattr(budgets, "GENE_SET_BUDGET", Budget(tokens=1000))
+    with gene_set_context("GS1"):
+        record_chat_completion_cost(completion(600, 100), "gpt-4o")
+        assert exhausted_budget() is None
+        record_chat_completion_cost(completion(200, 100), "gpt-4o")
+        assert exhausted_budget() == "gene_set"
+    assert exhausted_budget(ID="GS2") is None
+
+
+def test_cached_completions_are_not_counted(tmp_path, monkeypatch):
+    ledger(tmp_path, monkeypatch)
+    monkeypatch.setattr(budgets, "RUN_BUDGET", Budget(tokens=1000, usd=0.001))
+    usage = {}
+    with gene_set_context("GS1"):
+        for _ in range(5):
+            add_usage(usage, record_chat_completion_cost(completion(600, 100, cached=True), "gpt-4o"))
+    assert exhausted_budget() is None
+    assert usage["cached"] == 5 and usage["billed_tokens"] == 0 and usage["prompt_tokens"] == 3000
+    assert not Budget(tokens=1000).exhausted(usage)
@@ -0,0 +1,54 @@
+from claim_memo import ClaimMemo, minhash, normalize_claim, claim_genes, similarity
+
+CLAIM = "TP53, MDM2 and CDKN1A activate the intrinsic apoptosis pathway in response to DNA damage."
+NEGATED = "TP53, MDM2 and CDKN1A do not activate the intrinsic apoptosis pathway in response to DNA damage."
+REWORDED = "TP53, MDM2 and CDKN1A activate the intrinsic apoptosis pathway in response to the DNA damage."
+
+
+def test_exact_matches_only_by_default(tmp_path):
+    memo = ClaimMemo(str(tmp_path / "claims.sqlite"))
+    memo.put(CLAIM, "report")
+    assert memo.get("mdm2,TP53  and CDKN1A activate the intrinsic apoptosis pathway in response to DNA damage")[0] == "report"
+    assert memo.get(REWORDED) is None
+
+
+def test_near_duplicate_is_reused(tmp_path):
+    memo = ClaimMemo(str(tmp_path / "claims.sqlite"), threshold=0.6)
+    memo.put(CLAIM, "report")
+    report, provenance = memo.get(REWORDED)
+    assert report == "report" and provenance["match"] == "near"
+
+
+def test_negated_claim_is_not_reused(tmp_path):
+    memo = ClaimMemo(str(tmp_path / "claims.sqlite"), threshold=0.5)
+    memo.put(CLAIM, "report")
+    assert memo.get(NEGATED) is None
+    assert memo.get(CLAIM.replace("activate", "inhibit")) is None
+
+
+def test_genes_are_not_shingled():
+    genes = claim_genes(CLAIM)
+    shared = similarity(minhash(normalize_claim(CLAIM), genes), minhash(normalize_claim(NEGATED), genes))
+    with_genes = similarity(minhash(normalize_claim(CLAIM)), minhash(normalize_claim(NEGATED)))
+    assert shared < with_genes
+
+
+def test_scope_separates_models_and_tools(tmp_path):
+    memo = ClaimMemo(str(tmp_path / "claims.sqlite"), threshold=0.6)
+    memo.put(CLAIM, "report", scope='["gpt-4o", ["get_pathway_for_gene_set"]]')
+    assert memo.get(CLAIM, '["gpt-4o", ["get_pathway_for_gene_set"]]')[0] == "report"
+    assert memo.get(CLAIM) is None
+    assert memo.get(REWORDED, '["gpt-4o-mini", ["get_pathway_for_gene_set"]]') is None
+
+
+def test_expired_reports_are_not_reused(tmp_path):
+    memo = ClaimMemo(str(tmp_path / "claims.sqlite"), threshold=0.6, ttl=60)
+    memo.put(CLAIM, "report")
+    memo.conn.execute("UPDATE claims SET created = created - 120")
+    assert memo.get(CLAIM) is None
+    assert memo.get(REWORDED) is None
+
+
+def test_off_by_default(monkeypatch):
+    monkeypatch.delenv("GENEAGENT_CLAIM_MEMO", raising=False)
+    assert ClaimMemo.from_env() is None
@@ -0,0 +1,42 @@
+from math import comb
+
+import pytest
+
+from dataset import load_term_library
+from enrichment import TermLibrary, hypergeom_sf
+
+
+def write_gmt(path, lines):
+    path.write_text("".join("\t".join(fields) + "\n" for fields in lines))
+    return str(path)
+
+
+def test_weighted_gmt_genes_keep_only_their_symbol(tmp_path):
+    path = write_gmt(tmp_path / "weighted.gmt", [
+        ["TERM_A", "desc", "TP53,1.0", "MDM2,0.5", "CDKN1A"],
+        ["TERM_B", "desc", "EGFR,2.0", "KRAS,1.0"],
+    ])
+    terms = load_term_library(path)
+    assert terms == [("TERM_A", "TERM_A", ["TP53", "MDM2", "CDKN1A"]), ("TERM_B", "TERM_B", ["EGFR", "KRAS"])]
+    library = TermLibrary.from_file(path)
+    assert library.universe_size == 5
+
+
+def test_hypergeom_sf_matches_the_exact_tail():
+    N, K, n = 60, 12, 9
+    expected = [sum(comb(K, i) * comb(N - K, n - i) for i in range(x, min(K, n) + 1)) / comb(N, n) for x in range(5)]
+    assert hypergeom_sf(list(range(5)), N, [K] * 5, n) == pytest.approx(expected, rel=1e-9)
+
+
+def test_enrich_ranks_the_overlapping_term_first(tmp_path):
+    genes = [f"G{i}" for i in range(40)]
+    path = write_gmt(tmp_path / "library.gmt", [
+        ["HIT", "desc", *genes[:6]],
+        ["MISS", "desc", *genes[20:30]],
+        ["OTHER", "desc", *genes[5:15]],
+    ])
+    results = sorted(TermLibrary.from_file(path).enrich(genes[:6]), key=lambda result: result["p_value"])
+    assert results[0]["name"] == "HIT"
+    assert sorted(results[0]["intersections"]) == sorted(genes[:6])
+    assert all(result["name"] != "MISS" for result in results)
+
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+import jobs
+from jobs import JobQueue, Worker, merge, PENDING, LEASED, DONE, FAILED
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "sets.csv"
+    path.write_text('"ID","Name","Genes"\n"A","a","TP53 MDM2"\n"B","b","PEX1 PEX2"\n"C","c","HK1 GPI"\n')
+    return str(path)
+
+
+def queue(tmp_path, **kwargs):
+    return JobQueue(str(tmp_path / "jobs.sqlite"), **kwargs)
+
+
+def expire(queue):
+    queue.conn.execute("UPDATE jobs SET lease_expires = 0 WHERE status = ?", (LEASED,))
+
+
+def statuses(queue, dataset, variant="cascade"):
+    return {ID: status for ID, status, _, _ in queue.jobs(dataset, variant)}
+
+
+def test_jobs_are_leased_once_in_dataset_order(tmp_path, dataset):
+    q = queue(tmp_path)
+    assert q.enqueue(dataset, ["cascade"]) == 3
+    assert q.enqueue(dataset, ["cascade"]) == 0
+    leased = [q.lease(owner) for owner in ("w1", "w2", "w3", "w4")]
+    assert [job.ID for job in leased[:3]] == ["A", "B", "C"] and leased[3] is None
+
+
+def test_expired_lease_is_taken_over(tmp_path, dataset):
+    q = queue(tmp_path)
+    q.enqueue(dataset, ["cascade"])
+    stalled = q.lease("w1")
+    expire(q)
+    takeover = q.lease("w2")
+    assert takeover.key == stalled.key and takeover.attempts == 2
+    # only the current holder of the lease may renew or complete the job
+    assert not q.renew(stalled) and not q.complete(stalled, "w1.jsonl")
+    assert q.complete(takeover, "w2.jsonl")
+    assert q.jobs(dataset, "cascade")[0][:3] == ("A", DONE, "w2.jsonl")
+
+
+def test_attempts_are_limited(tmp_path, dataset):
+    q = queue(tmp_path, max_attempts=2)
+    q.enqueue(dataset, ["cascade"])
+    q.fail(q.lease("w1"), "boom")
+    assert statuses(q, dataset)["A"] == PENDING
+    q.fail(q.lease("w1"), "boom")
+    assert statuses(q, dataset)["A"] == FAILED
+    # a lease that expires on the last attempt gives the job up as well
+    assert q.lease("w1").ID == "B"
+    expire(q)
+    assert q.lease("w2").attempts == 2
+    expire(q)
+    assert q.lease("w3").ID == "C"
+    assert statuses(q, dataset)["B"] == FAILED
+    assert q.retry_failed() == 2
+    assert q.lease("w2").ID == "A"
+
+
+def test_summary_waits_for_the_merged_cascade(tmp_path, dataset):
+    q = queue(tmp_path)
+    q.enqueue(dataset, ["cascade", "summary"])
+    assert q.lease("w1", ["summary"]) is None
+    job = q.lease("w1", ["cascade"])
+    q.complete(job, "w1.jsonl")
+    assert q.lease("w1", ["summary"]) is None
+    q.mark_merged(dataset, "cascade", ["A"])
+    assert q.lease("w1", ["summary"]).ID == "A"
+    assert q.lease("w1", ["summary"]) is None
+
+
+def test_worker_retries_and_merge_follows_dataset_order(tmp_path, dataset, monkeypatch):
+    attempts = {}
+
+    def load_pipeline(variant, dataset, sink):
+        def pipeline(ID, genes):
+            attempts[ID] = attempts.get(ID, 0) + 1
+            ok = not (ID == "B" and attempts[ID] == 1)
+            sink.write_many([{"type": "stage", "pipeline": "cot", "ID": ID, "stage": "summary", "text": f"{ID} {attempts[ID]}"},
+                             {"type": "gene_set", "pipeline": "cot", "ID": ID, "status": "ok" if ok else "error"}])
+            sink.flush()
+            return ok
+        return pipeline
+
+    monkeypatch.setattr(jobs, "load_pipeline", load_pipeline)
+    q = queue(tmp_path)
+    q.enqueue(dataset, ["cot"])
+    assert Worker(q, ["cot"], output=str(tmp_path / "results"), name="w1").run() == 4
+    assert statuses(q, dataset, "cot") == {"A": DONE, "B": DONE, "C": DONE}
+
+    output = str(tmp_path / "merged.jsonl")
+    assert merge(q, dataset, "cot", output) == {"output": output, "merged": 3, "missing": []}
+    with open(output) as f:
+        texts = [record["text"] for record in map(json.loads, f) if record["type"] == "stage"]
+    # B contributes its second, successful attempt
+    assert texts == ["A 1", "B 2", "C 1"]
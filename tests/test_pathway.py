@@ -0,0 +1,68 @@
+import os
+import sys
+import json
+import asyncio
+
+import pytest
+
+from apis import http_client
+from apis import get_pathway_for_gene_set as pathway
+
+
+def write_gmt(path, lines):
+    path.write_text("".join("\t".join(fields) + "\n" for fields in lines))
+
+
+@pytest.fixture
+def enrichr(monkeypatch):
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bench"))
+    import fake_servers
+    server = fake_servers.start_server(0, fake_servers.Script(0, 0))
+    monkeypatch.setattr(pathway, "ENRICHR_URL", f"http://127.0.0.1:{server.server_port}/enrichr")
+    monkeypatch.setattr(pathway, "PATHWAY_MODE", "online")
+    yield server
+    server.shutdown()
+
+
+def test_online_lookup_works_inside_a_running_event_loop(enrichr):
+    async def call_from_loop():
+        # the synchronous tool is called on a thread whose event loop is running, as in averify_claims
+        return pathway.get_pathway_for_gene_set("TP53,MDM2,CDKN1A")
+
+    rows = json.loads(asyncio.run(call_from_loop()))
+    assert {row["database"] for row in rows} <= set(pathway.LIBRARIES)
+
+
+def test_a_failed_library_fails_the_lookup(enrichr, monkeypatch):
+    fetch = pathway._fetch_library
+
+    async def flaky(list_id, backgroundType):
+        if backgroundType == "Reactome_2022":
+            raise Exception("unavailable")
+        return await fetch(list_id, backgroundType)
+
+    monkeypatch.setattr(pathway, "_fetch_library", flaky)
+    assert pathway.get_pathway_for_gene_set("TP53,MDM2") == "Error: Unable to fetch pathway results from Enrichr for Reactome_2022"
+
+
+def test_offline_lookup_reads_local_gmt_files(tmp_path, monkeypatch):
+    genes = [f"G{i}" for i in range(30)]
+    for library in pathway.LIBRARIES:
+        write_gmt(tmp_path / f"{library}.gmt", [[f"{library} hit", "desc", *genes[:5]], [f"{library} miss", "desc", *genes[10:20]]])
+    monkeypatch.setattr(pathway, "PATHWAY_MODE", "offline")
+    monkeypatch.setattr(pathway, "GMT_DIR", str(tmp_path))
+    monkeypatch.setattr(pathway, "_local_libraries", {})
+    rows = json.loads(pathway.get_pathway_for_gene_set(",".join(genes[:5])))
+    assert rows and all(row["term"].endswith("hit") for row in rows)
+
+    (tmp_path / f"{pathway.LIBRARIES[0]}.gmt").unlink()
+    monkeypatch.setattr(pathway, "_local_libraries", {})
+    assert pathway.get_pathway_for_gene_set(",".join(genes[:5])).startswith("Error")
+
+
+def test_run_refuses_the_client_loop_itself():
+    async def nested():
+        return http_client.run(asyncio.sleep(0))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run_coroutine_threadsafe(nested(), http_client._get_async_loop()).result()
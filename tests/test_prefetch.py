@@ -0,0 +1,53 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import prefetch
+from apis.cache import ToolCache
+
+
+@pytest.fixture
+def blocked_tools(tmp_path, monkeypatch):
+    """Prefetch on, one executor thread, three slots and tools that block until released."""
+    import apis.cache
+    release = threading.Event()
+    calls = []
+
+    def tool(**kwargs):
+        calls.append(kwargs)
+        release.wait(5)
+
+    monkeypatch.setattr(apis.cache, "_tool_cache", ToolCache(str(tmp_path / "tools.sqlite")))
+    monkeypatch.setattr(prefetch, "PREFETCH", True)
+    monkeypatch.setattr(prefetch, "_executor", ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(prefetch, "_slots", threading.BoundedSemaphore(3))
+    monkeypatch.setattr(prefetch, "func2info", {name: [tool, {}] for name in prefetch.GENE_SET_TOOLS + prefetch.SINGLE_GENE_TOOLS})
+    yield release, calls
+    release.set()
+
+
+def test_prefetch_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("GENEAGENT_PREFETCH", raising=False)
+    import importlib
+    assert importlib.reload(prefetch).PREFETCH is False
+
+
+def test_prefetch_is_bounded_and_cancelled(blocked_tools):
+    release, calls = blocked_tools
+    names = prefetch.GENE_SET_TOOLS + prefetch.SINGLE_GENE_TOOLS
+    futures = prefetch.prefetch_gene_set("TP53,MDM2,CDKN1A", names)
+    # 5 gene set tools and 6 single gene lookups, but only 3 slots
+    assert len(futures) == 3
+    assert prefetch.prefetch_gene_set("EGFR,KRAS", names) == []
+
+    # the first request is running; the two queued ones are cancelled
+    while not calls:
+        time.sleep(0.01)
+    assert prefetch.cancel_prefetch(futures) == 2
+    release.set()
+    futures[0].result(5)
+    assert len(calls) == 1
+    # every slot is free again
+    assert len(prefetch.prefetch_gene_set("EGFR,KRAS", names)) == 3
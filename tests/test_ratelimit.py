@@ -0,0 +1,76 @@
+import types
+
+import pytest
+
+import ratelimit
+from ratelimit import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake clock advanced by time.sleep, shared by monotonic() and time()."""
+    clock = types.SimpleNamespace(now=1000.0, sleeps=[])
+
+    def sleep(seconds):
+        clock.sleeps.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(ratelimit, "time", types.SimpleNamespace(monotonic=lambda: clock.now, time=lambda: clock.now, sleep=sleep))
+    return clock
+
+
+def test_requests_wait_for_refill(clock):
+    limiter = RateLimiter(rpm=60, tpm=0)
+    for _ in range(60):
+        limiter.acquire(0)
+    assert clock.sleeps == []
+    limiter.acquire(0)
+    # one request refills every second
+    assert sum(clock.sleeps) == pytest.approx(1.0, abs=0.01)
+
+
+def test_tokens_refill_proportionally(clock):
+    limiter = RateLimiter(rpm=0, tpm=6000)
+    limiter.acquire(6000)
+    clock.now += 30
+    limiter.acquire(3000)
+    assert clock.sleeps == []
+    limiter.acquire(1000)
+    assert sum(clock.sleeps) == pytest.approx(10.0, abs=0.01)
+
+
+def test_refill_is_capped_at_capacity(clock):
+    limiter = RateLimiter(rpm=0, tpm=600)
+    clock.now += 3600
+    limiter.acquire(600)
+    limiter.acquire(100)
+    assert sum(clock.sleeps) == pytest.approx(10.0, abs=0.01)
+
+
+def test_reconcile_returns_and_charges_tokens(clock):
+    limiter = RateLimiter(rpm=0, tpm=1000)
+    charged = limiter.acquire(1000)
+    limiter.reconcile(charged, 400)
+    limiter.acquire(600)
+    assert clock.sleeps == []
+    # usage above the estimate puts the bucket into debt
+    limiter.reconcile(0, 300)
+    limiter.acquire(100)
+    assert sum(clock.sleeps) == pytest.approx(24.0, abs=0.01)
+
+
+def test_oversized_request_waits_for_a_full_bucket(clock):
+    limiter = RateLimiter(rpm=0, tpm=1000)
+    limiter.acquire(500)
+    limiter.acquire(5000)
+    assert sum(clock.sleeps) == pytest.approx(30.0, abs=0.01)
+
+
+def test_shared_state_file(clock, tmp_path):
+    path = str(tmp_path / "limits.json")
+    first, second = RateLimiter(rpm=2, tpm=0, state_path=path), RateLimiter(rpm=2, tpm=0, state_path=path)
+    first.acquire(0)
+    second.acquire(0)
+    assert clock.sleeps == []
+    first.acquire(0)
+    assert sum(clock.sleeps) == pytest.approx(30.0, abs=0.01)
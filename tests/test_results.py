@@ -0,0 +1,84 @@
+import os
+import json
+
+from results import export_legacy, ReportStore, LEGACY_CASCADE
+
+
+def gene_set_records(ID, status="ok", final=None):
+    records = [
+        {"type": "stage", "pipeline": "cascade", "ID": ID, "stage": "baseline", "text": f"baseline {ID}"},
+        {"type": "stage", "pipeline": "cascade", "ID": ID, "stage": "topic_claims", "claims": [f"claim {ID}"]},
+        {"type": "claim", "pipeline": "cascade", "ID": ID, "stage": "topic", "index": 0, "claim": f"claim {ID}", "report": f"report {ID}"},
+        {"type": "stage", "pipeline": "cascade", "ID": ID, "stage": "final", "text": final or f"final {ID}"},
+    ]
+    if status != "ok":
+        records = records[:1]
+    return records + [{"type": "gene_set", "pipeline": "cascade", "ID": ID, "status": status, "error": None if status == "ok" else "boom"}]
+
+
+def read(root, name):
+    with open(os.path.join(root, LEGACY_CASCADE[name]), "r") as f:
+        return f.read()
+
+
+def test_export_follows_dataset_order_and_latest_attempt(tmp_path):
+    path = tmp_path / "results.jsonl"
+    # finished out of order; A failed and was retried, C was rerun after a crash
+    attempts = gene_set_records("B") + gene_set_records("A", status="error") + gene_set_records("C", final="final C old") \
+        + gene_set_records("A") + gene_set_records("C")
+    path.write_text("".join(json.dumps(record) + "\n" for record in attempts))
+    root = str(tmp_path / "Outputs")
+    (tmp_path / "Outputs" / "GeneAgent" / "Cascade").mkdir(parents=True)
+    with open(os.path.join(root, LEGACY_CASCADE["error"]), "w") as f:
+        f.write("stale\n//\n")
+
+    assert export_legacy(str(path), ["A", "B", "C"], root) == {"cascade": 3}
+    assert read(root, "final") == "final A\n//\nfinal B\n//\nfinal C\n//\n"
+    assert read(root, "baseline") == "baseline A\n//\nbaseline B\n//\nbaseline C\n//\n"
+    assert read(root, "msigdb").count("////") == 3
+    assert read(root, "error") == ""
+
+
+def write(path, records, mode="a"):
+    with open(path, mode) as f:
+        f.write("".join(json.dumps(record) + "\n" for record in records))
+
+
+def test_report_store_returns_latest_attempt(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    write(path, gene_set_records("A", status="error") + gene_set_records("B") + gene_set_records("A", final="final A new"))
+    store = ReportStore(path)
+    assert store.ids() == ["B", "A"] and "A" in store and "C" not in store
+    assert store.status("A") == "ok"
+    assert store.records("A")[-2]["text"] == "final A new"
+    assert store.verified_functions("B") == ["report B"]
+
+
+def test_report_store_indexes_appended_records(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    write(path, gene_set_records("A"))
+    store = ReportStore(path)
+    # C is still being written: complete records without its gene_set record, then half a line
+    pending = gene_set_records("C")
+    write(path, gene_set_records("B") + pending[:-1])
+    with open(path, "a") as f:
+        f.write(json.dumps(pending[-1])[:10])
+    store.refresh()
+    assert store.ids() == ["A", "B"]
+    with open(path, "a") as f:
+        f.write(json.dumps(pending[-1])[10:] + "\n")
+    store.refresh()
+    assert store.ids() == ["A", "B", "C"] and store.status("C") == "ok"
+    assert len(store.records("C")) == len(pending)
+
+
+def test_report_store_reuses_and_invalidates_its_index(tmp_path):
+    path = str(tmp_path / "results.jsonl")
+    write(path, gene_set_records("A") + gene_set_records("B"))
+    ReportStore(path)
+    assert os.path.exists(path + ".cascade.index")
+    reopened = ReportStore(path)
+    assert reopened.scanned == os.path.getsize(path) and reopened.ids() == ["A", "B"]
+    # a shorter file replacing the results is indexed from scratch
+    write(path, gene_set_records("C"), mode="w")
+    assert ReportStore(path).ids() == ["C"]
@@ -0,0 +1,40 @@
+import time
+
+from apis.cache import ToolCache, cached_tool
+
+
+def value(n):
+    return "x" * n
+
+
+def test_entry_hit_from_memory_survives_eviction(tmp_path):
+    cache = ToolCache(str(tmp_path / "tools.sqlite"), max_bytes=250)
+    cache.set("tool", {"gene_name": "A"}, value(100))
+    time.sleep(0.01)
+    cache.set("tool", {"gene_name": "B"}, value(100))
+    time.sleep(0.01)
+    for _ in range(5):
+        assert cache.get("tool", {"gene_name": "A"}) == (True, value(100))
+    time.sleep(0.01)
+    cache.set("tool", {"gene_name": "C"}, value(100))
+
+    cache.memory.clear()
+    assert cache.get("tool", {"gene_name": "A"})[0]
+    assert not cache.get("tool", {"gene_name": "B"})[0]
+    assert cache.get("tool", {"gene_name": "C"})[0]
+
+
+def test_expired_entries_are_fetched_again(tmp_path):
+    cache = ToolCache(str(tmp_path / "tools.sqlite"), ttl=0.05)
+    cache.set("tool", {"gene_name": "A"}, "old")
+    time.sleep(0.1)
+    assert cache.get("tool", {"gene_name": "A"}) == (False, None)
+
+
+def test_gene_sets_match_regardless_of_order(tmp_path, monkeypatch):
+    import apis.cache
+    monkeypatch.setattr(apis.cache, "_tool_cache", ToolCache(str(tmp_path / "tools.sqlite")))
+    calls = []
+    tool = cached_tool("tool", lambda gene_set: calls.append(gene_set) or f"result of {gene_set}")
+    assert tool(gene_set="TP53,MDM2") == tool(gene_set="MDM2, TP53")
+    assert len(calls) == 1
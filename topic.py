@@ -1,30 +1,13 @@
 import json
 import time
 import re
-import pandas as pd
 
-from openai import OpenAI
-try:
-    from openai import AzureOpenAI
-except Exception:
-    AzureOpenAI = None
-import os
-from costs import record_chat_completion_cost
-
-def _create_openai_client():
-    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or os.getenv("AZURE_API_BASE")
-    azure_api_key = os.getenv("AZURE_OPENAI_API_KEY")
-    azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION") or os.getenv("AZURE_API_VERSION")
-    if azure_endpoint and azure_api_key and azure_api_version and AzureOpenAI is not None:
-        return AzureOpenAI(
-            azure_endpoint=azure_endpoint,
-            api_key=azure_api_key,
-            api_version=azure_api_version,
-        )
-    return OpenAI()
-
-client = _create_openai_client()
+from costs import record_chat_completion_cost, add_usage
+from results import get_result_sink
+from llm import chat_completion, get_client
 
+# Results file of the synchronous topic verification.
+RESULTS_PATH = "Outputs/Verification Reports/Synchronous/results.jsonl"
 
 ## topic verification
 system_verify = "You are a helpful and objective fact-checker to verify the process name of gene set."
@@ -41,58 +24,86 @@ Don't generate hypotheis claims over the previous analysis like diseases, mutati
 Please replace the statement like 'these genes', 'this system' with the entire gene set.
 """
 
-def topic_verification(genes, process_name, agentphd):  
+def topic_verification(genes, process_name, agentphd, ID=None, sink=None):
+    """
+    Verify and revise the process name of a gene set, writing its claim records and a "gene_set" record
+    to `sink`. Without a sink the records go to RESULTS_PATH, whose sink is closed before returning.
+    """
+    start = time.perf_counter()
+    own_sink = sink is None
+    sink = sink or get_result_sink(RESULTS_PATH)
+    ID = str(ID if ID is not None else genes)
     pattern = re.compile(r'^[a-zA-Z0-9_-]+$')
-    ## send genes and summary to GPT-4 and generate claims for verifying topic name
-    prompt_topic = topic(genes, process_name) + topic_instruction
-    message = [
-        {"role":"system", "content":system_verify},
-        {"role":"user", "content":prompt_topic}
-    ]
-    claims = client.chat.completions.create(
-        model="gpt-4o",
-        messages=message,
-        temperature=0.0,
+    records = []
+    usage = {}
+    updated = None
+    status, error = "error", None
+    try:
+        ## send genes and summary to GPT-4 and generate claims for verifying topic name
+        prompt_topic = topic(genes, process_name) + topic_instruction
+        message = [
+            {"role":"system", "content":system_verify},
+            {"role":"user", "content":prompt_topic}
+        ]
+        claims = chat_completion(get_client(),
+            model="gpt-4o",
+            messages=message,
+            temperature=0.0,
+            )
+        cost_info = record_chat_completion_cost(claims, "gpt-4o", tag="topic_claims")
+        add_usage(usage, cost_info)
+        print(f"$ Cost topic claims: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
+        claims = json.loads(claims.choices[0].message.content)
+        print("=====Topic Claim=====")
+        print(claims)
+
+        claims = [claim if re.match(pattern, claim) else re.sub(r'[^a-zA-Z0-9,.;?!*()_-]+$', "_", claim) for claim in claims]
+        claim_results = agentphd.verify_claim_results(claims)
+        records = [{"type": "claim", "pipeline": "synchronous", "ID": ID, "stage": "topic",
+                    "index": index, "claim": claim, **result} for index, (claim, result) in enumerate(zip(claims, claim_results))]
+        verification = ""
+        for claim, claim_result in zip(claims, claim_results):
+            claim_result = claim_result["report"]
+            verification += f"Original_claim:{claim}"
+            verification += f"Verified_claim:{claim_result}"
+            print(claim)
+            print(claim_result)
+
+        ## send verificaton report to GPT-4 and modify the original process name
+        message.append(
+            {"role":"assistant", "content":f"There should be only one most significant function name. If the process name is direclty supported in all verifications, the significant function is the name that most similar to the original process name but reflects more specific biological regulation mechanism. Otherwise, it is the first (top-1) function name in verifications."}
         )
-    cost_info = record_chat_completion_cost(claims, "gpt-4o", tag="topic_claims")
-    print(f"$ Cost topic claims: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
-    claims = json.loads(claims.choices[0].message.content)
-    print("=====Topic Claim=====")
-    print(claims)
-    
-    verification = ""
-    for claim in claims:
-        if not re.match(pattern, claim):
-            claim = re.sub(r'[^a-zA-Z0-9,.;?!*()_-]+$', "_", claim)
-        claim_result = agentphd.inference(claim)
-        verification += f"Original_claim:{claim}"
-        verification += f"Verified_claim:{claim_result}"
-        with open("Outputs/Verification Reports/Synchronous/Claims_and_Verification_for_MsigDB.txt","a") as f_claim:
-            f_claim.write(str(claim)+"\n")
-            f_claim.write(str(claim_result)+"\n")
-            f_claim.write("&&\n")
-        print(claim)
-        print(claim_result)
-        
-    ## send verificaton report to GPT-4 and modify the original process name
-    message.append(
-        {"role":"assistant", "content":f"There should be only one most significant function name. If the process name is direclty supported in all verifications, the significant function is the name that most similar to the original process name but reflects more specific biological regulation mechanism. Otherwise, it is the first (top-1) function name in verifications."}
-    )
-    message.append(
-        {"role":"user", "content":f"I have finished the verification for the process name, here is the verification report:{verification}\nPlease replace the process name with the most significant function of gene set.\nPlease start a message with \"Topic:\" and only return the brief revised name."}
-    )
-    updated = client.chat.completions.create(
-        model="gpt-4o",
-        messages=message,
-        temperature=0.0,
+        message.append(
+            {"role":"user", "content":f"I have finished the verification for the process name, here is the verification report:{verification}\nPlease replace the process name with the most significant function of gene set.\nPlease start a message with \"Topic:\" and only return the brief revised name."}
         )
-    cost_info = record_chat_completion_cost(updated, "gpt-4o", tag="topic_update")
-    print(f"$ Cost topic update: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
-
-    # messages.append(updated_topic.choices[0]["message"])
-    updated = updated.choices[0].message.content
+        updated = chat_completion(get_client(),
+            model="gpt-4o",
+            messages=message,
+            temperature=0.0,
+            )
+        cost_info = record_chat_completion_cost(updated, "gpt-4o", tag="topic_update")
+        add_usage(usage, cost_info)
+        print(f"$ Cost topic update: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
 
+        # messages.append(updated_topic.choices[0]["message"])
+        updated = updated.choices[0].message.content
+        status = "ok"
+    except Exception as E:
+        error = str(E)
+        raise
+    finally:
+        # the claim verifications count towards the usage of the gene set as well
+        for record in records:
+            for key, value in record.get("usage", {}).items():
+                usage[key] = usage.get(key, 0) + value
+        records.append({"type": "gene_set", "pipeline": "synchronous", "ID": ID, "genes": genes, "status": status, "error": error,
+                        "process": updated, "seconds": time.perf_counter() - start, "usage": usage})
+        sink.write_many(records)
+        if own_sink:
+            sink.close()
+        else:
+            sink.flush()
     print("=====Updated Topic=====")
     print(updated)
-    
+
     return updated
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import atexit
+import itertools
+import threading
+import contextlib
+import contextvars
+
+# Configuration through environment variables:
+#   GENEAGENT_TRACE   Chrome trace JSON file written at exit (off by default); open it in
+#                     chrome://tracing or https://ui.perfetto.dev
+TRACE_PATH = os.getenv("GENEAGENT_TRACE") or None
+
+# Span categories, from the outside in: gene_set > stage > claim > round > llm / tool > http / wait.
+_current = contextvars.ContextVar("current_span", default=None)
+_spans = []
+_lock = threading.Lock()
+_ids = itertools.count(1)
+_origin = time.perf_counter()
+
+
+class Span:
+    __slots__ = ("name", "category", "attributes", "id", "parent", "thread", "start", "end")
+
+    def __init__(self, name: str, category: str, attributes: dict):
+        parent = _current.get()
+        self.name = name
+        self.category = category
+        self.attributes = attributes
+        self.id = next(_ids)
+        self.parent = parent.id if parent is not None else None
+        self.thread = threading.get_native_id()
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class _NoSpan:
+    """Stand-in returned while tracing is off, so call sites do not need to check."""
+
+    def set(self, **attributes):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+def enabled() -> bool:
+    return TRACE_PATH is not None
+
+
+def enable(path: str):
+    """Turn tracing on for this process and write the trace to `path` at exit."""
+    global TRACE_PATH
+    TRACE_PATH = path
+
+
+@contextlib.contextmanager
+def span(name: str, category: str, **attributes):
+    """Time the block as a child of the current span; the span is also current inside threads started with asyncio.to_thread."""
+    if TRACE_PATH is None:
+        yield NO_SPAN
+        return
+    current = Span(name, category, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as E:
+        current.attributes["error"] = repr(E)
+        raise
+    finally:
+        _current.reset(token)
+        current.end = time.perf_counter()
+        with _lock:
+            _spans.append(current)
+
+
+def annotate(**attributes):
+    """Add attributes, e.g. a cache hit, to the current span."""
+    current = _current.get()
+    if current is not None:
+        current.set(**attributes)
+
+
+def chrome_trace() -> dict:
+    """Finished spans as Chrome trace complete events, with the span and parent IDs in args."""
+    with _lock:
+        spans = list(_spans)
+    pid = os.getpid()
+    events = [
+        {
+            "name": current.name,
+            "cat": current.category,
+            "ph": "X",
+            "ts": (current.start - _origin) * 1e6,
+            "dur": (current.end - current.start) * 1e6,
+            "pid": pid,
+            "tid": current.thread,
+            "args": {"span": current.id, "parent": current.parent, **current.attributes},
+        }
+        for current in spans
+    ]
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def export_chrome_trace(path: str = None) -> str:
+    path = path or TRACE_PATH
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(chrome_trace(), f, default=str)
+    return path
+
+
+def summary(categories=("stage", "tool", "http", "wait"), top: int = 10) -> dict:
+    """Slowest span names per category by total time, with count, mean, p95 and max seconds."""
+    with _lock:
+        spans = [current for current in _spans if current.category in categories]
+    durations = {}
+    for current in spans:
+        durations.setdefault((current.category, current.name), []).append(current.end - current.start)
+    report = {category: [] for category in categories}
+    for (category, name), values in durations.items():
+        values.sort()
+        report[category].append({
+            "name": name,
+            "count": len(values),
+            "total_s": round(sum(values), 3),
+            "mean_s": round(sum(values) / len(values), 3),
+            "p95_s": round(values[min(len(values) - 1, int(0.95 * len(values)))], 3),
+            "max_s": round(values[-1], 3),
+        })
+    return {category: sorted(rows, key=lambda row: -row["total_s"])[:top] for category, rows in report.items()}
+
+
+@atexit.register
+def _export_at_exit():
+    if TRACE_PATH is not None and _spans:
+        export_chrome_trace()
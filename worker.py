@@ -1,69 +1,113 @@
-from openai import OpenAI
-try:
-    from openai import AzureOpenAI
-except Exception:
-    AzureOpenAI = None
 import os
 from dotenv import load_dotenv
 load_dotenv()
 
-from costs import record_chat_completion_cost
-
-def _create_openai_client():
-    azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT") or os.getenv("AZURE_API_BASE")
-    azure_api_key = os.getenv("AZURE_OPENAI_API_KEY")
-    azure_api_version = os.getenv("AZURE_OPENAI_API_VERSION") or os.getenv("AZURE_API_VERSION")
-    if azure_endpoint and azure_api_key and azure_api_version and AzureOpenAI is not None:
-        return AzureOpenAI(
-            azure_endpoint=azure_endpoint,
-            api_key=azure_api_key,
-            api_version=azure_api_version,
-        )
-    return OpenAI()
-
-client = _create_openai_client()
+from costs import record_chat_completion_cost, add_usage
+from llm import chat_completion, get_client, get_encoding
 
 import time
 import json
 import re
+import asyncio
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 
 import logging
 from logging.handlers import RotatingFileHandler
 from datetime import datetime
 
-import tiktoken
 MAX_TOKENS = 127900
-encoding = tiktoken.encoding_for_model("gpt-4")
 
 from apis.get_complex_for_gene_set import get_complex_for_gene_set, get_complex_for_gene_set_doc 
 from apis.get_disease_for_single_gene import get_disease_for_single_gene, get_disease_for_single_gene_doc
 from apis.get_domain_for_single_gene import get_domain_for_single_gene, get_domain_for_single_gene_doc
 from apis.get_enrichment_for_gene_set import get_enrichment_for_gene_set, get_enrichment_for_gene_set_doc
+from apis.get_local_enrichment_for_gene_set import get_local_enrichment_for_gene_set, get_local_enrichment_for_gene_set_doc
 from apis.get_pathway_for_gene_set import get_pathway_for_gene_set, get_pathway_for_gene_set_doc  
 from apis.get_interactions_for_gene_set import get_interactions_for_gene_set, get_interactions_for_gene_set_doc 
 from apis.get_gene_summary_for_single_gene import get_gene_summary_for_single_gene, get_gene_summary_for_single_gene_doc
+from apis.get_gene_summary_for_gene_set import get_gene_summary_for_gene_set, get_gene_summary_for_gene_set_doc
  
 from apis.get_pubmed_articles import get_pubmed_articles, get_pubmed_articles_doc
+from apis.cache import cached_tool
+from apis.projections import project, record_saving
+from context_window import ContextWindow, CONTEXT_BUDGET
+from claim_memo import get_claim_memo
+from budgets import exhausted_budget
+import tracing
 
 func2info = {
     "get_complex_for_gene_set": [get_complex_for_gene_set, get_complex_for_gene_set_doc],
 	"get_disease_for_single_gene": [get_disease_for_single_gene, get_disease_for_single_gene_doc],
 	"get_domain_for_single_gene": [get_domain_for_single_gene, get_domain_for_single_gene_doc],
 	"get_enrichment_for_gene_set": [get_enrichment_for_gene_set, get_enrichment_for_gene_set_doc],
+	"get_local_enrichment_for_gene_set": [get_local_enrichment_for_gene_set, get_local_enrichment_for_gene_set_doc],
 	"get_pathway_for_gene_set": [get_pathway_for_gene_set, get_pathway_for_gene_set_doc],
 	"get_interactions_for_gene_set": [get_interactions_for_gene_set, get_interactions_for_gene_set_doc],
 	"get_gene_summary_for_single_gene": [get_gene_summary_for_single_gene, get_gene_summary_for_single_gene_doc],
+	"get_gene_summary_for_gene_set": [get_gene_summary_for_gene_set, get_gene_summary_for_gene_set_doc],
 	"get_pubmed_articles": [get_pubmed_articles, get_pubmed_articles_doc]
 }
+# every tool call goes through the shared on-disk response cache
+func2info = {name: [cached_tool(name, function), doc] for name, (function, doc) in func2info.items()}
 
 pattern = re.compile(r'^[a-zA-Z0-9_-]+$')
 
+# Maximum number of claims verified at the same time by AgentPhD.verify_claims.
+CLAIM_CONCURRENCY = int(os.getenv("GENEAGENT_CLAIM_CONCURRENCY", "4"))
+# Maximum number of tool calls run at the same time, shared by all claims.
+TOOL_CONCURRENCY = int(os.getenv("GENEAGENT_TOOL_CONCURRENCY", "8"))
+tool_executor = ThreadPoolExecutor(max_workers=TOOL_CONCURRENCY, thread_name_prefix="tool")
+
 class AgentPhD:
 	def __init__(self, function_names):
 		self.name2function = {function_name: func2info[function_name][0] for function_name in function_names}
 		self.function_docs = [func2info[function_name][1] for function_name in function_names]
+		self.tools = [{"type": "function", "function": doc} for doc in self.function_docs]
+
+	# the encoding is loaded on the first claim, so that building the agent at import time stays cheap
+	@functools.cached_property
+	def encoding(self):
+		return get_encoding("gpt-4")
 
-	def inference(self, claim):
+	@functools.cached_property
+	def context_budget(self):
+		# the tool schemas and the completion share the model context with the messages
+		return min(CONTEXT_BUDGET, MAX_TOKENS - len(self.encoding.encode(json.dumps(self.tools))) - 4096)
+
+	def call_tool(self, tool_call):
+		"""Run one tool call of the assistant and return the tool message answering it."""
+		function_name = tool_call.function.name
+		function_params = tool_call.function.arguments
+		with tracing.span(function_name, "tool", tool=function_name):
+			return {"role": "tool", "tool_call_id": tool_call.id, "content": self._tool_content(function_name, function_params)}
+
+	def _tool_content(self, function_name, function_params):
+		try:
+			function_params = json.loads(function_params)
+			function_to_call = self.name2function[function_name]
+			raw_response = function_to_call(**function_params)
+			function_response = project(function_name, function_params, raw_response)
+			if function_response is not raw_response:
+				raw_tokens = len(self.encoding.encode(str(raw_response)))
+				projected_tokens = len(self.encoding.encode(function_response))
+				record_saving(function_name, raw_tokens, projected_tokens)
+				print(f"=====The projection of {function_name} saved {raw_tokens - projected_tokens} tokens=====")
+			content = f"Function has been called with params {function_params}, and returns {function_response}."
+		except Exception as E:
+			tracing.annotate(error=str(E))
+			content = f"Function has been called with params {function_params}, but returned error: {E}. Please try again with the correct parameter."
+		return content
+
+	def inference(self, claim, usage=None, outcome=None):
+		"""
+		Run the verification conversation of a claim and return its report.
+		Tokens and cost are added to `usage`; when a budget runs out, the agent is asked for a report
+		without further tool calls and the name of the budget is stored in outcome["budget"].
+		"""
+		usage = {} if usage is None else usage
+		outcome = {} if outcome is None else outcome
     
 		system = f"""
   		You are a helpful fact-checker. 
@@ -73,94 +117,167 @@ class AgentPhD:
 		content = f"""
   		Here is the claim needed to be verified:\n{claim} 
 		Try to use multiple tools to verify a claim and the verification process should be factual and objective.
+		Call all the tools you need at once when they do not depend on each other.
     	Put your decision at the beginning of the evidences.
     	Don't use any format symbols such as '*', '-' or other tokens.
     	"""
-		token_verification = encoding.encode(content + system)
+		token_verification = self.encoding.encode(content + system)
 		print(f"=====The prompt tokens input to the verification step is {len(token_verification)}=====")
-		message_verification = [
+		message_verification = ContextWindow([
 			{"role": "system", "content": system},
 			{"role": "user", "content": content} 
-		]
+		], self.encoding, budget=self.context_budget)
 
 		loop = 0
 		while loop < 20:
 			loop += 1
-			# logger.info(f"Input@{loop}\n" +  json.dumps(messages, indent=4))
-			time.sleep(1)
-			completion = client.chat.completions.create(
-				model="gpt-4o",
-				messages=message_verification,
-				functions=self.function_docs,
-				temperature=0,
-			)
-
-			message = completion.choices[0].message
-			cost_info = record_chat_completion_cost(completion, "gpt-4o", tag="verification_loop")
-			print(f"$ Cost verification: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
-			# token_message_output = encoding.encode(str(message))
-			# print(f"=====The message tokens output from the verification step is {len(token_message_output)}=====")
-			# logger.info(f"Output@{loop}\n" +  json.dumps(message, indent=4))
-
-			if getattr(message, "function_call", None):
-				try:
-					function_name = message.function_call.name
-					function_params = json.loads(message.function_call.arguments)
-					function_to_call = self.name2function[function_name]
-					function_response = function_to_call(**function_params)
-					function_response = f"Function has been called with params {function_params}, and returns {function_response}."
-
+			with tracing.span("round", "round", round=loop) as round_span:
+				# logger.info(f"Input@{loop}\n" +  json.dumps(messages, indent=4))
+				exhausted = outcome.get("budget") or exhausted_budget(usage)
+				if exhausted and "budget" not in outcome:
+					outcome["budget"] = exhausted
+					print(f"=====The {exhausted} budget is exhausted, asking for the report without more tool calls=====")
 					message_verification.append(
 						{
-							"role": "function",
-							"name": function_name,
-							"content": function_response
-						},
+							"role": "user",
+							"content": "The verification budget is exhausted. Do not call any more tools; start a message with \"Report:\" and return your findings from the evidence obtained so far.",
+						}
 					)
-					# token_message_verification = encoding.encode(str(message_verification))
-					# print(f"=====The message tokens input to verification step is {len(token_message_verification)}=====")
+				prompt_tokens = message_verification.fit()
+				print(f"=====The message tokens input to verification round {loop} is {prompt_tokens}=====")
+				completion = chat_completion(get_client(),
+					model="gpt-4o",
+					messages=message_verification.messages,
+					tools=self.tools,
+					parallel_tool_calls=True,
+					temperature=0,
+					**({"tool_choice": "none"} if exhausted else {}),
+				)
+
+				message = completion.choices[0].message
+				cost_info = record_chat_completion_cost(completion, "gpt-4o", tag="verification_loop")
+				add_usage(usage, cost_info)
+				round_span.set(prompt_tokens=cost_info["prompt_tokens"], completion_tokens=cost_info["completion_tokens"], tool_calls=len(getattr(message, "tool_calls", None) or []))
+				print(f"$ Cost verification: ${cost_info['total_cost']:.4f} (in={cost_info['prompt_tokens']}, out={cost_info['completion_tokens']})")
+				# token_message_output = encoding.encode(str(message))
+				# print(f"=====The message tokens output from the verification step is {len(token_message_output)}=====")
+				# logger.info(f"Output@{loop}\n" +  json.dumps(message, indent=4))
 
-				except Exception as E:
+				if getattr(message, "tool_calls", None):
+					# run every tool call of this turn concurrently and return the results in one batch
 					message_verification.append(
 						{
-							"role": "function",
-							"name": function_name,
-							"content": f"Function has been called with params {function_params}, but returned error: {E}. Please try again with the correct parameter.",
+							"role": "assistant",
+							"content": message.content,
+							"tool_calls": [
+								{
+									"id": tool_call.id,
+									"type": "function",
+									"function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments},
+								}
+								for tool_call in message.tool_calls
+							],
 						}
 					)
+					# tool spans run on the pool threads but belong to this round
+					context = contextvars.copy_context()
+					message_verification.extend(tool_executor.map(lambda tool_call: context.copy().run(self.call_tool, tool_call), message.tool_calls))
 					# token_message_verification = encoding.encode(str(message_verification))
 					# print(f"=====The message tokens input to verification step is {len(token_message_verification)}=====")
 			
-			else:
-				try:
-					if message and getattr(message, "content", None) and "Report: " in message.content:
-						report = message.content.split("Report: ")[-1]
-						token_report = encoding.encode(report)
-						print(f"=====The output tokens of verification report in the verification step is {len(token_report)}=====")
-						if re.match(pattern, report):
-							return report
-						else: 
-							return re.sub(r'[^a-zA-Z0-9_-]+$', "_", report)
+				else:
+					try:
+						if message and getattr(message, "content", None) and "Report: " in message.content:
+							report = message.content.split("Report: ")[-1]
+							token_report = self.encoding.encode(report)
+							print(f"=====The output tokens of verification report in the verification step is {len(token_report)}=====")
+							if re.match(pattern, report):
+								return report
+							else: 
+								return re.sub(r'[^a-zA-Z0-9_-]+$', "_", report)
 					
-					else:
+						elif exhausted:
+							# the forced answer is the report, even without the "Report:" prefix
+							return message.content or "Failed."
+
+						else:
+							message_verification.append(
+								{
+									"role": "user",
+									"content": f"please start a message with \"Report:\" and return your findings if you have obtained the verification information.",
+								}
+							)
+							# token_message_verification = encoding.encode(str(message_verification))
+							# print(f"=====The message tokens input to verification step is {len(token_message_verification)}=====")
+      
+					except Exception as E:
 						message_verification.append(
 							{
-								"role": "user",
-								"content": f"please start a message with \"Report:\" and return your findings if you have obtained the verification information.",
+								"role": "assistant",
+								"content": f"Claim has been verified, but returned error: {E}. Please try it again.",
 							}
 						)
 						# token_message_verification = encoding.encode(str(message_verification))
 						# print(f"=====The message tokens input to verification step is {len(token_message_verification)}=====")
-      
-				except Exception as E:
-					message_verification.append(
-						{
-							"role": "assistant",
-							"content": f"Claim has been verified, but returned error: {E}. Please try it again.",
-						}
-					)
-					# token_message_verification = encoding.encode(str(message_verification))
-					# print(f"=====The message tokens input to verification step is {len(token_message_verification)}=====")
-					# print(E)
+						# print(E)
+
+		return "Failed."
+
+	def verify(self, claim):
+		with tracing.span("claim", "claim", claim=claim) as claim_span:
+			result = self._verify(claim)
+			claim_span.set(source=result["provenance"]["source"], budget=result["budget"], **result["usage"])
+			return result
+
+	def _verify(self, claim):
+		"""
+		Verify a claim, reusing the report of an equivalent claim from the claim memo when there is one.
+		Returns {"report", "provenance", "seconds", "usage", "budget"}; the provenance tells where the report
+		comes from and budget names the budget that cut the verification short, if any.
+		"""
+		start = time.perf_counter()
+		usage = {}
+		memo = get_claim_memo()
+		provenance = {"source": "agent", "model": "gpt-4o", "tools": sorted(self.name2function)}
+		# reports are only reused by verifications with the same model and tools
+		scope = json.dumps([provenance["model"], provenance["tools"]])
+		if memo is not None:
+			found = memo.get(claim, scope)
+			if found is not None:
+				report, provenance = found
+				print(f"=====Reusing the {provenance['match']} memo report of the claim: {provenance['memo_claim']}=====")
+				return {"report": report, "provenance": provenance, "seconds": time.perf_counter() - start, "usage": usage, "budget": None}
+		exhausted = exhausted_budget()
+		if exhausted:
+			# nothing left to spend on this claim at all
+			print(f"=====The {exhausted} budget is exhausted, the claim is not verified=====")
+			report = f"Not verified: the {exhausted} budget was exhausted."
+			return {"report": report, "provenance": {"source": "budget"}, "seconds": time.perf_counter() - start, "usage": usage, "budget": exhausted}
+		outcome = {}
+		report = self.inference(claim, usage, outcome)
+		# reports cut short by a budget are not reused by later runs
+		if memo is not None and "budget" not in outcome:
+			memo.put(claim, report, provenance, scope)
+		return {"report": report, "provenance": provenance, "seconds": time.perf_counter() - start, "usage": usage, "budget": outcome.get("budget")}
+
+	async def ainference(self, claim, semaphore=None):
+		if semaphore is None:
+			return await asyncio.to_thread(self.verify, claim)
+		async with semaphore:
+			return await asyncio.to_thread(self.verify, claim)
+
+	async def averify_claims(self, claims, max_concurrency=None):
+		"""
+		Verify independent claims concurrently, at most max_concurrency at a time.
+		Results are returned in the same order as the input claims.
+		"""
+		semaphore = asyncio.Semaphore(max(1, max_concurrency or CLAIM_CONCURRENCY))
+		return await asyncio.gather(*(self.ainference(claim, semaphore) for claim in claims))
+
+	def verify_claim_results(self, claims, max_concurrency=None):
+		"""Results of verify() for every claim, in the order of the claims."""
+		return asyncio.run(self.averify_claims(list(claims), max_concurrency))
+
+	def verify_claims(self, claims, max_concurrency=None):
+		return [result["report"] for result in self.verify_claim_results(claims, max_concurrency)]
 
-		return "Failed."	